@@ -0,0 +1,37 @@
+# Generated by Django 4.2.25 on 2026-10-19 10:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0062_agent_installomator_fields"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HistoryOutput",
+            fields=[
+                (
+                    "sha256",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("data", models.BinaryField()),
+                ("size", models.PositiveIntegerField()),
+                ("last_used", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="agenthistory",
+            name="output",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="history",
+                to="agents.historyoutput",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.25 on 2026-10-19 10:41
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # agent history can be large, build the indexes without locking out writes
+    atomic = False
+
+    dependencies = [
+        ("agents", "0063_history_output"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="agenthistory",
+            index=models.Index(
+                fields=["type", "-time"], name="agents_agen_type_b8f38f_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="agenthistory",
+            index=models.Index(
+                fields=["agent", "-time"], name="agents_agen_agent_i_cf0182_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.25 on 2026-10-19 10:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scripts", "0020_alter_script_shell_alter_scriptsnippet_shell"),
+        ("agents", "0064_agenthistory_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BulkJob",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[
+                            ("task_run", "Task Run"),
+                            ("script_run", "Script Run"),
+                            ("cmd_run", "CMD Run"),
+                        ],
+                        default="cmd_run",
+                        max_length=50,
+                    ),
+                ),
+                ("command", models.TextField(blank=True, default="")),
+                ("username", models.CharField(default="system", max_length=255)),
+                ("created", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("timeout", models.PositiveIntegerField(default=0)),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("dispatched", models.PositiveIntegerField(default=0)),
+                ("acknowledged", models.PositiveIntegerField(default=0)),
+                ("dispatched_at", models.DateTimeField(blank=True, null=True)),
+                ("completed", models.PositiveIntegerField(default=0)),
+                (
+                    "script",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="bulk_jobs",
+                        to="scripts.script",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="agenthistory",
+            name="bulk_job",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="history",
+                to="agents.bulkjob",
+            ),
+        ),
+        migrations.CreateModel(
+            name="BulkJobResult",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("retcode", models.IntegerField(blank=True, null=True)),
+                ("output_hash", models.CharField(max_length=64)),
+                ("sample", models.TextField(blank=True, default="")),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="results",
+                        to="agents.bulkjob",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("job", "retcode", "output_hash")},
+            },
+        ),
+    ]
@@ -1,8 +1,10 @@
 import asyncio
+import datetime as dt
+import gzip
+import hashlib
+import json
 import logging
 import random
-import re
-from collections import Counter
 from contextlib import suppress
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Union, cast
 
@@ -12,11 +14,10 @@ import validators
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
 from django.core.cache import cache
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone as djangotime
 from nats.errors import TimeoutError
 from packaging import version as pyver
-from packaging.version import Version as LooseVersion
 
 from agents.utils import get_agent_url
 from checks.models import CheckResult
@@ -45,6 +46,7 @@ from tacticalrmm.helpers import has_script_actions, has_webhook, setup_nats_opti
 from tacticalrmm.models import PermissionQuerySet
 
 if TYPE_CHECKING:
+    from accounts.models import User
     from alerts.models import Alert, AlertTemplate
     from automation.models import Policy
     from autotasks.models import AutomatedTask
@@ -143,6 +145,15 @@ class Agent(BaseAuditModel):
                 self.block_policy_inheritance != orig.block_policy_inheritance
             )
 
+            if (
+                mon_type_changed
+                or site_changed
+                or policy_changed
+                or block_inherit
+                or self.check_interval != orig.check_interval
+            ):
+                cache.delete(self.check_plan_cache_key)
+
             if mon_type_changed or site_changed or policy_changed or block_inherit:
                 self._processing_set_alert_template = True
                 self.set_alert_template()
@@ -553,13 +564,14 @@ class Agent(BaseAuditModel):
         return tasks
 
     def add_check_results(self, checks: "List[Check]") -> "List[Check]":
-        results = self.checkresults.all()  # type: ignore
+        results = {
+            result.assigned_check_id: result
+            for result in self.checkresults.all()  # type: ignore
+        }
 
         for check in checks:
-            for result in results:
-                if result.assigned_check.id == check.pk:
-                    check.check_result = result
-                    break
+            if check.pk in results:
+                check.check_result = results[check.pk]
 
         return checks
 
@@ -617,15 +629,63 @@ class Agent(BaseAuditModel):
             ),
         }
 
-    def check_run_interval(self) -> int:
+    @property
+    def check_plan_cache_key(self) -> str:
+        # matches the agent_*_checks patterns cleared when policy checks change
+        return f"agent_{self.agent_id}_runner_checks"
+
+    def get_check_plan(self) -> Dict[str, Any]:
+        """
+        Returns the checks the agent should run, serialized for the check runner,
+        and the lowest run interval before jitter. Cached until the agent's checks
+        or policies change.
+        """
+        from checks.serializers import CheckRunnerGetSerializer
+
+        plan = cache.get(self.check_plan_cache_key)
+        if isinstance(plan, dict):
+            return plan
+
+        checks = [
+            check for check in self.agentchecks.all() if not check.overridden_by_policy
+        ] + self.get_checks_from_policies()
+
         interval = self.check_interval
         # determine if any agent checks have a custom interval and set the lowest interval
-        for check in self.get_checks_with_policies():
+        for check in checks:
             if check.run_interval and check.run_interval < interval:
                 # don't allow check runs less than 15s
                 interval = 15 if check.run_interval < 15 else check.run_interval
 
-        return interval + random.randint(
+        serialized = CheckRunnerGetSerializer(
+            checks, context={"agent": self}, many=True
+        ).data
+
+        plan = {
+            "interval": interval,
+            "checks": [
+                {
+                    "id": check.pk,
+                    "run_interval": check.run_interval or self.check_interval,
+                    "data": dict(data),
+                    # script args are parsed per run since custom fields change
+                    "shell": (
+                        check.script.shell
+                        if check.check_type == CheckType.SCRIPT
+                        else None
+                    ),
+                    "script_args": check.script_args,
+                    "env_vars": check.env_vars,
+                }
+                for check, data in zip(checks, serialized)
+            ],
+        }
+        cache.set(self.check_plan_cache_key, plan, 600)
+        return plan
+
+    def check_run_interval(self, plan: Optional[Dict[str, Any]] = None) -> int:
+        plan = plan or self.get_check_plan()
+        return plan["interval"] + random.randint(
             *getattr(settings, "CHECK_INTERVAL_JITTER", (1, 60))
         )
 
@@ -697,23 +757,9 @@ class Agent(BaseAuditModel):
 
     # auto approves updates
     def approve_updates(self) -> None:
-        patch_policy = self.get_patch_policy()
+        from winupdate.utils import approved_severities
 
-        severity_list = []
-        if patch_policy.critical == "approve":
-            severity_list.append("Critical")
-
-        if patch_policy.important == "approve":
-            severity_list.append("Important")
-
-        if patch_policy.moderate == "approve":
-            severity_list.append("Moderate")
-
-        if patch_policy.low == "approve":
-            severity_list.append("Low")
-
-        if patch_policy.other == "approve":
-            severity_list.append("")
+        severity_list = approved_severities(self.get_patch_policy())
 
         self.winupdates.filter(severity__in=severity_list, installed=False).exclude(
             action="approve"
@@ -722,6 +768,7 @@ class Agent(BaseAuditModel):
     # returns agent policy merged with a client or site specific policy
     def get_patch_policy(self) -> "WinUpdatePolicy":
         from winupdate.models import WinUpdatePolicy
+        from winupdate.utils import merge_patch_policy
 
         # check if site has a patch policy and if so use it
         patch_policy = None
@@ -745,35 +792,7 @@ class Agent(BaseAuditModel):
             return agent_policy
 
         # patch policy exists. check if any agent settings are set to override patch policy
-        if agent_policy.critical != "inherit":
-            patch_policy.critical = agent_policy.critical
-
-        if agent_policy.important != "inherit":
-            patch_policy.important = agent_policy.important
-
-        if agent_policy.moderate != "inherit":
-            patch_policy.moderate = agent_policy.moderate
-
-        if agent_policy.low != "inherit":
-            patch_policy.low = agent_policy.low
-
-        if agent_policy.other != "inherit":
-            patch_policy.other = agent_policy.other
-
-        if agent_policy.run_time_frequency != "inherit":
-            patch_policy.run_time_frequency = agent_policy.run_time_frequency
-            patch_policy.run_time_hour = agent_policy.run_time_hour
-            patch_policy.run_time_days = agent_policy.run_time_days
-
-        if agent_policy.reboot_after_install != "inherit":
-            patch_policy.reboot_after_install = agent_policy.reboot_after_install
-
-        if not agent_policy.reprocess_failed_inherit:
-            patch_policy.reprocess_failed = agent_policy.reprocess_failed
-            patch_policy.reprocess_failed_times = agent_policy.reprocess_failed_times
-            patch_policy.email_if_fail = agent_policy.email_if_fail
-
-        return patch_policy
+        return merge_patch_policy(patch_policy, agent_policy)
 
     def get_approved_update_guids(self) -> list[str]:
         return list(
@@ -897,12 +916,15 @@ class Agent(BaseAuditModel):
     async def nats_cmd(
         self, data: Dict[Any, Any], timeout: int = 30, wait: bool = True
     ) -> Any:
+        from tacticalrmm.task_metrics import record_nats_request
+
         opts = setup_nats_options()
         try:
             nc = await nats.connect(**opts)
         except:
             return "natsdown"
 
+        record_nats_request()
         if wait:
             try:
                 msg = await nc.request(
@@ -967,33 +989,14 @@ class Agent(BaseAuditModel):
         return AgentAuditSerializer(agent).data
 
     def delete_superseded_updates(self) -> None:
-        with suppress(Exception):
-            pks = []  # list of pks to delete
-            kbs = list(self.winupdates.values_list("kb", flat=True))
-            d = Counter(kbs)
-            dupes = [k for k, v in d.items() if v > 1]
-
-            for dupe in dupes:
-                titles = self.winupdates.filter(kb=dupe).values_list("title", flat=True)
-                # extract the version from the title and sort from oldest to newest
-                # skip if no version info is available therefore nothing to parse
-                try:
-                    matches = r"(Version|Versão)"
-                    pattern = r"\(" + matches + r"(.*?)\)"
-                    vers = [
-                        re.search(pattern, i, flags=re.IGNORECASE).group(2).strip()
-                        for i in titles
-                    ]
-                    sorted_vers = sorted(vers, key=LooseVersion)
-                except:
-                    continue
-                # append all but the latest version to our list of pks to delete
-                for ver in sorted_vers[:-1]:
-                    q = self.winupdates.filter(kb=dupe).filter(title__contains=ver)
-                    pks.append(q.first().pk)
+        from winupdate.utils import find_superseded_updates
 
-            pks = list(set(pks))
-            self.winupdates.filter(pk__in=pks).delete()
+        with suppress(Exception):
+            pks = find_superseded_updates(
+                self.winupdates.values_list("pk", "kb", "title")  # type: ignore
+            )
+            if pks:
+                self.winupdates.filter(pk__in=pks).delete()  # type: ignore
 
     def should_create_alert(
         self, alert_template: "Optional[AlertTemplate]" = None
@@ -1142,6 +1145,12 @@ class AgentCustomField(models.Model):
 class AgentHistory(models.Model):
     objects = PermissionQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["type", "-time"]),
+            models.Index(fields=["agent", "-time"]),
+        ]
+
     id = models.BigAutoField(primary_key=True)
     agent = models.ForeignKey(
         Agent,
@@ -1174,6 +1183,244 @@ class AgentHistory(models.Model):
     )
     collector_all_output = models.BooleanField(default=False)
     save_to_agent_note = models.BooleanField(default=False)
+    # full results and script_results when they were too large to keep inline
+    output = models.ForeignKey(
+        "agents.HistoryOutput",
+        null=True,
+        blank=True,
+        related_name="history",
+        on_delete=models.SET_NULL,
+    )
+    bulk_job = models.ForeignKey(
+        "agents.BulkJob",
+        null=True,
+        blank=True,
+        related_name="history",
+        on_delete=models.SET_NULL,
+    )
 
     def __str__(self) -> str:
         return f"{self.agent.hostname} - {self.type}"
+
+    def save(self, *args, **kwargs):
+        if self.offload_output():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "output"}
+
+        super().save(*args, **kwargs)
+
+    def offload_output(self) -> bool:
+        """
+        Moves results and script_results to a compressed HistoryOutput when they
+        are larger than AGENT_HISTORY_INLINE_MAX, keeping truncated copies inline.
+        Returns whether the output was offloaded. Also needs to be called before
+        bulk_create, which doesn't call save().
+        """
+        inline_max = getattr(settings, "AGENT_HISTORY_INLINE_MAX", 0)
+        if not inline_max:
+            return False
+
+        full = {"results": self.results, "script_results": self.script_results}
+        content = json.dumps(full).encode()
+        if len(content) <= inline_max:
+            return False
+
+        self.output = HistoryOutput.store(content)
+        if isinstance(self.results, str):
+            self.results = self.results[:inline_max]
+
+        if isinstance(self.script_results, dict):
+            self.script_results = {
+                key: value[:inline_max] if isinstance(value, str) else value
+                for key, value in self.script_results.items()
+            }
+
+        return True
+
+    def get_full_output(self) -> Dict[str, Any]:
+        # the untruncated results and script_results
+        if self.output_id:
+            return json.loads(HistoryOutput.read(self.output_id))
+
+        return {"results": self.results, "script_results": self.script_results}
+
+
+class HistoryOutput(models.Model):
+    """
+    Gzipped agent history output, keyed by the sha256 of the uncompressed
+    content so identical outputs of e.g. a bulk script run are stored once.
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()
+    # outputs no history references are pruned once they haven't been used for a while
+    last_used = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.sha256} - {self.size}"
+
+    @classmethod
+    def store(cls, content: bytes) -> "HistoryOutput":
+        sha256 = hashlib.sha256(content).hexdigest()
+        if not cls.objects.filter(pk=sha256).update(last_used=djangotime.now()):
+            cls.objects.bulk_create(
+                [cls(sha256=sha256, data=gzip.compress(content), size=len(content))],
+                ignore_conflicts=True,
+            )
+
+        return cls(sha256=sha256, size=len(content))
+
+    @classmethod
+    def read(cls, sha256: str) -> bytes:
+        return gzip.decompress(
+            cls.objects.values_list("data", flat=True).get(pk=sha256)
+        )
+
+
+class BulkJobQuerySet(models.QuerySet):
+    def filter_by_user(self, user: "User") -> "BulkJobQuerySet":
+        # results can include output of agents outside the user's role, so only
+        # superusers see the jobs of others
+        role = user.get_and_set_role_cache()
+        if user.is_superuser or (role and getattr(role, "is_superuser")):
+            return self
+
+        return self.filter(username=user.username[:50])
+
+
+class BulkJob(models.Model):
+    """
+    A command or script run on many agents from the bulk actions, tracking the
+    fan-out and the results as they are reported back to AgentHistoryResult.
+    """
+
+    objects = BulkJobQuerySet.as_manager()
+
+    id = models.BigAutoField(primary_key=True)
+    type: "AgentHistoryType" = models.CharField(
+        max_length=50,
+        choices=AgentHistoryType.choices,
+        default=AgentHistoryType.CMD_RUN,
+    )
+    command = models.TextField(blank=True, default="")
+    script = models.ForeignKey(
+        "scripts.Script",
+        null=True,
+        blank=True,
+        related_name="bulk_jobs",
+        on_delete=models.SET_NULL,
+    )
+    username = models.CharField(max_length=255, default="system")
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    timeout = models.PositiveIntegerField(default=0)
+    # agents targeted by the job
+    total = models.PositiveIntegerField(default=0)
+    # history created and sent to nats
+    dispatched = models.PositiveIntegerField(default=0)
+    # accepted by the nats server, agents don't acknowledge fire and forget commands
+    acknowledged = models.PositiveIntegerField(default=0)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    completed = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.type} - {self.command} - {self.total}"
+
+    @property
+    def deadline(self) -> Optional[dt.datetime]:
+        # agents that haven't reported by now are counted as timed out
+        if not self.dispatched_at:
+            return None
+
+        return self.dispatched_at + djangotime.timedelta(
+            seconds=self.timeout + getattr(settings, "BULK_JOB_GRACE_SECONDS", 60)
+        )
+
+    @property
+    def timed_out(self) -> int:
+        if not self.deadline or djangotime.now() < self.deadline:
+            return 0
+
+        return max(self.acknowledged - self.completed, 0)
+
+    @property
+    def finished(self) -> bool:
+        if not self.dispatched_at:
+            return False
+
+        return self.completed >= self.acknowledged or self.timed_out > 0
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        The counts of the job and its results grouped by retcode and output, the
+        largest groups first.
+        """
+        max_groups = getattr(settings, "BULK_JOB_SUMMARY_GROUPS", 100)
+        groups = list(
+            self.results.values("retcode", "output_hash")
+            .annotate(count=models.Sum("count"), sample=models.Min("sample"))
+            .order_by("-count", "retcode")[:max_groups]
+        )
+        return {
+            "id": self.pk,
+            "type": self.type,
+            "command": self.command,
+            "username": self.username,
+            "created": self.created,
+            "total": self.total,
+            "dispatched": self.dispatched,
+            "acknowledged": self.acknowledged,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "pending": max(self.acknowledged - self.completed - self.timed_out, 0),
+            "finished": self.finished,
+            "results": groups,
+        }
+
+    @staticmethod
+    def record_result(job_id: int, *, retcode: Optional[int], output: str) -> None:
+        """
+        Counts a result reported by an agent in its group. Must only be called once
+        per agent history, the counters aren't idempotent.
+        """
+        # trailing newlines differ between shells, they shouldn't split groups
+        output = (output or "").strip()
+        output_hash = hashlib.sha256(output.encode()).hexdigest()
+        lookup = {"job_id": job_id, "retcode": retcode, "output_hash": output_hash}
+
+        if not BulkJobResult.objects.filter(**lookup).update(
+            count=models.F("count") + 1
+        ):
+            preview = getattr(settings, "AGENT_HISTORY_PREVIEW_CHARS", 2000)
+            try:
+                with transaction.atomic():
+                    BulkJobResult.objects.create(
+                        **lookup, count=1, sample=output[:preview]
+                    )
+            except IntegrityError:
+                # another agent with the same result created the group first
+                BulkJobResult.objects.filter(**lookup).update(
+                    count=models.F("count") + 1
+                )
+
+        BulkJob.objects.filter(pk=job_id).update(completed=models.F("completed") + 1)
+
+
+class BulkJobResult(models.Model):
+    # the number of agents of a bulk job that reported the same retcode and output
+    job = models.ForeignKey(
+        BulkJob,
+        related_name="results",
+        on_delete=models.CASCADE,
+    )
+    retcode = models.IntegerField(null=True, blank=True)
+    output_hash = models.CharField(max_length=64)
+    sample = models.TextField(blank=True, default="")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (("job", "retcode", "output_hash"),)
+
+    def __str__(self) -> str:
+        return f"{self.job_id} - {self.retcode} - {self.count}"
@@ -1,9 +1,10 @@
+from django.conf import settings
 from rest_framework import serializers
 
 from tacticalrmm.constants import AGENT_STATUS_ONLINE, ALL_TIMEZONES
 from winupdate.serializers import WinUpdatePolicySerializer
 
-from .models import Agent, AgentCustomField, AgentHistory, Note
+from .models import Agent, AgentCustomField, AgentHistory, BulkJob, Note
 
 
 class AgentCustomFieldSerializer(serializers.ModelSerializer):
@@ -190,7 +191,45 @@ class AgentHistorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = AgentHistory
-        fields = "__all__"
+        exclude = ("output", "bulk_job")
+
+
+class HistoryPreviewMixin:
+    # list endpoints only return the start of each output, the full output is
+    # returned by AgentHistoryOutput
+    def to_representation(self, instance):
+        ret = super().to_representation(instance)  # type: ignore
+        chars = getattr(settings, "AGENT_HISTORY_PREVIEW_CHARS", 2000)
+        truncated = instance.output_id is not None
+
+        if isinstance(ret.get("results"), str) and len(ret["results"]) > chars:
+            ret["results"] = ret["results"][:chars]
+            truncated = True
+
+        if isinstance(ret.get("script_results"), dict):
+            script_results = dict(ret["script_results"])
+            for key in ("stdout", "stderr"):
+                value = script_results.get(key)
+                if isinstance(value, str) and len(value) > chars:
+                    script_results[key] = value[:chars]
+                    truncated = True
+            ret["script_results"] = script_results
+
+        ret["truncated"] = truncated
+        return ret
+
+
+class AgentHistoryPreviewSerializer(HistoryPreviewMixin, AgentHistorySerializer):
+    pass
+
+
+class BulkJobSerializer(serializers.ModelSerializer):
+    timed_out = serializers.ReadOnlyField()
+    finished = serializers.ReadOnlyField()
+
+    class Meta:
+        model = BulkJob
+        exclude = ("dispatched_at",)
 
 
 class AgentAuditSerializer(serializers.ModelSerializer):
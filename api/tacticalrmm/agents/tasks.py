@@ -245,11 +245,23 @@ def clear_faults_task(older_than_days: int) -> None:
 
 @app.task
 def prune_agent_history(older_than_days: int) -> str:
-    from .models import AgentHistory
-
-    AgentHistory.objects.filter(
-        time__lt=djangotime.now() - djangotime.timedelta(days=older_than_days)
-    ).delete()
+    from django.db.models import Q
+
+    from software.models import SoftwareChange
+    from tacticalrmm.pruning import prune_older_than
+
+    from .models import AgentHistory, BulkJob, HistoryOutput
+
+    prune_older_than(AgentHistory, field="time", older_than_days=older_than_days)
+    prune_older_than(SoftwareChange, field="time", older_than_days=older_than_days)
+    prune_older_than(BulkJob, field="created", older_than_days=older_than_days)
+    # outputs are shared between history entries, only unreferenced ones can go
+    prune_older_than(
+        HistoryOutput,
+        field="last_used",
+        older_than_days=1,
+        filters=Q(history__isnull=True),
+    )
 
     return "ok"
 
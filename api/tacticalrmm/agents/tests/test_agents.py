@@ -6,12 +6,13 @@ from unittest.mock import PropertyMock, patch
 from zoneinfo import ZoneInfo
 
 from django.conf import settings
+from django.test import override_settings
 from django.utils import timezone as djangotime
 from model_bakery import baker
 
-from agents.models import Agent, AgentCustomField, AgentHistory, Note
+from agents.models import Agent, AgentCustomField, AgentHistory, BulkJob, Note
 from agents.serializers import (
-    AgentHistorySerializer,
+    AgentHistoryPreviewSerializer,
     AgentHostnameSerializer,
     AgentNoteSerializer,
     AgentSerializer,
@@ -19,6 +20,7 @@ from agents.serializers import (
 from tacticalrmm.constants import (
     AGENT_STATUS_OFFLINE,
     AGENT_STATUS_ONLINE,
+    AgentHistoryType,
     AgentMonType,
     CustomFieldModel,
     CustomFieldType,
@@ -928,10 +930,216 @@ class TestAgentViews(TacticalTestCase):
         # test pulling data
         r = self.client.get(url, format="json")
         ctx = {"default_tz": ZoneInfo("America/Los_Angeles")}
-        data = AgentHistorySerializer(history, many=True, context=ctx).data
+        data = AgentHistoryPreviewSerializer(history, many=True, context=ctx).data
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.data, data)  # type:ignore
 
+    @override_settings(AGENT_HISTORY_INLINE_MAX=100, AGENT_HISTORY_PREVIEW_CHARS=10)
+    def test_history_output_is_offloaded(self):
+        from agents.models import HistoryOutput
+
+        agent = baker.make_recipe("agents.agent")
+        stdout = "x" * 500
+        script_results = {"stdout": stdout, "stderr": "", "retcode": 0}
+
+        # identical outputs are stored once
+        hists = [
+            AgentHistory.objects.create(agent=agent, script_results=script_results)
+            for _ in range(2)
+        ]
+        self.assertEqual(HistoryOutput.objects.count(), 1)
+        hist = AgentHistory.objects.get(pk=hists[0].pk)
+        self.assertEqual(len(hist.script_results["stdout"]), 100)
+        self.assertEqual(hist.get_full_output()["script_results"], script_results)
+
+        # small outputs stay inline
+        small = AgentHistory.objects.create(agent=agent, results="ok")
+        self.assertIsNone(small.output_id)
+
+        # the list only returns previews
+        r = self.client.get(f"{base_url}/{agent.agent_id}/history/", format="json")
+        self.assertEqual(r.status_code, 200)
+        previews = {i["id"]: i for i in r.data}
+        self.assertEqual(previews[hist.pk]["script_results"]["stdout"], "x" * 10)
+        self.assertTrue(previews[hist.pk]["truncated"])
+        self.assertFalse(previews[small.pk]["truncated"])
+
+        url = f"{base_url}/history/{hist.pk}/output/"
+        r = self.client.get(url, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["script_results"]["stdout"], stdout)
+
+        self.check_not_authenticated("get", url)
+
+    def test_script_run_history_pages(self):
+        agent1 = baker.make_recipe("agents.agent")
+        agent2 = baker.make_recipe("agents.agent")
+        script1 = baker.make("scripts.Script", name="script1")
+        script2 = baker.make("scripts.Script", name="script2")
+        for i in range(5):
+            baker.make(
+                "agents.AgentHistory",
+                agent=agent1,
+                type=AgentHistoryType.SCRIPT_RUN,
+                script=script1,
+                script_results={"stdout": "out", "retcode": i % 2},
+            )
+        baker.make(
+            "agents.AgentHistory",
+            agent=agent2,
+            type=AgentHistoryType.SCRIPT_RUN,
+            script=script2,
+        )
+        baker.make("agents.AgentHistory", agent=agent1, type=AgentHistoryType.CMD_RUN)
+
+        url = f"{base_url}/scripthistory/"
+        r = self.client.get(url, {"page_size": 4}, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.data["history"]), 4)
+        self.assertNotIn("script_results", r.data["history"][0])
+        self.assertEqual(
+            r.data["summary"],
+            [
+                {
+                    "script": script1.pk,
+                    "script_name": "script1",
+                    "total": 5,
+                    "passed": 3,
+                    "failed": 2,
+                    "pending": 0,
+                },
+                {
+                    "script": script2.pk,
+                    "script_name": "script2",
+                    "total": 1,
+                    "passed": 0,
+                    "failed": 0,
+                    "pending": 1,
+                },
+            ],
+        )
+
+        r2 = self.client.get(
+            url, {"page_size": 4, "cursor": r.data["next_cursor"]}, format="json"
+        )
+        self.assertEqual(len(r2.data["history"]), 2)
+        self.assertIsNone(r2.data["next_cursor"])
+        self.assertNotIn("summary", r2.data)
+        ids = [i["id"] for i in r.data["history"] + r2.data["history"]]
+        self.assertEqual(len(set(ids)), 6)
+
+        r = self.client.get(
+            url, {"page_size": 10, "agent_id": agent2.agent_id}, format="json"
+        )
+        self.assertEqual([i["agent_id"] for i in r.data["history"]], [agent2.agent_id])
+        self.assertIsNone(r.data["history"][0]["retcode"])
+
+        r = self.client.get(url, {"cursor": "invalid"}, format="json")
+        self.assertEqual(r.status_code, 400)
+
+        # without paging the full list is returned as before
+        r = self.client.get(url, format="json")
+        self.assertEqual(len(r.data), 6)
+
+    @override_settings(AGENT_HISTORY_INLINE_MAX=0)
+    def test_history_output_offload_disabled(self):
+        agent = baker.make_recipe("agents.agent")
+        hist = AgentHistory.objects.create(agent=agent, results="x" * 500)
+        self.assertIsNone(hist.output_id)
+        self.assertEqual(AgentHistory.objects.get(pk=hist.pk).results, "x" * 500)
+
+    @patch("agents.views.bulk_command_task.delay")
+    def test_bulk_job_results(self, mock_task):
+        agents = baker.make_recipe("agents.online_agent", _quantity=4)
+        data = {
+            "target": "agents",
+            "agents": [agent.agent_id for agent in agents],
+            "monType": "all",
+            "osType": "all",
+            "mode": "command",
+            "shell": "cmd",
+            "custom_shell": None,
+            "cmd": "whoami",
+            "timeout": 30,
+            "run_as_user": False,
+        }
+        r = self.client.post(f"{base_url}/actions/bulk/", data, format="json")
+        self.assertEqual(r.status_code, 200)
+
+        job = BulkJob.objects.get()
+        self.assertEqual(job.total, 4)
+        self.assertEqual(mock_task.call_args.kwargs["bulk_job_pk"], job.pk)
+
+        history = AgentHistory.objects.bulk_create(
+            [
+                AgentHistory(agent=agent, command="whoami", bulk_job=job)
+                for agent in agents
+            ]
+        )
+        job.dispatched = job.acknowledged = 4
+        job.dispatched_at = djangotime.now()
+        job.save()
+
+        outputs = ["nt authority\\system\r\n"] * 3 + ["access denied"]
+        for agent, hist, output in zip(agents, history, outputs):
+            url = f"/api/v3/{hist.pk}/{agent.agent_id}/histresult/"
+            r = self.client.patch(url, {"results": output}, format="json")
+            self.assertEqual(r.status_code, 200)
+
+        # results reported again aren't counted twice
+        url = f"/api/v3/{history[0].pk}/{agents[0].agent_id}/histresult/"
+        self.client.patch(url, {"results": "again"}, format="json")
+
+        r = self.client.get(f"{base_url}/bulkjobs/{job.pk}/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data["completed"], 4)
+        self.assertEqual(r.data["pending"], 0)
+        self.assertTrue(r.data["finished"])
+        self.assertEqual(
+            [(g["count"], g["sample"]) for g in r.data["results"]],
+            [(3, "nt authority\\system"), (1, "access denied")],
+        )
+
+        r = self.client.get(f"{base_url}/bulkjobs/")
+        self.assertEqual([j["id"] for j in r.data], [job.pk])
+
+        self.check_not_authenticated("get", f"{base_url}/bulkjobs/{job.pk}/")
+
+    def test_bulk_job_timed_out(self):
+        job = baker.make(
+            "agents.BulkJob",
+            type=AgentHistoryType.SCRIPT_RUN,
+            timeout=30,
+            total=5,
+            dispatched=5,
+            acknowledged=5,
+            dispatched_at=djangotime.now(),
+        )
+        BulkJob.record_result(job.pk, retcode=0, output="done")
+        BulkJob.record_result(job.pk, retcode=0, output="done\n")
+        BulkJob.record_result(job.pk, retcode=1, output="done")
+
+        job.refresh_from_db()
+        summary = job.summary()
+        self.assertEqual(summary["completed"], 3)
+        self.assertEqual(summary["pending"], 2)
+        self.assertFalse(summary["finished"])
+        self.assertEqual(
+            [(g["retcode"], g["count"]) for g in summary["results"]], [(0, 2), (1, 1)]
+        )
+
+        job.dispatched_at = djangotime.now() - djangotime.timedelta(minutes=5)
+        summary = job.summary()
+        self.assertEqual(summary["timed_out"], 2)
+        self.assertEqual(summary["pending"], 0)
+        self.assertTrue(summary["finished"])
+
+        # other users only see their own jobs
+        user = self.create_user_with_roles(["can_run_bulk"])
+        self.client.force_authenticate(user=user)  # type: ignore
+        r = self.client.get(f"{base_url}/bulkjobs/{job.pk}/")
+        self.assertEqual(r.status_code, 404)
+
 
 class TestAgentViewsNew(TacticalTestCase):
     def setUp(self):
@@ -1413,3 +1621,26 @@ class TestAgentTasks(TacticalTestCase):
         prune_agent_history(30)
 
         self.assertEqual(AgentHistory.objects.filter(agent=agent).count(), 6)
+
+    @override_settings(AGENT_HISTORY_INLINE_MAX=10)
+    def test_agent_history_prune_task_outputs(self):
+        from agents.models import HistoryOutput
+        from agents.tasks import prune_agent_history
+
+        agent = baker.make_recipe("agents.agent")
+        old = AgentHistory.objects.create(agent=agent, results="a" * 100)
+        AgentHistory.objects.create(agent=agent, results="b" * 100)
+        AgentHistory.objects.filter(pk=old.pk).update(
+            time=djangotime.now() - djangotime.timedelta(days=60)
+        )
+        HistoryOutput.objects.update(
+            last_used=djangotime.now() - djangotime.timedelta(days=60)
+        )
+
+        prune_agent_history(30)
+
+        # only the output of the pruned history is removed
+        self.assertEqual(
+            list(HistoryOutput.objects.values_list("pk", flat=True)),
+            [AgentHistory.objects.get(agent=agent).output_id],
+        )
@@ -32,6 +32,7 @@ urlpatterns = [
     path("<agent:agent_id>/eventlog/<str:logtype>/<int:days>/", views.get_event_log),
     # agent history
     path("history/", views.AgentHistoryView.as_view()),
+    path("history/<int:pk>/output/", views.AgentHistoryOutput.as_view()),
     path("<agent:agent_id>/history/", views.AgentHistoryView.as_view()),
     # agent notes
     path("notes/", views.GetAddNotes.as_view()),
@@ -40,6 +41,8 @@ urlpatterns = [
     # bulk actions
     path("maintenance/bulk/", views.agent_maintenance),
     path("actions/bulk/", views.bulk),
+    path("bulkjobs/", views.BulkJobs.as_view()),
+    path("bulkjobs/<int:pk>/", views.GetBulkJob.as_view()),
     path("versions/", views.get_agent_versions),
     path("update/", views.update_agents),
     path("installer/", views.install_agent),
@@ -7,7 +7,8 @@ from io import StringIO
 from pathlib import Path
 
 from django.conf import settings
-from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q
+from django.db.models.fields.json import KeyTransform
 from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone as djangotime
@@ -30,6 +31,7 @@ from core.utils import (
     wake_on_lan,
 )
 from logs.models import AuditLog, DebugLog, PendingAction
+from logs.pagination import keyset_page
 from scripts.models import Script
 from scripts.tasks import bulk_command_task, bulk_script_task
 from tacticalrmm.constants import (
@@ -56,7 +58,7 @@ from winupdate.models import WinUpdate, WinUpdatePolicy
 from winupdate.serializers import WinUpdatePolicySerializer
 from winupdate.tasks import bulk_check_for_updates_task, bulk_install_updates_task
 
-from .models import Agent, AgentCustomField, AgentHistory, Note
+from .models import Agent, AgentCustomField, AgentHistory, BulkJob, Note
 from .permissions import (
     AgentHistoryPerms,
     AgentNotesPerms,
@@ -75,11 +77,13 @@ from .permissions import (
 )
 from .serializers import (
     AgentCustomFieldSerializer,
-    AgentHistorySerializer,
+    AgentHistoryPreviewSerializer,
     AgentHostnameSerializer,
     AgentNoteSerializer,
     AgentSerializer,
     AgentTableSerializer,
+    BulkJobSerializer,
+    HistoryPreviewMixin,
 )
 from .tasks import (
     bulk_recover_agents_task,
@@ -1067,6 +1071,7 @@ def bulk(request):
     )
 
     ht = "Check the History tab on the agent to view the results."
+    bj = "Bulk job {} shows the combined results."
 
     if request.data["mode"] == "command":
         if request.data["shell"] == "custom" and request.data["custom_shell"]:
@@ -1074,6 +1079,13 @@ def bulk(request):
         else:
             shell = request.data["shell"]
 
+        job = BulkJob.objects.create(
+            type=AgentHistoryType.CMD_RUN,
+            command=request.data["cmd"],
+            username=request.user.username[:50],
+            timeout=int(request.data["timeout"]),
+            total=len(agents),
+        )
         bulk_command_task.delay(
             agent_pks=agents,
             cmd=request.data["cmd"],
@@ -1081,8 +1093,11 @@ def bulk(request):
             timeout=request.data["timeout"],
             username=request.user.username[:50],
             run_as_user=request.data["run_as_user"],
+            bulk_job_pk=job.pk,
+        )
+        return Response(
+            f"Command will now be run on {len(agents)} agents. {ht} {bj.format(job.pk)}"
         )
-        return Response(f"Command will now be run on {len(agents)} agents. {ht}")
 
     elif request.data["mode"] == "script":
         script = get_object_or_404(Script, pk=request.data["script"])
@@ -1097,6 +1112,14 @@ def bulk(request):
             collector_all_output = False
             save_to_agent_note = False
 
+        job = BulkJob.objects.create(
+            type=AgentHistoryType.SCRIPT_RUN,
+            command=script.name,
+            script=script,
+            username=request.user.username[:50],
+            timeout=int(request.data["timeout"]),
+            total=len(agents),
+        )
         bulk_script_task.delay(
             script_pk=script.pk,
             agent_pks=agents,
@@ -1108,9 +1131,12 @@ def bulk(request):
             custom_field_pk=custom_field_pk,
             collector_all_output=collector_all_output,
             save_to_agent_note=save_to_agent_note,
+            bulk_job_pk=job.pk,
         )
 
-        return Response(f"{script.name} will now be run on {len(agents)} agents. {ht}")
+        return Response(
+            f"{script.name} will now be run on {len(agents)} agents. {ht} {bj.format(job.pk)}"
+        )
 
     elif request.data["mode"] == "patch":
         if request.data["patchMode"] == "install":
@@ -1187,14 +1213,49 @@ class AgentHistoryView(APIView):
             history = AgentHistory.objects.filter(agent=agent)
         else:
             history = AgentHistory.objects.filter_by_role(request.user)  # type: ignore
+        # explicit order, the rows came back in whatever order the plan produced
+        history = history.order_by("pk")
         ctx = {"default_tz": get_default_timezone()}
-        return Response(AgentHistorySerializer(history, many=True, context=ctx).data)
+        return Response(
+            AgentHistoryPreviewSerializer(history, many=True, context=ctx).data
+        )
+
+
+class AgentHistoryOutput(APIView):
+    permission_classes = [IsAuthenticated, AgentHistoryPerms]
+
+    # the full output of a history entry, the list endpoints only return previews
+    def get(self, request, pk):
+        hist = get_object_or_404(
+            AgentHistory.objects.filter_by_role(request.user).only(  # type: ignore
+                "pk", "results", "script_results", "output"
+            ),
+            pk=pk,
+        )
+        return Response(hist.get_full_output())
+
+
+class BulkJobs(APIView):
+    permission_classes = [IsAuthenticated, RunBulkPerms]
+
+    def get(self, request):
+        jobs = BulkJob.objects.filter_by_user(request.user).order_by("-pk")[:50]
+        return Response(BulkJobSerializer(jobs, many=True).data)
+
+
+class GetBulkJob(APIView):
+    permission_classes = [IsAuthenticated, RunBulkPerms]
+
+    # progress of the job and its results grouped by retcode and output
+    def get(self, request, pk):
+        job = get_object_or_404(BulkJob.objects.filter_by_user(request.user), pk=pk)
+        return Response(job.summary())
 
 
 class ScriptRunHistory(APIView):
     permission_classes = [IsAuthenticated, AgentHistoryPerms]
 
-    class OutputSerializer(serializers.ModelSerializer):
+    class OutputSerializer(HistoryPreviewMixin, serializers.ModelSerializer):
         script_name = serializers.ReadOnlyField(source="script.name")
         agent_id = serializers.ReadOnlyField(source="agent.agent_id")
 
@@ -1220,6 +1281,7 @@ class ScriptRunHistory(APIView):
         end = request.query_params.get("end", None)
         limit = request.query_params.get("limit", None)
         script_name = request.query_params.get("scriptname", None)
+        agent_id = request.query_params.get("agent_id", None)
         if start and end:
             start_dt = parse_datetime(start)
             end_dt = parse_datetime(end) + djangotime.timedelta(days=1)
@@ -1228,6 +1290,18 @@ class ScriptRunHistory(APIView):
         if script_name:
             script_name_filter = Q(script__name=script_name)
 
+        hists = (
+            AgentHistory.objects.filter_by_role(request.user)  # type: ignore
+            .filter(type=AgentHistoryType.SCRIPT_RUN)
+            .filter(date_range_filter)
+            .filter(script_name_filter)
+        )
+        if agent_id:
+            hists = hists.filter(agent__agent_id=agent_id)
+
+        if "page_size" in request.query_params or "cursor" in request.query_params:
+            return self.get_page(request, hists)
+
         AGENT_R_DEFER = (
             "agent__wmi_detail",
             "agent__services",
@@ -1267,12 +1341,9 @@ class ScriptRunHistory(APIView):
             "agent__block_policy_inheritance",
         )
         hists = (
-            AgentHistory.objects.filter(type=AgentHistoryType.SCRIPT_RUN)
-            .select_related("agent")
+            hists.select_related("agent")
             .select_related("script")
             .defer(*AGENT_R_DEFER)
-            .filter(date_range_filter)
-            .filter(script_name_filter)
             .order_by("-time")
         )
         if limit:
@@ -1285,6 +1356,61 @@ class ScriptRunHistory(APIView):
         ret = self.OutputSerializer(hists, many=True).data
         return Response(ret)
 
+    def get_page(self, request, hists):
+        # keyset pagination on (time, id) without loading the script output, the
+        # output of a run is returned by AgentHistoryOutput
+        try:
+            page_size = min(int(request.query_params.get("page_size", 100)), 1000)
+            rows, next_cursor = keyset_page(
+                hists.annotate(
+                    script_name=F("script__name"),
+                    hostname=F("agent__hostname"),
+                    retcode=KeyTransform("retcode", "script_results"),
+                    execution_time=KeyTransform("execution_time", "script_results"),
+                ).values(
+                    "id",
+                    "time",
+                    "username",
+                    "script",
+                    "script_name",
+                    "agent",
+                    "agent__agent_id",
+                    "hostname",
+                    "retcode",
+                    "execution_time",
+                ),
+                cursor=request.query_params.get("cursor"),
+                page_size=page_size,
+                descending=True,
+                field="time",
+            )
+        except ValueError as e:
+            return notify_error(str(e))
+
+        for row in rows:
+            row["agent_id"] = row.pop("agent__agent_id")
+
+        ret = {"history": rows, "next_cursor": next_cursor}
+
+        # success and failure counts of each script over all pages, on the first page
+        if not request.query_params.get("cursor"):
+            ret["summary"] = list(
+                hists.values("script", script_name=F("script__name"))
+                .annotate(
+                    total=Count("id"),
+                    passed=Count("id", filter=Q(script_results__retcode=0)),
+                    failed=Count(
+                        "id",
+                        filter=Q(script_results__has_key="retcode")
+                        & ~Q(script_results__retcode=0),
+                    ),
+                    pending=Count("id", filter=Q(script_results__isnull=True)),
+                )
+                .order_by("script_name")
+            )
+
+        return Response(ret)
+
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated, AgentWOLPerms])
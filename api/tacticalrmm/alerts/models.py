@@ -20,7 +20,7 @@ from tacticalrmm.constants import (
 )
 from tacticalrmm.logger import logger
 from tacticalrmm.models import PermissionQuerySet
-from tacticalrmm.utils import RE_DB_VALUE, get_db_value
+from tacticalrmm.utils import RE_DB_VALUE, DbValueResolver
 
 if TYPE_CHECKING:
     from agents.models import Agent
@@ -808,16 +808,21 @@ class Alert(models.Model):
                         message=f"Resolved action: {alert_template.action.name} failed to run on server for resolved alert",
                     )
 
-    def parse_script_args(self, args: List[str]) -> List[str]:
+    def parse_script_args(
+        self, args: List[str], resolver: Optional[DbValueResolver] = None
+    ) -> List[str]:
         if not args:
             return []
 
+        if not resolver:
+            resolver = DbValueResolver.from_texts(texts=args, instances=[self])
+
         temp_args = []
 
         for arg in args:
             temp_arg = arg
             for string, model, prop in RE_DB_VALUE.findall(arg):
-                value = get_db_value(string=f"{model}.{prop}", instance=self)
+                value = resolver.get_db_value(string=f"{model}.{prop}", instance=self)
 
                 if value is not None:
                     temp_arg = temp_arg.replace(string, f"'{str(value)}'")
@@ -1,9 +1,16 @@
+from django.db.models import Q
 from django.utils import timezone as djangotime
 
 from agents.models import Agent
 from tacticalrmm.celery import app
 
 from .models import Alert
+from .utils import (
+    bulk_set_alert_templates,
+    get_scope_agents,
+    pop_alert_template_scope,
+    queue_alert_template_update,
+)
 
 
 @app.task
@@ -17,18 +24,36 @@ def unsnooze_alerts() -> str:
 
 @app.task
 def cache_agents_alert_template() -> str:
-    for agent in Agent.objects.only(
-        "pk", "site", "policy", "alert_template"
-    ).select_related("site", "policy", "alert_template"):
-        agent.set_alert_template()
+    bulk_set_alert_templates(Agent.objects.all())
+
+    return "ok"
+
+
+@app.task
+def update_alert_templates_task() -> str:
+    # recomputes the agents affected by the updates queued since the last run
+    scope, fleet = pop_alert_template_scope()
+    try:
+        agents = get_scope_agents(scope, fleet)
+        if agents is not None:
+            bulk_set_alert_templates(agents)
+    except Exception:
+        # the scope was already removed from redis, queue it again for the next run
+        queue_alert_template_update(**scope, fleet=fleet)
+        raise
 
     return "ok"
 
 
 @app.task
 def prune_resolved_alerts(older_than_days: int) -> str:
-    Alert.objects.filter(resolved=True).filter(
-        alert_time__lt=djangotime.now() - djangotime.timedelta(days=older_than_days)
-    ).delete()
+    from tacticalrmm.pruning import prune_older_than
+
+    prune_older_than(
+        Alert,
+        field="alert_time",
+        older_than_days=older_than_days,
+        filters=Q(resolved=True),
+    )
 
     return "ok"
@@ -1545,6 +1545,200 @@ class TestAlertTasks(TacticalTestCase):
         self.assertEqual(Alert.objects.count(), 31)
 
 
+class TestAlertTemplateAssignment(TacticalTestCase):
+    def setUp(self):
+        from tacticalrmm.cache import get_redis_client
+
+        from .utils import ALERT_TEMPLATE_SCOPE_PREFIX
+
+        self.setup_coresettings()
+        redis = get_redis_client()
+        redis.delete(*redis.keys(f"{ALERT_TEMPLATE_SCOPE_PREFIX}*") or ["none"])
+
+    def test_get_alert_templates(self):
+        from agents.models import Agent
+
+        from .utils import bulk_set_alert_templates, get_alert_templates
+
+        core = get_core_settings()
+        templates = baker.make("alerts.AlertTemplate", is_active=True, _quantity=5)
+        policy = baker.make(
+            "automation.Policy", active=True, alert_template=templates[0]
+        )
+        site_policy = baker.make(
+            "automation.Policy", active=True, alert_template=templates[1]
+        )
+        inactive_policy = baker.make(
+            "automation.Policy", active=False, alert_template=templates[2]
+        )
+
+        site = baker.make("clients.Site", alert_template=templates[3])
+        site.client.alert_template = templates[4]
+        site.client.server_policy = inactive_policy
+        site.client.save()
+        blocked_site = baker.make(
+            "clients.Site",
+            client=site.client,
+            workstation_policy=site_policy,
+            block_policy_inheritance=True,
+        )
+        other_site = baker.make("clients.Site", server_policy=site_policy)
+
+        agents = [
+            baker.make_recipe(
+                "agents.agent", site=site, monitoring_type=AgentMonType.SERVER
+            ),
+            baker.make_recipe("agents.agent", site=site, policy=policy),
+            baker.make_recipe(
+                "agents.agent",
+                site=blocked_site,
+                monitoring_type=AgentMonType.WORKSTATION,
+            ),
+            baker.make_recipe(
+                "agents.agent",
+                site=other_site,
+                monitoring_type=AgentMonType.SERVER,
+                block_policy_inheritance=True,
+            ),
+            baker.make_recipe(
+                "agents.agent",
+                site=other_site,
+                monitoring_type=AgentMonType.SERVER,
+            ),
+            baker.make_recipe(
+                "agents.agent",
+                site=other_site,
+                monitoring_type=AgentMonType.WORKSTATION,
+            ),
+        ]
+        templates[1].excluded_agents.add(agents[4])
+        templates[3].exclude_servers = True
+        templates[3].save()
+        core.alert_template = templates[2]
+        core.save()
+        core.alert_template.excluded_sites.add(other_site)
+
+        def compare():
+            expected = {}
+            for agent in Agent.objects.filter(pk__in=[a.pk for a in agents]):
+                template = agent.set_alert_template()
+                expected[agent.pk] = template.pk if template else None
+
+            # set_alert_template saved the right template, start from scratch
+            Agent.objects.update(alert_template=None)
+            loaded = list(
+                Agent.objects.filter(pk__in=expected).select_related("site__client")
+            )
+            with self.assertNumQueries(9):
+                self.assertEqual(get_alert_templates(loaded), expected)
+
+            bulk_set_alert_templates(Agent.objects.filter(pk__in=expected))
+            self.assertEqual(
+                dict(Agent.objects.values_list("pk", "alert_template_id")), expected
+            )
+
+        compare()
+        core.alert_template = None
+        core.save()
+        compare()
+        site.client.server_policy = site_policy
+        site.client.save()
+        templates[0].is_active = False
+        templates[0].save()
+        compare()
+
+    def test_bulk_set_alert_templates_only_updates_changes(self):
+        from agents.models import Agent
+
+        from .utils import bulk_set_alert_templates
+
+        template = baker.make("alerts.AlertTemplate", is_active=True)
+        site = baker.make("clients.Site", alert_template=template)
+        baker.make_recipe("agents.agent", site=site, _quantity=3)
+        baker.make_recipe("agents.agent", _quantity=2)
+
+        self.assertEqual(bulk_set_alert_templates(Agent.objects.all()), 3)
+        self.assertEqual(Agent.objects.filter(alert_template=template).count(), 3)
+        self.assertEqual(bulk_set_alert_templates(Agent.objects.all()), 0)
+
+    @patch("alerts.tasks.update_alert_templates_task.apply_async")
+    def test_queue_alert_template_update(self, apply_async):
+        from .tasks import update_alert_templates_task
+        from .utils import get_scope_agents, queue_alert_template_update
+
+        template = baker.make("alerts.AlertTemplate", is_active=True)
+        policy = baker.make("automation.Policy", active=True)
+        site = baker.make("clients.Site")
+        policy_agent = baker.make_recipe("agents.agent", policy=policy)
+        site_agents = baker.make_recipe("agents.agent", site=site, _quantity=2)
+        other = baker.make_recipe("agents.agent")
+
+        # a burst of updates is applied by one run
+        site.alert_template = template
+        site.save()
+        policy.alert_template = template
+        policy.save()
+        queue_alert_template_update(agents=[other.pk])
+        apply_async.assert_called_once()
+
+        update_alert_templates_task()
+        for agent in (policy_agent, *site_agents):
+            agent.refresh_from_db()
+            self.assertEqual(agent.alert_template_id, template.pk)
+
+        other.refresh_from_db()
+        self.assertIsNone(other.alert_template_id)
+
+        # the next update schedules another run
+        queue_alert_template_update(sites=[site.pk])
+        self.assertEqual(apply_async.call_count, 2)
+
+        # agents that reference a template are affected by its changes
+        agents = get_scope_agents({"templates": {template.pk}})
+        self.assertEqual(
+            set(agents.values_list("pk", flat=True)),
+            {policy_agent.pk, *(agent.pk for agent in site_agents)},
+        )
+        self.assertIsNone(get_scope_agents({"sites": set()}))
+
+    @patch("alerts.tasks.update_alert_templates_task.apply_async")
+    def test_failed_update_is_queued_again(self, apply_async):
+        from .tasks import update_alert_templates_task
+        from .utils import pop_alert_template_scope, queue_alert_template_update
+
+        site = baker.make("clients.Site")
+        queue_alert_template_update(sites=[site.pk], fleet=True)
+        apply_async.assert_called_once()
+
+        with patch(
+            "alerts.tasks.bulk_set_alert_templates", side_effect=RuntimeError("db")
+        ):
+            with self.assertRaises(RuntimeError):
+                update_alert_templates_task()
+
+        # another run is scheduled for the same scope
+        self.assertEqual(apply_async.call_count, 2)
+        scope, fleet = pop_alert_template_scope()
+        self.assertEqual(scope["sites"], {site.pk})
+        self.assertTrue(fleet)
+
+    @patch("alerts.tasks.update_alert_templates_task.apply_async")
+    def test_delete_alert_template_updates_its_agents(self, apply_async):
+        from .utils import pop_alert_template_scope
+
+        self.authenticate()
+        template = baker.make("alerts.AlertTemplate", is_active=True)
+        agent = baker.make_recipe("agents.agent", alert_template=template)
+        baker.make_recipe("agents.agent")
+
+        r = self.client.delete(f"/alerts/templates/{template.pk}/")
+        self.assertEqual(r.status_code, 200)
+
+        scope, fleet = pop_alert_template_scope()
+        self.assertEqual(scope["agents"], {agent.pk})
+        self.assertFalse(fleet)
+
+
 class TestAlertPermissions(TacticalTestCase):
     def setUp(self):
         self.setup_coresettings()
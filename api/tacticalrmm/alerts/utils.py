@@ -0,0 +1,318 @@
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from core.utils import get_core_settings
+from tacticalrmm.cache import get_redis_client
+from tacticalrmm.constants import AgentMonType
+from tacticalrmm.logger import logger
+
+if TYPE_CHECKING:
+    from django.db.models import QuerySet
+
+    from agents.models import Agent
+
+# agents, sites, clients, policies and alert templates waiting for their agents'
+# alert template to be recomputed, see update_alert_templates_task
+ALERT_TEMPLATE_SCOPE_PREFIX = "alert_template_scope:"
+ALERT_TEMPLATE_SCOPES = ("agents", "sites", "clients", "policies", "templates")
+ALERT_TEMPLATE_FLEET_KEY = f"{ALERT_TEMPLATE_SCOPE_PREFIX}fleet"
+ALERT_TEMPLATE_SCHEDULED_KEY = f"{ALERT_TEMPLATE_SCOPE_PREFIX}scheduled"
+
+# agent fields get_alert_templates needs, for Agent.objects.only()
+ALERT_TEMPLATE_AGENT_FIELDS = (
+    "monitoring_type",
+    "policy",
+    "alert_template",
+    "block_policy_inheritance",
+    "site__alert_template",
+    "site__block_policy_inheritance",
+    "site__workstation_policy",
+    "site__server_policy",
+    "site__client__alert_template",
+    "site__client__block_policy_inheritance",
+    "site__client__workstation_policy",
+    "site__client__server_policy",
+)
+
+Exclusions = Dict[str, Dict[int, Set[int]]]
+
+
+def _load_exclusions(model, pks: Iterable[int]) -> Exclusions:
+    # the excluded agents, sites and clients of each policy or alert template
+    field = model._meta.model_name
+    excluded: Exclusions = {}
+    for relation in ("agent", "site", "client"):
+        through = getattr(model, f"excluded_{relation}s").through
+        excluded[relation] = defaultdict(set)
+        for pk, related in through.objects.filter(
+            **{f"{field}_id__in": list(pks)}
+        ).values_list(f"{field}_id", f"{relation}_id"):
+            excluded[relation][pk].add(related)
+
+    return excluded
+
+
+def _is_excluded(excluded: Exclusions, pk: int, agent: "Agent") -> bool:
+    return (
+        agent.pk in excluded["agent"][pk]
+        or agent.site_id in excluded["site"][pk]
+        or agent.site.client_id in excluded["client"][pk]
+    )
+
+
+def get_alert_templates(agents: "Sequence[Agent]") -> Dict[int, Optional[int]]:
+    """
+    Returns the pk of the alert template of each agent keyed by the agent's pk,
+    the same as Agent.set_alert_template but with a fixed number of queries for
+    the whole fleet and without saving. The agents need their site and client
+    selected.
+    """
+    from alerts.models import AlertTemplate
+    from automation.models import Policy
+
+    core = get_core_settings()
+
+    # the automation policies of each agent in order of priority, as in
+    # Agent.get_agent_policies
+    chains: Dict[int, List[Tuple[str, Optional[int]]]] = {}
+    for agent in agents:
+        site, client = agent.site, agent.site.client
+        mon_type = agent.monitoring_type
+        chains[agent.pk] = [
+            ("agent", agent.policy_id),
+            (
+                "site",
+                (
+                    None
+                    if agent.block_policy_inheritance
+                    else getattr(site, f"{mon_type}_policy_id", None)
+                ),
+            ),
+            (
+                "client",
+                (
+                    None
+                    if agent.block_policy_inheritance or site.block_policy_inheritance
+                    else getattr(client, f"{mon_type}_policy_id", None)
+                ),
+            ),
+            (
+                "default",
+                (
+                    None
+                    if agent.block_policy_inheritance
+                    or site.block_policy_inheritance
+                    or client.block_policy_inheritance
+                    else getattr(core, f"{mon_type}_policy_id", None)
+                ),
+            ),
+        ]
+
+    # only active policies with an active alert template can assign one
+    policy_ids = {pk for chain in chains.values() for _, pk in chain if pk}
+    policy_templates: Dict[int, int] = dict(
+        Policy.objects.filter(
+            pk__in=policy_ids, active=True, alert_template__is_active=True
+        ).values_list("pk", "alert_template_id")
+    )
+    policy_excluded = _load_exclusions(Policy, policy_templates.keys())
+
+    template_ids = {*policy_templates.values(), core.alert_template_id}
+    for agent in agents:
+        template_ids.add(agent.site.alert_template_id)
+        template_ids.add(agent.site.client.alert_template_id)
+
+    templates = {
+        pk: (exclude_workstations, exclude_servers)
+        for pk, exclude_workstations, exclude_servers in AlertTemplate.objects.filter(
+            pk__in={pk for pk in template_ids if pk}, is_active=True
+        ).values_list("pk", "exclude_workstations", "exclude_servers")
+    }
+    template_excluded = _load_exclusions(AlertTemplate, templates.keys())
+
+    def applies(pk: Optional[int], agent: "Agent") -> bool:
+        # as in AlertTemplate.is_agent_excluded
+        if pk not in templates:
+            return False
+
+        exclude_workstations, exclude_servers = templates[pk]
+        return not (
+            _is_excluded(template_excluded, pk, agent)
+            or agent.monitoring_type == AgentMonType.WORKSTATION
+            and exclude_workstations
+            or agent.monitoring_type == AgentMonType.SERVER
+            and exclude_servers
+        )
+
+    ret: Dict[int, Optional[int]] = {}
+    for agent in agents:
+        ret[agent.pk] = None
+        for key, policy_id in chains[agent.pk]:
+            # default alert_template will override a default policy with alert template applied
+            if key == "default" and applies(core.alert_template_id, agent):
+                ret[agent.pk] = core.alert_template_id
+                break
+            elif (
+                policy_id in policy_templates
+                and not _is_excluded(policy_excluded, policy_id, agent)
+                and applies(policy_templates[policy_id], agent)
+            ):
+                ret[agent.pk] = policy_templates[policy_id]
+                break
+            elif key == "site" and applies(agent.site.alert_template_id, agent):
+                ret[agent.pk] = agent.site.alert_template_id
+                break
+            elif key == "client" and applies(
+                agent.site.client.alert_template_id, agent
+            ):
+                ret[agent.pk] = agent.site.client.alert_template_id
+                break
+
+    return ret
+
+
+def bulk_set_alert_templates(agents: "QuerySet[Agent]", chunk_size: int = 1000) -> int:
+    """
+    Recomputes the alert template of the agents chunk_size agents at a time and
+    saves it with one update per alert template, only for agents whose alert
+    template changed. Returns the number of agents that were updated.
+    """
+    from agents.models import Agent
+
+    pks = list(agents.order_by("pk").values_list("pk", flat=True))
+
+    updated = 0
+    for i in range(0, len(pks), chunk_size):
+        chunk = list(
+            Agent.objects.filter(pk__in=pks[i : i + chunk_size])
+            .select_related("site__client")
+            .only(*ALERT_TEMPLATE_AGENT_FIELDS)
+        )
+
+        resolved = get_alert_templates(chunk)
+        changed: Dict[Optional[int], List[int]] = defaultdict(list)
+        for agent in chunk:
+            if agent.alert_template_id != resolved[agent.pk]:
+                changed[resolved[agent.pk]].append(agent.pk)
+
+        for template_id, agent_pks in changed.items():
+            updated += Agent.objects.filter(pk__in=agent_pks).update(
+                alert_template_id=template_id
+            )
+
+    return updated
+
+
+def queue_alert_template_update(
+    *,
+    agents: Iterable[int] = (),
+    sites: Iterable[int] = (),
+    clients: Iterable[int] = (),
+    policies: Iterable[int] = (),
+    templates: Iterable[int] = (),
+    fleet: bool = False,
+) -> None:
+    """
+    Queues the agents whose alert template has to be recomputed, by themselves
+    or by their site, client, policy or alert template. Updates queued within
+    ALERT_TEMPLATE_DEBOUNCE seconds of each other are applied in one run.
+    """
+    from alerts.tasks import cache_agents_alert_template, update_alert_templates_task
+
+    scope = dict(
+        zip(ALERT_TEMPLATE_SCOPES, (agents, sites, clients, policies, templates))
+    )
+    debounce = getattr(settings, "ALERT_TEMPLATE_DEBOUNCE", 10)
+    try:
+        pipe = get_redis_client().pipeline()
+        if fleet:
+            pipe.set(ALERT_TEMPLATE_FLEET_KEY, 1)
+
+        for name, pks in scope.items():
+            if pks := list(pks):
+                pipe.sadd(f"{ALERT_TEMPLATE_SCOPE_PREFIX}{name}", *pks)
+
+        # expires in case the scheduled run was lost, so the next update schedules one
+        pipe.set(ALERT_TEMPLATE_SCHEDULED_KEY, 1, nx=True, ex=debounce + 300)
+        *_, schedule = pipe.execute()
+    except Exception as e:
+        logger.error(f"Unable to queue an alert template update: {e}")
+        cache_agents_alert_template.delay()
+        return
+
+    if schedule:
+        update_alert_templates_task.apply_async(countdown=debounce)
+
+
+def pop_alert_template_scope() -> Tuple[Dict[str, Set[int]], bool]:
+    # updates queued from now on schedule another run
+    client = get_redis_client()
+    client.delete(ALERT_TEMPLATE_SCHEDULED_KEY)
+
+    pipe = client.pipeline()
+    for name in ALERT_TEMPLATE_SCOPES:
+        pipe.smembers(f"{ALERT_TEMPLATE_SCOPE_PREFIX}{name}")
+        pipe.delete(f"{ALERT_TEMPLATE_SCOPE_PREFIX}{name}")
+
+    pipe.get(ALERT_TEMPLATE_FLEET_KEY)
+    pipe.delete(ALERT_TEMPLATE_FLEET_KEY)
+    *results, fleet, _ = pipe.execute()
+
+    scope = {
+        name: {int(pk) for pk in results[i * 2]}
+        for i, name in enumerate(ALERT_TEMPLATE_SCOPES)
+    }
+    return scope, bool(fleet)
+
+
+def get_scope_agents(
+    scope: Dict[str, Set[int]], fleet: bool = False
+) -> "Optional[QuerySet[Agent]]":
+    """
+    Returns the agents whose alert template can be affected by a change to the
+    agents, sites, clients, policies and alert templates of scope, or None if
+    there are none.
+    """
+    from agents.models import Agent
+    from automation.models import Policy
+
+    if fleet:
+        return Agent.objects.all()
+
+    lookup = Q()
+    if scope.get("agents"):
+        lookup |= Q(pk__in=scope["agents"])
+
+    if scope.get("sites"):
+        lookup |= Q(site_id__in=scope["sites"])
+
+    if scope.get("clients"):
+        lookup |= Q(site__client_id__in=scope["clients"])
+
+    policies = set(scope.get("policies", ()))
+    if templates := scope.get("templates"):
+        # the default alert template can be assigned to any agent
+        if get_core_settings().alert_template_id in templates:
+            return Agent.objects.all()
+
+        lookup |= (
+            Q(alert_template_id__in=templates)
+            | Q(site__alert_template_id__in=templates)
+            | Q(site__client__alert_template_id__in=templates)
+        )
+        policies.update(
+            Policy.objects.filter(alert_template_id__in=templates).values_list(
+                "pk", flat=True
+            )
+        )
+
+    for policy in Policy.objects.filter(pk__in=policies):
+        lookup |= Q(pk__in=policy.related_agents().values("pk"))
+
+    if not lookup:
+        return None
+
+    return Agent.objects.filter(lookup)
@@ -16,7 +16,7 @@ from .serializers import (
     AlertTemplateRelationSerializer,
     AlertTemplateSerializer,
 )
-from .tasks import cache_agents_alert_template
+from .utils import queue_alert_template_update
 
 
 class GetAddAlerts(APIView):
@@ -205,10 +205,10 @@ class GetAddAlertTemplates(APIView):
     def post(self, request):
         serializer = AlertTemplateSerializer(data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        alert_template = serializer.save()
 
         # cache alert_template value on agents
-        cache_agents_alert_template.delay()
+        queue_alert_template_update(templates=[alert_template.pk])
 
         return Response("ok")
 
@@ -231,15 +231,18 @@ class GetUpdateDeleteAlertTemplate(APIView):
         serializer.save()
 
         # cache alert_template value on agents
-        cache_agents_alert_template.delay()
+        queue_alert_template_update(templates=[pk])
 
         return Response("ok")
 
     def delete(self, request, pk):
-        get_object_or_404(AlertTemplate, pk=pk).delete()
+        alert_template = get_object_or_404(AlertTemplate, pk=pk)
+        # the agents using it lose it on delete, recompute them afterwards
+        agents = list(alert_template.agents.values_list("pk", flat=True))
+        alert_template.delete()
 
         # cache alert_template value on agents
-        cache_agents_alert_template.delay()
+        queue_alert_template_update(agents=agents)
 
         return Response("ok")
 
@@ -100,6 +100,104 @@ class TestAPIv3(TacticalTestCase):
             {"agent": self.agent.pk, "check_interval": 15},
         )
 
+    @patch("agents.models.random.randint", return_value=0)
+    @patch("agents.models.cache")
+    def test_get_checks_cached_plan(self, mock_cache, mock_randint):
+        url = f"/api/v3/{self.agent.agent_id}/checkrunner/"
+        check = baker.make_recipe("checks.ping_check", agent=self.agent)
+
+        # build the plan and return it from cache on the next request
+        mock_cache.get.return_value = None
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.data["checks"]), 1)
+        key, plan, _ = mock_cache.set.call_args.args
+        self.assertEqual(key, f"agent_{self.agent.agent_id}_runner_checks")
+        self.assertEqual(plan["interval"], self.agent.check_interval)
+
+        mock_cache.get.return_value = plan
+        with patch(
+            "agents.models.Agent.get_checks_from_policies"
+        ) as get_checks_from_policies:
+            r = self.client.get(url)
+            get_checks_from_policies.assert_not_called()
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([c["id"] for c in r.data["checks"]], [check.pk])
+
+        # results are still read per request
+        baker.make(
+            "checks.CheckResult",
+            agent=self.agent,
+            assigned_check=check,
+            last_run=djangotime.now(),
+        )
+        r = self.client.get(url)
+        self.assertFalse(r.data["checks"])
+
+    @patch("agents.models.cache")
+    def test_get_checks_cached_plan_parses_script_args(self, mock_cache):
+        url = f"/api/v3/{self.agent.agent_id}/checkrunner/"
+        field = baker.make(
+            "core.CustomField",
+            model=CustomFieldModel.AGENT,
+            type=CustomFieldType.TEXT,
+            name="Test",
+        )
+        baker.make(
+            "checks.Check",
+            agent=self.agent,
+            check_type="script",
+            script=baker.make("scripts.Script", shell="cmd"),
+            script_args=["{{agent.Test}}"],
+        )
+
+        mock_cache.get.return_value = None
+        self.client.get(url)
+        _, plan, _ = mock_cache.set.call_args.args
+        mock_cache.get.return_value = plan
+
+        # custom field values aren't part of the cached plan
+        baker.make(
+            "agents.AgentCustomField", agent=self.agent, field=field, string_value="new"
+        )
+        r = self.client.get(url)
+        self.assertEqual(r.data["checks"][0]["script_args"], ["new"])
+
+    @patch("checks.models.cache")
+    def test_check_save_clears_check_plan(self, mock_cache):
+        with self.captureOnCommitCallbacks() as callbacks:
+            check = baker.make_recipe("checks.ping_check", agent=self.agent)
+
+        # the plan is only cleared once the check is committed
+        mock_cache.delete.assert_called_once_with(f"agent_{self.agent.agent_id}_checks")
+        callbacks[0]()
+        mock_cache.delete.assert_called_with(
+            f"agent_{self.agent.agent_id}_runner_checks"
+        )
+
+        mock_cache.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            check.delete()
+        mock_cache.delete.assert_called_with(
+            f"agent_{self.agent.agent_id}_runner_checks"
+        )
+
+    @patch("scripts.models.cache")
+    def test_script_changes_clear_check_plans(self, mock_cache):
+        script = baker.make("scripts.Script")
+        baker.make("checks.Check", agent=self.agent, check_type="script", script=script)
+        snippet = baker.make("scripts.ScriptSnippet", name="snip")
+
+        script.name = "renamed"
+        for change in (script.save, snippet.save, snippet.delete):
+            mock_cache.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            mock_cache.delete_many_pattern.assert_called_once_with(
+                "agent_*_runner_checks"
+            )
+
     def test_run_checks(self):
         # force run all checks regardless of interval
         agent = baker.make_recipe("agents.online_agent")
@@ -311,3 +409,130 @@ class TestAPIv3(TacticalTestCase):
         url = f"/api/v3/{agent.agent_id}/config/"
         r = self.client.get(url)
         self.assertEqual(r.status_code, 200)
+
+    def test_software_post(self):
+        from software.models import InstalledSoftware, SoftwareChange
+
+        url = "/api/v3/software/"
+        software = [{"name": "Git", "publisher": "Git", "version": "2.22.0"}]
+        data = {"agent_id": self.agent.agent_id, "software": software}
+
+        r = self.client.post(url, data, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            InstalledSoftware.objects.get(agent=self.agent).software, software
+        )
+
+        # resending the same list only reads the agent and the hash
+        with self.assertNumQueries(2):
+            r = self.client.post(url, data, format="json")
+        self.assertEqual(r.status_code, 200)
+
+        data["software"] = [{"name": "Git", "publisher": "Git", "version": "2.23.0"}]
+        r = self.client.post(url, data, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            SoftwareChange.objects.get(agent=self.agent).updated,
+            [{"name": "Git", "from": "2.22.0", "to": "2.23.0"}],
+        )
+
+    def test_winupdates_post(self):
+        url = "/api/v3/winupdates/"
+
+        def make_update(i: int, **kwargs):
+            return {
+                "guid": f"guid-{i}",
+                "kb_article_ids": [str(5000000 + i)],
+                "title": f"Update {i}",
+                "installed": False,
+                "downloaded": False,
+                "description": "",
+                "severity": "Important",
+                "categories": [],
+                "category_ids": [],
+                "more_info_urls": [],
+                "support_url": "",
+                "revision_number": 1,
+                **kwargs,
+            }
+
+        r = self.client.post(
+            url, {"agent_id": self.agent.agent_id, "wua_updates": []}, format="json"
+        )
+        self.assertEqual(r.status_code, 400)
+
+        baker.make(
+            "winupdate.WinUpdate",
+            agent=self.agent,
+            guid="guid-0",
+            kb="KB5000000",
+            installed=False,
+            downloaded=False,
+        )
+        baker.make(
+            "winupdate.WinUpdate",
+            agent=self.agent,
+            guid="guid-1",
+            kb="KB5000001",
+            installed=True,
+            downloaded=True,
+        )
+
+        updates = [
+            make_update(0, installed=True, downloaded=True),
+            make_update(1, installed=True, downloaded=True),
+            *[make_update(i) for i in range(2, 52)],
+            # updates without a kb are skipped
+            make_update(52, kb_article_ids=[]),
+        ]
+
+        # existing guids are loaded once and changes are written in bulk
+        with self.assertNumQueries(7):
+            r = self.client.post(
+                url,
+                {"agent_id": self.agent.agent_id, "wua_updates": updates},
+                format="json",
+            )
+        self.assertEqual(r.status_code, 200)
+
+        winupdates = self.agent.winupdates.all()
+        self.assertEqual(winupdates.count(), 52)
+        self.assertFalse(winupdates.filter(guid="guid-52").exists())
+        self.assertTrue(winupdates.get(guid="guid-0").installed)
+        self.assertEqual(winupdates.get(guid="guid-10").kb, "KB5000010")
+
+    def test_winupdates_patch(self):
+        url = "/api/v3/winupdates/"
+        baker.make("winupdate.WinUpdate", agent=self.agent, guid="guid-0")
+
+        r = self.client.patch(
+            url,
+            {"agent_id": self.agent.agent_id, "guid": "guid-0", "success": True},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 200)
+        u = self.agent.winupdates.get(guid="guid-0")
+        self.assertEqual(u.result, "success")
+        self.assertTrue(u.installed)
+        self.assertIsNotNone(u.date_installed)
+
+        r = self.client.patch(
+            url,
+            {"agent_id": self.agent.agent_id, "guid": "guid-0", "success": False},
+            format="json",
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.agent.winupdates.get(guid="guid-0").result, "failed")
+
+    def test_superseded_winupdate(self):
+        url = "/api/v3/superseded/"
+        baker.make("winupdate.WinUpdate", agent=self.agent, guid="guid-0", _quantity=2)
+        baker.make("winupdate.WinUpdate", agent=self.agent, guid="guid-1")
+
+        r = self.client.post(
+            url, {"agent_id": self.agent.agent_id, "guid": "guid-0"}, format="json"
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            list(self.agent.winupdates.values_list("guid", flat=True)), ["guid-1"]
+        )
@@ -1,6 +1,8 @@
 import asyncio
+from typing import Any, Dict
 
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from django.utils import timezone as djangotime
@@ -12,9 +14,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounts.models import User
-from agents.models import Agent, AgentHistory, Note
+from agents.models import Agent, AgentHistory, BulkJob, Note
 from agents.serializers import AgentHistorySerializer
-from alerts.tasks import cache_agents_alert_template
+from alerts.utils import queue_alert_template_update
 from apiv3.utils import get_agent_config
 from autotasks.models import AutomatedTask, TaskResult
 from autotasks.serializers import TaskGOGetSerializer, TaskResultSerializer
@@ -32,7 +34,8 @@ from core.utils import (
     get_meshagent_url,
 )
 from logs.models import DebugLog
-from software.models import InstalledSoftware
+from scripts.models import Script
+from software.utils import save_software_list
 from tacticalrmm.constants import (
     AGENT_DEFER,
     TRMM_MAX_REQUEST_SIZE,
@@ -150,27 +153,21 @@ class WinUpdates(APIView):
         agent = get_object_or_404(
             Agent.objects.defer(*AGENT_DEFER), agent_id=request.data["agent_id"]
         )
-        u = agent.winupdates.filter(guid=request.data["guid"]).last()  # type: ignore
-        if not u:
-            raise WinUpdate.DoesNotExist
+        updates = agent.winupdates.filter(guid=request.data["guid"])  # type: ignore
 
         success: bool = request.data["success"]
         if success:
-            u.result = "success"
-            u.downloaded = True
-            u.installed = True
-            u.date_installed = djangotime.now()
-            u.save(
-                update_fields=[
-                    "result",
-                    "downloaded",
-                    "installed",
-                    "date_installed",
-                ]
+            updated = updates.update(
+                result="success",
+                downloaded=True,
+                installed=True,
+                date_installed=djangotime.now(),
             )
         else:
-            u.result = "failed"
-            u.save(update_fields=["result"])
+            updated = updates.update(result="failed")
+
+        if not updated:
+            raise WinUpdate.DoesNotExist
 
         agent.delete_superseded_updates()
         return Response("ok")
@@ -184,34 +181,58 @@ class WinUpdates(APIView):
             Agent.objects.defer(*AGENT_DEFER), agent_id=request.data["agent_id"]
         )
 
+        # only the latest row of each guid is kept up to date
+        existing = {
+            u.guid: u
+            for u in agent.winupdates.only(  # type: ignore
+                "id", "agent_id", "guid", "downloaded", "installed"
+            ).order_by("pk")
+        }
+
+        to_create: Dict[str, WinUpdate] = {}
+        to_update: Dict[int, WinUpdate] = {}
         for update in updates:
-            if agent.winupdates.filter(guid=update["guid"]).exists():  # type: ignore
-                u = agent.winupdates.filter(guid=update["guid"]).last()  # type: ignore
-                u.downloaded = update["downloaded"]
-                u.installed = update["installed"]
-                u.save(update_fields=["downloaded", "installed"])
-            else:
-                try:
-                    kb = "KB" + update["kb_article_ids"][0]
-                except:
-                    continue
+            u = existing.get(update["guid"]) or to_create.get(update["guid"])
+            if u:
+                if (
+                    u.downloaded != update["downloaded"]
+                    or u.installed != update["installed"]
+                ):
+                    u.downloaded = update["downloaded"]
+                    u.installed = update["installed"]
+                    if u.pk:
+                        to_update[u.pk] = u
+                continue
+
+            try:
+                kb = "KB" + update["kb_article_ids"][0]
+            except:
+                continue
+
+            to_create[update["guid"]] = WinUpdate(
+                agent=agent,
+                guid=update["guid"],
+                kb=kb,
+                title=update["title"],
+                installed=update["installed"],
+                downloaded=update["downloaded"],
+                description=update["description"],
+                severity=update["severity"],
+                categories=update["categories"],
+                category_ids=update["category_ids"],
+                kb_article_ids=update["kb_article_ids"],
+                more_info_urls=update["more_info_urls"],
+                support_url=update["support_url"],
+                revision_number=update["revision_number"],
+            )
 
-                WinUpdate(
-                    agent=agent,
-                    guid=update["guid"],
-                    kb=kb,
-                    title=update["title"],
-                    installed=update["installed"],
-                    downloaded=update["downloaded"],
-                    description=update["description"],
-                    severity=update["severity"],
-                    categories=update["categories"],
-                    category_ids=update["category_ids"],
-                    kb_article_ids=update["kb_article_ids"],
-                    more_info_urls=update["more_info_urls"],
-                    support_url=update["support_url"],
-                    revision_number=update["revision_number"],
-                ).save()
+        with transaction.atomic():
+            if to_create:
+                WinUpdate.objects.bulk_create(to_create.values(), batch_size=500)
+            if to_update:
+                WinUpdate.objects.bulk_update(
+                    to_update.values(), ["downloaded", "installed"], batch_size=500
+                )
 
         agent.delete_superseded_updates()
         return Response("ok")
@@ -225,9 +246,7 @@ class SupersededWinUpdate(APIView):
         agent = get_object_or_404(
             Agent.objects.defer(*AGENT_DEFER), agent_id=request.data["agent_id"]
         )
-        updates = agent.winupdates.filter(guid=request.data["guid"])  # type: ignore
-        for u in updates:
-            u.delete()
+        agent.winupdates.filter(guid=request.data["guid"]).delete()  # type: ignore
 
         return Response("ok")
 
@@ -265,30 +284,43 @@ class CheckRunner(APIView):
             ),
             agent_id=agentid,
         )
-        checks = agent.get_checks_with_policies(exclude_overridden=True)
+        plan = agent.get_check_plan()
 
-        run_list = [
-            check
-            for check in checks
-            # always run if check hasn't run yet
-            if not isinstance(check.check_result, CheckResult)
-            or not check.check_result.last_run
-            # see if the correct amount of seconds have passed
-            or (
-                check.check_result.last_run
-                < djangotime.now()
-                - djangotime.timedelta(
-                    seconds=check.run_interval or agent.check_interval
-                )
-            )
-        ]
+        last_runs = dict(
+            CheckResult.objects.filter(
+                agent=agent,
+                assigned_check_id__in=[check["id"] for check in plan["checks"]],
+            ).values_list("assigned_check_id", "last_run")
+        )
+
+        now = djangotime.now()
+        checks = []
+        for check in plan["checks"]:
+            last_run = last_runs.get(check["id"])
+            # always run if check hasn't run yet, otherwise see if the correct
+            # amount of seconds have passed
+            if last_run and last_run >= now - djangotime.timedelta(
+                seconds=check["run_interval"]
+            ):
+                continue
+
+            data = check["data"]
+            if check["shell"]:
+                data = {
+                    **data,
+                    "script_args": Script.parse_script_args(
+                        agent=agent, shell=check["shell"], args=check["script_args"]
+                    ),
+                    "env_vars": Script.parse_script_env_vars(
+                        agent=agent, shell=check["shell"], env_vars=check["env_vars"]
+                    ),
+                }
+            checks.append(data)
 
         ret = {
             "agent": agent.pk,
-            "check_interval": agent.check_run_interval(),
-            "checks": CheckRunnerGetSerializer(
-                run_list, context={"agent": agent}, many=True
-            ).data,
+            "check_interval": agent.check_run_interval(plan),
+            "checks": checks,
         }
         return Response(ret)
 
@@ -333,7 +365,9 @@ class CheckRunnerInterval(APIView):
 
     def get(self, request, agentid):
         agent = get_object_or_404(
-            Agent.objects.defer(*AGENT_DEFER).prefetch_related("agentchecks"),
+            Agent.objects.defer(*AGENT_DEFER).prefetch_related(
+                Prefetch("agentchecks", queryset=Check.objects.select_related("script"))
+            ),
             agent_id=agentid,
         )
 
@@ -365,14 +399,18 @@ class TaskRunner(APIView):
         return Response(TaskGOGetSerializer(task, context={"agent": agent}).data)
 
     def patch(self, request, pk, agentid):
-        from alerts.models import Alert
+        from autotasks.utils import queue_task_result
+        from tacticalrmm.task_metrics import StageTimer
 
+        timer = StageTimer("taskrunner")
         agent = get_object_or_404(
-            Agent.objects.defer(*AGENT_DEFER),
-            agent_id=agentid,
+            Agent.objects.only("pk", "agent_id"), agent_id=agentid
         )
         task = get_object_or_404(
-            AutomatedTask.objects.select_related("custom_field"), pk=pk
+            AutomatedTask.objects.select_related("custom_field").only(
+                "pk", "name", "custom_field", "collector_all_output"
+            ),
+            pk=pk,
         )
 
         content_length = request.META.get("CONTENT_LENGTH")
@@ -381,52 +419,89 @@ class TaskRunner(APIView):
             request.data["stderr"] = "Content truncated due to excessive request size."
             request.data["retcode"] = 1
 
-        # get task result or create if doesn't exist
-        try:
-            task_result = (
-                TaskResult.objects.select_related("agent")
-                .defer("agent__services", "agent__wmi_detail")
-                .get(task=task, agent=agent)
-            )
-            serializer = TaskResultSerializer(
-                data=request.data, instance=task_result, partial=True
-            )
-        except TaskResult.DoesNotExist:
-            serializer = TaskResultSerializer(data=request.data, partial=True)
-
+        serializer = TaskResultSerializer(data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        task_result = serializer.save(
-            last_run=djangotime.now(), run_status=TaskRunStatus.COMPLETED
-        )
+        result = serializer.validated_data
+        timer.lap("validate")
+
+        # only what the agent sent is written, as with a partial update
+        fields = [
+            field
+            for field in ("retcode", "stdout", "stderr", "execution_time")
+            if field in result
+        ]
 
-        AgentHistory.objects.create(
-            agent=agent,
-            type=AgentHistoryType.TASK_RUN,
-            command=task.name,
-            script_results=request.data,
-        )
+        # collector tasks pass unless they wrote to stderr
+        decider = "stderr" if task.custom_field else "retcode"
 
-        # check if task is a collector and update the custom field
-        if task.custom_field:
-            if not task_result.stderr:
-                task_result.save_collector_results()
+        def is_failed(values: Dict[str, Any]) -> bool:
+            if task.custom_field:
+                return bool(values.get("stderr"))
 
-                status = CheckStatus.PASSING
-            else:
-                status = CheckStatus.FAILING
-        else:
-            status = (
-                CheckStatus.FAILING if task_result.retcode != 0 else CheckStatus.PASSING
-            )
+            return values.get("retcode") != 0
 
-        task_result.status = status
-        task_result.save(update_fields=["status"])
+        status = None
+        if decider in result:
+            failed = is_failed(result)
+            status = CheckStatus.FAILING if failed else CheckStatus.PASSING
 
-        if status == CheckStatus.PASSING:
-            if Alert.create_or_return_task_alert(task, agent=agent, skip_create=True):
-                Alert.handle_alert_resolve(task_result)
-        else:
-            Alert.handle_alert_failure(task_result)
+        # insert or update the result and its status in one statement
+        (task_result,) = TaskResult.objects.bulk_create(
+            [
+                TaskResult(
+                    agent=agent,
+                    task=task,
+                    last_run=djangotime.now(),
+                    run_status=TaskRunStatus.COMPLETED,
+                    **{field: result[field] for field in fields},
+                    **({"status": status} if status else {}),
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=["agent", "task"],
+            update_fields=[
+                *fields,
+                "last_run",
+                "run_status",
+                *(["status"] if status else []),
+            ],
+        )
+
+        # the status depends on what was saved before, read the merged result
+        if status is None:
+            task_result = TaskResult.objects.get(agent=agent, task=task)
+            task_result.agent, task_result.task = agent, task
+            failed = is_failed({decider: getattr(task_result, decider)})
+            status = CheckStatus.FAILING if failed else CheckStatus.PASSING
+            TaskResult.objects.filter(pk=task_result.pk).update(status=status)
+
+        timer.lap("upsert")
+
+        if task.custom_field and not failed:
+            if "stdout" not in result:
+                task_result.stdout = TaskResult.objects.values_list(
+                    "stdout", flat=True
+                ).get(agent=agent, task=task)
+
+            task_result.save_collector_results()
+            timer.lap("collector")
+
+        # agent history and alerts are handled in batches by process_task_results_task,
+        # which looks the result up by agent and task since upserts don't return a pk
+        queue_task_result(
+            {
+                "agent": agent.pk,
+                "task": task.pk,
+                "task_name": task.name,
+                "status": status,
+                "data": {
+                    field: request.data.get(field)
+                    for field in ("stdout", "stderr", "retcode", "execution_time")
+                },
+            }
+        )
+        timer.lap("enqueue")
+        timer.save()
 
         return Response("ok")
 
@@ -532,7 +607,7 @@ class NewAgent(APIView):
 
         ret = {"pk": agent.pk, "token": token.key}
         sync_mesh_perms_task.delay()
-        cache_agents_alert_template.delay()
+        queue_alert_template_update(agents=[agent.pk])
         return Response(ret)
 
 
@@ -543,13 +618,7 @@ class Software(APIView):
     def post(self, request):
         agent = get_object_or_404(Agent, agent_id=request.data["agent_id"])
         sw = request.data["software"]
-        if not InstalledSoftware.objects.filter(agent=agent).exists():
-            InstalledSoftware(agent=agent, software=sw).save()
-        else:
-            s = agent.installedsoftware_set.first()  # type: ignore
-            s.software = sw
-            s.save(update_fields=["software"])
-
+        save_software_list(agent, sw)
         return Response("ok")
 
 
@@ -588,15 +657,29 @@ class AgentHistoryResult(APIView):
             ] = "Content truncated due to excessive request size."
             request.data["script_results"]["retcode"] = 1
 
-        hist = get_object_or_404(
-            AgentHistory.objects.select_related("custom_field").filter(
-                agent__agent_id=agentid
-            ),
-            pk=pk,
-        )
-        s = AgentHistorySerializer(instance=hist, data=request.data, partial=True)
-        s.is_valid(raise_exception=True)
-        s.save()
+        with transaction.atomic():
+            # locked so results reported more than once at the same time are
+            # counted once by a bulk job
+            hist = get_object_or_404(
+                AgentHistory.objects.select_related("custom_field")
+                .select_for_update(of=("self",))
+                .filter(agent__agent_id=agentid),
+                pk=pk,
+            )
+            reported = hist.results is not None or hist.script_results is not None
+
+            s = AgentHistorySerializer(instance=hist, data=request.data, partial=True)
+            s.is_valid(raise_exception=True)
+            s.save()
+
+            if hist.bulk_job_id and not reported:
+                if hist.type == AgentHistoryType.SCRIPT_RUN:
+                    r = request.data.get("script_results") or {}
+                    retcode, output = r.get("retcode"), r.get("stdout", "")
+                else:
+                    retcode, output = None, request.data.get("results", "")
+
+                BulkJob.record_result(hist.bulk_job_id, retcode=retcode, output=output)
 
         if hist.custom_field:
             if hist.custom_field.model == CustomFieldModel.AGENT:
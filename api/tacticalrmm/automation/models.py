@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, cast
 
 from django.core.cache import cache
 from django.db import models
@@ -41,20 +41,18 @@ class Policy(BaseAuditModel):
     )
 
     def save(self, *args: Any, **kwargs: Any) -> None:
-        from alerts.tasks import cache_agents_alert_template
+        from alerts.utils import queue_alert_template_update
 
         # get old policy if exists
-        old_policy: Optional[Policy] = (
-            type(self).objects.get(pk=self.pk) if self.pk else None
-        )
+        old_policy = cast(Optional[Policy], self.get_old_model())
         super().save(old_model=old_policy, *args, **kwargs)
 
         # check if alert template was changes and cache on agents
         if old_policy:
             if old_policy.alert_template != self.alert_template:
-                cache_agents_alert_template.delay()
+                queue_alert_template_update(policies=[self.pk])
             elif self.alert_template and old_policy.active != self.active:
-                cache_agents_alert_template.delay()
+                queue_alert_template_update(policies=[self.pk])
 
             if old_policy.active != self.active or old_policy.enforced != self.enforced:
                 cache.delete(CORESETTINGS_CACHE_KEY)
@@ -97,8 +97,8 @@ class TestPolicyViews(TacticalTestCase):
 
         self.check_not_authenticated("post", url)
 
-    @patch("alerts.tasks.cache_agents_alert_template.delay")
-    def test_update_policy(self, cache_alert_template):
+    @patch("alerts.utils.queue_alert_template_update")
+    def test_update_policy(self, queue_alert_template_update):
         # returns 404 for invalid policy pk
         resp = self.client.put("/automation/policies/500/", format="json")
         self.assertEqual(resp.status_code, 404)
@@ -126,7 +126,7 @@ class TestPolicyViews(TacticalTestCase):
         resp = self.client.put(url, data, format="json")
         self.assertEqual(resp.status_code, 200)
 
-        cache_alert_template.assert_called_once()
+        queue_alert_template_update.assert_called_once_with(policies=[policy.pk])
 
         self.check_not_authenticated("put", url)
 
@@ -163,7 +163,7 @@ class AutomatedTask(BaseAuditModel):
             cache.delete_many_pattern("agent_*_tasks")
 
         # get old task if exists
-        old_task = AutomatedTask.objects.get(pk=self.pk) if self.pk else None
+        old_task = self.get_old_model()
         super().save(old_model=old_task, *args, **kwargs)
 
         # check if fields were updated that require a sync to the agent and set status to notsynced
@@ -7,6 +7,7 @@ from typing import TYPE_CHECKING, Optional, Union
 
 import msgpack
 import nats
+from django.conf import settings
 from django.utils import timezone as djangotime
 from nats.errors import TimeoutError
 
@@ -14,14 +15,54 @@ from agents.models import Agent
 from alerts.models import Alert
 from autotasks.models import AutomatedTask, TaskResult
 from tacticalrmm.celery import app
-from tacticalrmm.constants import AGENT_STATUS_ONLINE, ORPHANED_WIN_TASK_LOCK
+from tacticalrmm.constants import (
+    AGENT_STATUS_ONLINE,
+    ORPHANED_WIN_TASK_LOCK,
+    TASK_RESULTS_LOCK,
+)
 from tacticalrmm.helpers import rand_range, setup_nats_options
+from tacticalrmm.logger import logger
 from tacticalrmm.utils import redis_lock
 
 if TYPE_CHECKING:
     from nats.aio.client import Client as NATSClient
 
 
+@app.task(bind=True)
+def process_task_results_task(self) -> str:
+    from autotasks.utils import (
+        ack_task_results,
+        claim_task_results,
+        process_task_results,
+        requeue_task_results,
+    )
+
+    with redis_lock(TASK_RESULTS_LOCK, self.app.oid) as acquired:
+        if not acquired:
+            return f"{self.app.oid} still running"
+
+        # results left by a run that failed or was killed go first
+        if requeued := requeue_task_results():
+            logger.info(f"Requeued {requeued} unprocessed task results")
+
+        batch_size = getattr(settings, "TASK_RESULTS_BATCH_SIZE", 500)
+        # bounded so a flood of results can't keep one worker busy forever
+        for _ in range(getattr(settings, "TASK_RESULTS_MAX_BATCHES", 20)):
+            events = claim_task_results(batch_size)
+            if not events:
+                break
+
+            try:
+                process_task_results(events)
+            except Exception:
+                requeue_task_results()
+                raise
+
+            ack_task_results()
+
+    return "ok"
+
+
 @app.task
 def create_win_task_schedule(pk: int, agent_id: Optional[str] = None) -> str:
     with suppress(
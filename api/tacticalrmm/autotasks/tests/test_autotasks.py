@@ -3,12 +3,22 @@ from unittest.mock import patch
 from django.utils import timezone as djangotime
 from model_bakery import baker
 
-from tacticalrmm.constants import TaskType
+from tacticalrmm.constants import (
+    AgentHistoryType,
+    TaskRunStatus,
+    TaskStatus,
+    TaskType,
+)
 from tacticalrmm.test import TacticalTestCase
 
 from autotasks.models import AutomatedTask, TaskResult, TaskSyncStatus
 from autotasks.serializers import TaskSerializer
-from autotasks.tasks import create_win_task_schedule, run_win_task
+from autotasks.tasks import (
+    create_win_task_schedule,
+    process_task_results_task,
+    run_win_task,
+)
+from autotasks.utils import TASK_RESULTS_PROCESSING, TASK_RESULTS_QUEUE
 
 base_url = "/tasks"
 
@@ -675,6 +685,137 @@ class TestAutoTaskCeleryTasks(TacticalTestCase):
         )
 
 
+class TestTaskResultQueue(TacticalTestCase):
+    def setUp(self):
+        from tacticalrmm.cache import get_redis_client
+
+        self.authenticate()
+        self.setup_coresettings()
+        self.redis = get_redis_client()
+        self.redis.delete(TASK_RESULTS_QUEUE, TASK_RESULTS_PROCESSING)
+        self.agent = baker.make_recipe("agents.agent")
+        self.task = baker.make("autotasks.AutomatedTask", agent=self.agent, name="t1")
+        self.url = f"/api/v3/{self.task.pk}/{self.agent.agent_id}/taskrunner/"
+
+    def tearDown(self):
+        self.redis.delete(TASK_RESULTS_QUEUE, TASK_RESULTS_PROCESSING)
+
+    def post_result(self, retcode):
+        data = {"stdout": "out", "stderr": "", "retcode": retcode}
+        r = self.client.patch(self.url, data, format="json")
+        self.assertEqual(r.status_code, 200)
+
+    def test_result_is_upserted_and_queued(self):
+        from agents.models import AgentHistory
+
+        # creates the result if the task never ran on the agent
+        self.post_result(1)
+        task_result = TaskResult.objects.get(agent=self.agent, task=self.task)
+        self.assertEqual(task_result.status, TaskStatus.FAILING)
+        self.assertEqual(task_result.run_status, TaskRunStatus.COMPLETED)
+
+        self.post_result(0)
+        task_result.refresh_from_db()
+        self.assertEqual(task_result.status, TaskStatus.PASSING)
+        self.assertEqual(TaskResult.objects.count(), 1)
+
+        # history waits for the consumer
+        self.assertFalse(AgentHistory.objects.exists())
+        self.assertEqual(self.redis.llen(TASK_RESULTS_QUEUE), 2)
+
+        process_task_results_task()
+        self.assertEqual(self.redis.llen(TASK_RESULTS_QUEUE), 0)
+        self.assertEqual(
+            AgentHistory.objects.filter(
+                agent=self.agent, type=AgentHistoryType.TASK_RUN, command="t1"
+            ).count(),
+            2,
+        )
+
+    @patch("alerts.models.Alert.handle_alert_resolve")
+    @patch("alerts.models.Alert.handle_alert_failure")
+    def test_only_latest_result_alerts(self, handle_failure, handle_resolve):
+        # failed and then passed, only the pass is evaluated
+        self.post_result(1)
+        self.post_result(0)
+        process_task_results_task()
+        handle_failure.assert_not_called()
+        # no open alert, nothing to resolve
+        handle_resolve.assert_not_called()
+
+        baker.make(
+            "alerts.Alert", agent=self.agent, assigned_task=self.task, resolved=False
+        )
+        self.post_result(0)
+        process_task_results_task()
+        handle_resolve.assert_called_once()
+
+        self.post_result(1)
+        process_task_results_task()
+        handle_failure.assert_called_once()
+
+    def test_deleted_results_are_skipped(self):
+        from agents.models import AgentHistory
+
+        self.post_result(0)
+        self.task.delete()
+        process_task_results_task()
+        self.assertFalse(AgentHistory.objects.exists())
+
+    def test_partial_result_keeps_saved_fields(self):
+        data = {"stdout": "out", "stderr": "", "retcode": 0, "execution_time": "1.5"}
+        self.client.patch(self.url, data, format="json")
+
+        # without a retcode the status comes from the saved one
+        r = self.client.patch(self.url, {"stdout": "second"}, format="json")
+        self.assertEqual(r.status_code, 200)
+        task_result = TaskResult.objects.get(agent=self.agent, task=self.task)
+        self.assertEqual(task_result.stdout, "second")
+        self.assertEqual(task_result.retcode, 0)
+        self.assertEqual(task_result.execution_time, "1.5")
+        self.assertEqual(task_result.status, TaskStatus.PASSING)
+
+        self.client.patch(self.url, {"retcode": 1}, format="json")
+        task_result.refresh_from_db()
+        self.assertEqual(task_result.stdout, "second")
+        self.assertEqual(task_result.status, TaskStatus.FAILING)
+
+    def test_failed_batch_is_requeued(self):
+        from agents.models import AgentHistory
+
+        self.post_result(1)
+        self.post_result(0)
+        with patch(
+            "autotasks.utils.process_task_results", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            process_task_results_task()
+
+        self.assertEqual(self.redis.llen(TASK_RESULTS_QUEUE), 2)
+        self.assertEqual(self.redis.llen(TASK_RESULTS_PROCESSING), 0)
+
+        # a batch left behind by a killed worker is processed in order
+        self.redis.rpush(TASK_RESULTS_PROCESSING, self.redis.lpop(TASK_RESULTS_QUEUE))
+        process_task_results_task()
+        self.assertEqual(self.redis.llen(TASK_RESULTS_PROCESSING), 0)
+        self.assertEqual(AgentHistory.objects.filter(agent=self.agent).count(), 2)
+        self.assertEqual(
+            list(
+                AgentHistory.objects.order_by("pk").values_list(
+                    "script_results__retcode", flat=True
+                )
+            ),
+            [1, 0],
+        )
+
+    @patch("autotasks.utils.get_redis_client")
+    def test_results_are_processed_without_redis(self, get_redis_client):
+        from agents.models import AgentHistory
+
+        get_redis_client.return_value.rpush.side_effect = ConnectionError
+        self.post_result(0)
+        self.assertTrue(AgentHistory.objects.filter(agent=self.agent).exists())
+
+
 class TestTaskPermissions(TacticalTestCase):
     def setUp(self):
         self.setup_coresettings()
@@ -0,0 +1,138 @@
+import json
+from typing import Any, Dict, List
+
+from tacticalrmm.cache import get_redis_client
+from tacticalrmm.constants import AGENT_DEFER, AgentHistoryType, TaskStatus
+from tacticalrmm.logger import logger
+from tacticalrmm.task_metrics import StageTimer
+
+# task results waiting for their agent history and alerts, see process_task_results
+TASK_RESULTS_QUEUE = "task_results:pending"
+# the batch being processed, moved back to the queue if processing didn't finish
+TASK_RESULTS_PROCESSING = "task_results:processing"
+
+# moves up to ARGV[1] results from the head of the queue to the processing list
+CLAIM_SCRIPT = """
+local items = redis.call("LRANGE", KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call("LTRIM", KEYS[1], #items, -1)
+    redis.call("RPUSH", KEYS[2], unpack(items))
+end
+return items
+"""
+
+# moves the processing list back to the head of the queue, keeping its order
+REQUEUE_SCRIPT = """
+local items = redis.call("LRANGE", KEYS[2], 0, -1)
+for i = #items, 1, -1 do
+    redis.call("LPUSH", KEYS[1], items[i])
+end
+redis.call("DEL", KEYS[2])
+return #items
+"""
+
+
+def queue_task_result(event: Dict[str, Any]) -> None:
+    """
+    Queues a saved task result for the batched consumer. Results are processed
+    right away if redis can't be reached, so no history or alert is lost.
+    """
+    try:
+        get_redis_client().rpush(TASK_RESULTS_QUEUE, json.dumps(event))
+    except Exception as e:
+        logger.error(f"Unable to queue the result of task {event['task']}: {e}")
+        process_task_results([event])
+
+
+def claim_task_results(count: int) -> List[Dict[str, Any]]:
+    """
+    Moves the next count results to the processing list and returns them. They
+    stay there until ack_task_results, only one consumer may claim at a time.
+    """
+    events = get_redis_client().eval(
+        CLAIM_SCRIPT, 2, TASK_RESULTS_QUEUE, TASK_RESULTS_PROCESSING, count
+    )
+    return [json.loads(event) for event in events]
+
+
+def ack_task_results() -> None:
+    get_redis_client().delete(TASK_RESULTS_PROCESSING)
+
+
+def requeue_task_results() -> int:
+    # a batch that failed or whose worker died is processed again by the next run
+    return get_redis_client().eval(
+        REQUEUE_SCRIPT, 2, TASK_RESULTS_QUEUE, TASK_RESULTS_PROCESSING
+    )
+
+
+def process_task_results(events: List[Dict[str, Any]]) -> None:
+    """
+    Creates the agent history of a batch of task results and evaluates their
+    alerts. Only the latest result of each task is evaluated, older ones in the
+    same batch were already superseded.
+    """
+    from agents.models import AgentHistory
+    from alerts.models import Alert
+    from autotasks.models import TaskResult
+
+    if not events:
+        return
+
+    timer = StageTimer("taskrunner_consumer")
+
+    latest = {(event["agent"], event["task"]): event for event in events}
+    results = [
+        task_result
+        for task_result in TaskResult.objects.filter(
+            agent_id__in={agent for agent, _ in latest},
+            task_id__in={task for _, task in latest},
+        )
+        .select_related("agent", "task")
+        .defer(*(f"agent__{field}" for field in AGENT_DEFER))
+        if (task_result.agent_id, task_result.task_id) in latest
+    ]
+    timer.lap("load")
+
+    # results are deleted with their agent or task while they wait in the queue
+    existing = {(r.agent_id, r.task_id) for r in results}
+    history = [
+        AgentHistory(
+            agent_id=event["agent"],
+            type=AgentHistoryType.TASK_RUN,
+            command=event["task_name"],
+            script_results=event["data"],
+        )
+        for event in events
+        if (event["agent"], event["task"]) in existing
+    ]
+    for hist in history:
+        hist.offload_output()
+
+    AgentHistory.objects.bulk_create(history)
+    timer.lap("history")
+
+    # passing results only have something to resolve if an alert is open
+    open_alerts = set(
+        Alert.objects.filter(
+            assigned_task_id__in={task for _, task in existing},
+            agent_id__in={agent for agent, _ in existing},
+            resolved=False,
+        ).values_list("agent_id", "assigned_task_id")
+    )
+
+    for task_result in results:
+        try:
+            key = (task_result.agent_id, task_result.task_id)
+            if latest[key]["status"] == TaskStatus.PASSING:
+                if not task_result.agent.maintenance_mode and key in open_alerts:
+                    Alert.handle_alert_resolve(task_result)
+            else:
+                Alert.handle_alert_failure(task_result)
+        except Exception as e:
+            logger.error(
+                f"Unable to handle alerts of task result {task_result.pk}: {e}"
+            )
+
+    timer.lap("alerts")
+    timer.save()
@@ -4,7 +4,7 @@ from typing import TYPE_CHECKING, Any, Dict, Optional, Union
 from django.contrib.postgres.fields import ArrayField
 from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone as djangotime
 
 from core.utils import get_core_settings
@@ -176,6 +176,7 @@ class Check(BaseAuditModel):
             cache.delete(f"agent_{self.agent.agent_id}_checks")
 
         super().save(*args, **kwargs)
+        self.clear_check_plans()
 
     def delete(self, *args, **kwargs):
         # if check is a policy check clear cache on everything
@@ -188,6 +189,17 @@ class Check(BaseAuditModel):
             cache.delete(f"agent_{self.agent.agent_id}_checks")
 
         super().delete(*args, **kwargs)
+        self.clear_check_plans()
+
+    def clear_check_plans(self) -> None:
+        # once committed, otherwise a check runner request could cache the old plan
+        if self.policy:
+            transaction.on_commit(
+                lambda: cache.delete_many_pattern("agent_*_runner_checks")
+            )
+        elif self.agent:
+            key = self.agent.check_plan_cache_key
+            transaction.on_commit(lambda: cache.delete(key))
 
     @property
     def readable_desc(self):
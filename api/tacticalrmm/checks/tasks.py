@@ -8,7 +8,6 @@ from alerts.models import Alert
 from checks.models import CheckResult
 from tacticalrmm.celery import app
 from tacticalrmm.helpers import rand_range
-from tacticalrmm.logger import logger
 
 
 @app.task
@@ -119,11 +118,10 @@ def handle_resolved_check_email_alert_task(pk: int) -> str:
 
 @app.task
 def prune_check_history(older_than_days: int) -> str:
+    from tacticalrmm.pruning import prune_older_than
+
     from .models import CheckHistory
 
-    c, _ = CheckHistory.objects.filter(
-        x__lt=djangotime.now() - djangotime.timedelta(days=older_than_days)
-    ).delete()
-    logger.info(f"Pruned {c} check history objects")
+    prune_older_than(CheckHistory, field="x", older_than_days=older_than_days)
 
     return "ok"
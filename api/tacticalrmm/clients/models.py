@@ -45,10 +45,10 @@ class Client(BaseAuditModel):
     )
 
     def save(self, *args, **kwargs):
-        from alerts.tasks import cache_agents_alert_template
+        from alerts.utils import queue_alert_template_update
 
         # get old client if exists
-        old_client = Client.objects.get(pk=self.pk) if self.pk else None
+        old_client = self.get_old_model()
         super().save(old_model=old_client, *args, **kwargs)
 
         # check if polcies have changed and initiate task to reapply policies if so
@@ -57,12 +57,13 @@ class Client(BaseAuditModel):
             or old_client.workstation_policy != self.workstation_policy
             or old_client.server_policy != self.server_policy
         ):
-            cache_agents_alert_template.delay()
+            queue_alert_template_update(clients=[self.pk])
 
         if old_client and (
             old_client.workstation_policy != self.workstation_policy
             or old_client.server_policy != self.server_policy
         ):
+            cache.delete_many_pattern("agent_*_runner_checks")
             sites = self.sites.all()
             if old_client.workstation_policy != self.workstation_policy:
                 for site in sites:
@@ -121,10 +122,10 @@ class Site(BaseAuditModel):
     )
 
     def save(self, *args, **kwargs):
-        from alerts.tasks import cache_agents_alert_template
+        from alerts.utils import queue_alert_template_update
 
-        # get old client if exists
-        old_site = Site.objects.get(pk=self.pk) if self.pk else None
+        # get old site if exists
+        old_site = self.get_old_model()
         super().save(old_model=old_site, *args, **kwargs)
 
         # check if polcies have changed and initiate task to reapply policies if so
@@ -135,7 +136,13 @@ class Site(BaseAuditModel):
                 or old_site.server_policy != self.server_policy
                 or old_site.client != self.client
             ):
-                cache_agents_alert_template.delay()
+                queue_alert_template_update(sites=[self.pk])
+
+            if (
+                old_site.workstation_policy != self.workstation_policy
+                or old_site.server_policy != self.server_policy
+            ):
+                cache.delete_many_pattern("agent_*_runner_checks")
 
             if old_site.workstation_policy != self.workstation_policy:
                 cache.delete_many_pattern(f"site_workstation_*{self.pk}_*")
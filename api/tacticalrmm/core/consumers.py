@@ -1,5 +1,6 @@
 import asyncio
 import fcntl
+import json
 import os
 import pty
 import select
@@ -15,10 +16,11 @@ from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer, JsonWebsocketConsumer
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import F
 from django.utils import timezone as djangotime
 
-from agents.models import Agent
+from agents.models import Agent, BulkJob
 from core.models import CoreSettings
 from tacticalrmm.constants import AgentMonType
 from tacticalrmm.helpers import days_until_cert_expires
@@ -118,6 +120,68 @@ class DashInfo(AsyncJsonWebsocketConsumer):
                 await asyncio.sleep(30)
 
 
+class BulkJobProgress(AsyncJsonWebsocketConsumer):
+    # streams the progress of a bulk job until every agent reported or timed out
+    async def connect(self):
+        self.user = self.scope["user"]
+
+        if isinstance(self.user, AnonymousUser):
+            await self.close()
+            return
+
+        if self.user.block_dashboard_login:
+            await self.close()
+            return
+
+        self.job = await self.get_job(self.scope["url_route"]["kwargs"]["pk"])
+        if self.job is None:
+            await self.close()
+            return
+
+        await self.accept()
+        self.connected = True
+        self.progress = asyncio.create_task(self.send_progress())
+
+    async def disconnect(self, close_code):
+        with suppress(Exception):
+            self.progress.cancel()
+
+        self.connected = False
+
+    async def receive_json(self, payload, **kwargs):
+        pass
+
+    @classmethod
+    async def encode_json(cls, content):
+        return json.dumps(content, cls=DjangoJSONEncoder)
+
+    @database_sync_to_async
+    def get_job(self, pk: int):
+        if not _has_perm(self.user, "can_run_bulk"):
+            return None
+
+        return BulkJob.objects.filter_by_user(self.user).filter(pk=pk).first()
+
+    @database_sync_to_async
+    def get_summary(self):
+        self.job.refresh_from_db()
+        return self.job.summary()
+
+    async def send_progress(self):
+        interval = getattr(settings, "BULK_JOB_PROGRESS_INTERVAL", 2)
+        while self.connected:
+            try:
+                summary = await self.get_summary()
+            except Exception as e:
+                logger.error(e)
+            else:
+                await self.send_json(summary)
+                if summary["finished"]:
+                    break
+            finally:
+                await asyncio.sleep(interval)
+
+
 class TerminalConsumer(JsonWebsocketConsumer):
     child_pid = None
     fd = None
@@ -0,0 +1,297 @@
+import gc
+import json
+import random
+import string
+import time
+import tracemalloc
+import uuid
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import msgpack
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone as djangotime
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from agents.models import Agent
+from automation.models import Policy
+from autotasks.models import AutomatedTask, TaskResult
+from checks.models import Check, CheckResult
+from clients.models import Client, Site
+from tacticalrmm.constants import (
+    AgentMonType,
+    AgentPlat,
+    CheckType,
+    TaskSyncStatus,
+    TaskType,
+)
+
+BENCH_PREFIX = "bench-"
+AGENTS_PER_SITE = 500
+
+
+def _fake_nats_client() -> MagicMock:
+    # stands in for a NATS server, every agent replies "ok" straight away
+    nc = MagicMock()
+    nc.request = AsyncMock(return_value=MagicMock(data=msgpack.dumps("ok")))
+    nc.publish = AsyncMock()
+    nc.flush = AsyncMock()
+    nc.close = AsyncMock()
+    nc.drain = AsyncMock()
+    return nc
+
+
+class Command(BaseCommand):
+    help = "seed a fleet of fake agents and benchmark beat tasks and agent endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--agents",
+            type=int,
+            nargs="+",
+            default=[1000],
+            help="fleet sizes to benchmark, e.g. --agents 1000 10000 50000",
+        )
+        parser.add_argument(
+            "--output", type=str, help="write the results as json to this file"
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="keep the seeded data afterwards"
+        )
+        parser.add_argument(
+            "--i-know",
+            action="store_true",
+            help="run against a database that is not a test database",
+        )
+
+    def handle(self, *args, **kwargs) -> None:
+        # the beat tasks run against every agent, not just the seeded ones
+        if not kwargs["i_know"] and not connection.settings_dict["NAME"].startswith(
+            "test_"
+        ):
+            raise CommandError(
+                "This seeds thousands of agents and runs the beat tasks against the "
+                "whole database, use a test database or pass --i-know"
+            )
+
+        results: Dict[int, List[Dict[str, Any]]] = {}
+
+        with ExitStack() as stack:
+            stack.enter_context(
+                patch("nats.connect", AsyncMock(side_effect=_fake_nats_client))
+            )
+            # nothing is queued for the celery workers and no emails, sms or
+            # webhooks are sent
+            for target in (
+                "celery.app.task.Task.apply_async",
+                "core.models.CoreSettings.send_mail",
+                "core.models.CoreSettings.send_sms",
+                "core.utils._run_url_rest_action",
+            ):
+                stack.enter_context(patch(target))
+            # the api client sends requests as "testserver"
+            stack.enter_context(
+                override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"])
+            )
+
+            for count in kwargs["agents"]:
+                self.cleanup()
+                self.stdout.write(f"Seeding {count} agents...")
+                self.seed(count)
+                results[count] = self.run_benchmarks()
+                self.report(count, results[count])
+
+        if not kwargs["keep"]:
+            self.cleanup()
+
+        if kwargs["output"]:
+            with open(kwargs["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def cleanup(self) -> None:
+        Agent.objects.filter(hostname__startswith=BENCH_PREFIX).delete()
+        Client.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        Policy.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        User.objects.filter(username=f"{BENCH_PREFIX}user").delete()
+
+    def seed(self, count: int) -> None:
+        now = djangotime.now()
+
+        policy = Policy.objects.create(name=f"{BENCH_PREFIX}policy", active=True)
+        Check.objects.bulk_create(
+            [
+                Check(policy=policy, check_type=CheckType.CPU_LOAD, name="cpu"),
+                Check(policy=policy, check_type=CheckType.MEMORY, name="memory"),
+            ]
+        )
+        AutomatedTask.objects.create(
+            policy=policy,
+            name="policy task",
+            task_type=TaskType.DAILY,
+            run_time_date=now,
+            daily_interval=1,
+        )
+
+        sites = []
+        for i in range(-(-count // AGENTS_PER_SITE)):
+            client = Client.objects.create(
+                name=f"{BENCH_PREFIX}client-{i}",
+                workstation_policy=policy,
+                server_policy=policy,
+            )
+            sites.append(Site.objects.create(client=client, name="site"))
+
+        agents = Agent.objects.bulk_create(
+            [
+                Agent(
+                    agent_id=uuid.uuid4().hex,
+                    hostname=f"{BENCH_PREFIX}{i}",
+                    site=sites[i // AGENTS_PER_SITE],
+                    monitoring_type=random.choice(AgentMonType.values),
+                    plat=AgentPlat.WINDOWS,
+                    version="2.8.0",
+                    # about a tenth of the fleet is overdue
+                    last_seen=now
+                    - djangotime.timedelta(minutes=random.choice([1] * 9 + [60])),
+                    overdue_time=30,
+                )
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
+
+        checks = Check.objects.bulk_create(
+            [
+                Check(agent=agent, check_type=CheckType.CPU_LOAD, name="agent cpu")
+                for agent in agents
+            ],
+            batch_size=1000,
+        )
+        CheckResult.objects.bulk_create(
+            [
+                CheckResult(agent=agent, assigned_check=check, history=[])
+                for agent, check in zip(agents, checks)
+            ],
+            batch_size=1000,
+        )
+
+        tasks = AutomatedTask.objects.bulk_create(
+            [
+                AutomatedTask(
+                    agent=agent,
+                    name="".join(random.choices(string.ascii_letters, k=10)),
+                    task_type=TaskType.DAILY,
+                    run_time_date=now,
+                    daily_interval=1,
+                )
+                for agent in agents
+            ],
+            batch_size=1000,
+        )
+        TaskResult.objects.bulk_create(
+            [
+                TaskResult(
+                    agent=agent, task=task, sync_status=TaskSyncStatus.NOT_SYNCED
+                )
+                for agent, task in zip(agents, tasks)
+            ],
+            batch_size=1000,
+        )
+
+    def measure(self, name: str, func: Callable[[], Any]) -> Dict[str, Any]:
+        # time and memory are measured in separate runs since tracing every
+        # allocation slows the code down a lot
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        gc.collect()
+        with connection.execute_wrapper(count_queries):
+            start = time.perf_counter()
+            ret = func()
+            elapsed = time.perf_counter() - start
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            "name": name,
+            "seconds": round(elapsed, 3),
+            "queries": queries,
+            "peak_mb": round(peak / 1024 / 1024, 2),
+        }
+        if hasattr(ret, "status_code"):
+            result["status"] = ret.status_code
+
+        return result
+
+    def run_benchmarks(self) -> List[Dict[str, Any]]:
+        from agents.tasks import agent_outages_task
+        from core.tasks import (
+            cache_db_fields_task,
+            resolve_alerts_task,
+            scheduled_task_runner,
+            sync_scheduled_tasks,
+        )
+
+        user = User.objects.create_user(
+            username=f"{BENCH_PREFIX}user", is_superuser=True
+        )
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        agent = Agent.objects.filter(hostname__startswith=BENCH_PREFIX).first()
+        check = Check.objects.filter(agent=agent).first()
+        task = AutomatedTask.objects.filter(agent=agent).first()
+
+        def get(url: str) -> Callable[[], Any]:
+            return lambda: client.get(url)
+
+        return [
+            self.measure("cache_db_fields_task", cache_db_fields_task),
+            self.measure("agent_outages_task", agent_outages_task),
+            self.measure("resolve_alerts_task", resolve_alerts_task),
+            self.measure("sync_scheduled_tasks", sync_scheduled_tasks),
+            self.measure("scheduled_task_runner", scheduled_task_runner),
+            self.measure("GetAgents", get("/agents/")),
+            self.measure(
+                "CheckRunner GET", get(f"/api/v3/{agent.agent_id}/checkrunner/")
+            ),
+            self.measure(
+                "CheckRunner PATCH",
+                lambda: client.patch(
+                    "/api/v3/checkrunner/",
+                    {"id": check.pk, "agent_id": agent.agent_id, "percent": 10},
+                    format="json",
+                ),
+            ),
+            self.measure(
+                "TaskRunner GET",
+                get(f"/api/v3/{task.pk}/{agent.agent_id}/taskrunner/"),
+            ),
+        ]
+
+    def report(self, count: int, results: List[Dict[str, Any]]) -> None:
+        self.stdout.write(self.style.SUCCESS(f"\n{count} agents"))
+        self.stdout.write(
+            f"{'benchmark':<25}{'seconds':>10}{'queries':>10}{'peak mb':>10}"
+            f"{'status':>8}"
+        )
+        for r in results:
+            self.stdout.write(
+                f"{r['name']:<25}{r['seconds']:>10}{r['queries']:>10}"
+                f"{r['peak_mb']:>10}{r.get('status', ''):>8}"
+            )
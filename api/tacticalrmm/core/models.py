@@ -134,7 +134,7 @@ class CoreSettings(BaseAuditModel):
     sso_enabled = models.BooleanField(default=False)
 
     def save(self, *args, **kwargs) -> None:
-        from alerts.tasks import cache_agents_alert_template
+        from alerts.utils import queue_alert_template_update
 
         cache.delete(CORESETTINGS_CACHE_KEY)
 
@@ -171,7 +171,7 @@ class CoreSettings(BaseAuditModel):
                 or old_settings.server_policy != self.server_policy
                 or old_settings.workstation_policy != self.workstation_policy
             ):
-                cache_agents_alert_template.delay()
+                queue_alert_template_update(fleet=True)
 
             if old_settings.workstation_policy != self.workstation_policy:
                 cache.delete_many_pattern("site_workstation_*")
@@ -34,6 +34,7 @@ from core.utils import get_core_settings, get_mesh_ws_url, make_alpha_numeric
 from logs.models import PendingAction
 from logs.tasks import prune_audit_log, prune_debug_log
 from ee.reporting.tasks import prune_report_history_task
+from software.tasks import prune_orphaned_software
 from tacticalrmm.celery import app
 from tacticalrmm.constants import (
     AGENT_DEFER,
@@ -97,6 +98,9 @@ def core_maintenance_tasks() -> None:
 
     remove_orphaned_history_results()
 
+    # remove software catalog entries no agent has installed anymore
+    prune_orphaned_software.delay()
+
     core = get_core_settings()
 
     # remove old CheckHistory data
@@ -3,15 +3,19 @@ from unittest.mock import patch
 
 import requests
 from channels.db import database_sync_to_async
+from channels.routing import URLRouter
 from channels.testing import WebsocketCommunicator
 
 # from django.conf import settings
 from django.core.management import call_command
 from django.test import override_settings
+from django.urls import path
+from django.utils import timezone as djangotime
 from model_bakery import baker
 from rest_framework.authtoken.models import Token
 
 # from agents.models import Agent
+from agents.models import BulkJob
 from core.utils import get_core_settings, get_mesh_ws_url, get_meshagent_url
 
 # from logs.models import PendingAction
@@ -23,7 +27,7 @@ from tacticalrmm.constants import (  # PAAction,; PAStatus,
 from tacticalrmm.helpers import get_nats_hosts, get_nats_url
 from tacticalrmm.test import TacticalTestCase
 
-from .consumers import DashInfo
+from .consumers import BulkJobProgress, DashInfo
 from .models import CustomField, GlobalKVStore, URLAction
 from .serializers import CustomFieldSerializer, KeyStoreSerializer, URLActionSerializer
 from .tasks import core_maintenance_tasks  # , resolve_pending_actions
@@ -77,6 +81,46 @@ class TestConsumers(TacticalTestCase):
         assert connected
         await communicator.disconnect()
 
+    @database_sync_to_async
+    def make_bulk_job(self):
+        job = baker.make(
+            "agents.BulkJob",
+            username=self.john.username,
+            total=2,
+            dispatched=2,
+            acknowledged=2,
+            dispatched_at=djangotime.now(),
+        )
+        BulkJob.record_result(job.pk, retcode=0, output="ok")
+        return job
+
+    # the test's connection would be closed between the consumer's queries
+    @patch("channels.db.close_old_connections")
+    async def test_bulk_job_progress(self, close_old_connections):
+        job = await self.make_bulk_job()
+        communicator = WebsocketCommunicator(
+            URLRouter([path("ws/bulkjob/<int:pk>/", BulkJobProgress.as_asgi())]),
+            f"/ws/bulkjob/{job.pk}/",
+        )
+        communicator.scope["user"] = self.john
+        connected, _ = await communicator.connect()
+        assert connected
+
+        progress = await communicator.receive_json_from()
+        self.assertEqual(progress["completed"], 1)
+        self.assertEqual(progress["pending"], 1)
+        self.assertEqual(progress["results"][0]["sample"], "ok")
+        await communicator.disconnect()
+
+        # jobs that don't exist are refused
+        communicator = WebsocketCommunicator(
+            URLRouter([path("ws/bulkjob/<int:pk>/", BulkJobProgress.as_asgi())]),
+            f"/ws/bulkjob/{job.pk + 1}/",
+        )
+        communicator.scope["user"] = self.john
+        connected, _ = await communicator.connect()
+        assert not connected
+
 
 class TestCoreTasks(TacticalTestCase):
     def setUp(self):
@@ -489,6 +533,28 @@ class TestCoreMgmtCommands(TacticalTestCase):
         for cmd in CONFIG_MGMT_CMDS:
             call_command("get_config", cmd)
 
+    def test_benchmark(self):
+        from io import StringIO
+
+        from agents.models import Agent
+
+        out = StringIO()
+        call_command("benchmark", agents=[3], stdout=out)
+
+        output = out.getvalue()
+        self.assertIn("3 agents", output)
+        self.assertIn("CheckRunner PATCH", output)
+        # the seeded data is removed afterwards
+        self.assertFalse(Agent.objects.filter(hostname__startswith="bench-").exists())
+
+    def test_benchmark_refuses_real_db(self):
+        from django.core.management.base import CommandError
+        from django.db import connection
+
+        with patch.dict(connection.settings_dict, {"NAME": "tacticalrmm"}):
+            with self.assertRaises(CommandError):
+                call_command("benchmark", agents=[3])
+
 
 class TestNatsUrls(TacticalTestCase):
     def setUp(self):
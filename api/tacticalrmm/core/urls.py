@@ -24,12 +24,15 @@ urlpatterns = [
     path("clearcache/", views.clear_cache),
     path("openai/generate/", views.OpenAICodeCompletion.as_view()),
     path("webtermperms/", views.webterm_perms),
+    path("queryprofile/", views.QueryProfile.as_view()),
 ]
 
 if not getattr(settings, "DEMO", False):
     urlpatterns += (
         path("status/", views.status),  # TODO deprecated
         path("v2/status/", views.status_v2),
+        path("v2/metrics/tasks/", views.task_metrics),
+        path("v2/metrics/tasks/slowest/", views.task_metrics_slowest),
     )
 
 
@@ -305,16 +305,19 @@ def make_alpha_numeric(s: str):
     return "".join(filter(str.isalnum, s))
 
 
-def find_and_replace_db_values_str(*, text: str, instance):
-    from tacticalrmm.utils import RE_DB_VALUE, get_db_value
+def find_and_replace_db_values_str(*, text: str, instance, resolver=None):
+    from tacticalrmm.utils import RE_DB_VALUE, DbValueResolver
 
     if not instance:
         return text
 
+    if not resolver:
+        resolver = DbValueResolver.from_texts(texts=[text], instances=[instance])
+
     return_string = text
 
     for string, model, prop in RE_DB_VALUE.findall(text):
-        value = get_db_value(string=f"{model}.{prop}", instance=instance)
+        value = resolver.get_db_value(string=f"{model}.{prop}", instance=instance)
         return_string = return_string.replace(string, str(value))
     return return_string
 
@@ -329,10 +332,25 @@ def _sanitize_webhook(s: str) -> str:
 
 
 def _run_url_rest_action(*, url: str, method, body: str, headers: str, instance=None):
+    from tacticalrmm.utils import DbValueResolver
+
+    # resolve the placeholders of the url, body and headers together
+    resolver = (
+        DbValueResolver.from_texts(texts=[url, body, headers], instances=[instance])
+        if instance
+        else None
+    )
+
     # replace url
-    new_url = find_and_replace_db_values_str(text=url, instance=instance)
-    new_body = find_and_replace_db_values_str(text=body, instance=instance)
-    new_headers = find_and_replace_db_values_str(text=headers, instance=instance)
+    new_url = find_and_replace_db_values_str(
+        text=url, instance=instance, resolver=resolver
+    )
+    new_body = find_and_replace_db_values_str(
+        text=body, instance=instance, resolver=resolver
+    )
+    new_headers = find_and_replace_db_values_str(
+        text=headers, instance=instance, resolver=resolver
+    )
     new_url = requote_uri(new_url)
 
     new_body = _sanitize_webhook(new_body)
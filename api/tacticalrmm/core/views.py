@@ -7,7 +7,7 @@ import requests
 from cryptography import x509
 from django.conf import settings
 from django.db import IntegrityError
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone as djangotime
 from django.views.decorators.csrf import csrf_exempt
@@ -107,6 +107,21 @@ def version(request):
     return Response(settings.APP_VER)
 
 
+class QueryProfile(APIView):
+    permission_classes = [IsAuthenticated, CoreSettingsPerms]
+
+    def get(self, request):
+        from tacticalrmm.query_profiler import get_profiles
+
+        return Response(get_profiles())
+
+    def delete(self, request):
+        from tacticalrmm.query_profiler import reset_profiles
+
+        reset_profiles()
+        return Response("ok")
+
+
 @api_view()
 def clear_cache(request):
     from core.utils import clear_entire_cache
@@ -682,6 +697,22 @@ def status_v2(request):
     return JsonResponse(ret, json_dumps_params={"indent": 2})
 
 
+@csrf_exempt
+@monitoring_view_v2
+def task_metrics(request):
+    from tacticalrmm.task_metrics import render_prometheus
+
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4")
+
+
+@csrf_exempt
+@monitoring_view_v2
+def task_metrics_slowest(request):
+    from tacticalrmm.task_metrics import get_slowest_runs
+
+    return JsonResponse(get_slowest_runs(), safe=False)
+
+
 # TODO deprecated
 @csrf_exempt
 @monitoring_view
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-19 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reporting', '0004_reportdataquery_created_by_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporthistory',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
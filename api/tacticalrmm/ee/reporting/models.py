@@ -131,6 +131,8 @@ class ReportHistory(BaseAuditModel):
     report_data = models.TextField()
     error_data = models.TextField(null=True, blank=True)
     date_created = models.DateTimeField(auto_now_add=True)
+    # seconds spent per stage of the run. Keys are query, render and pdf
+    timings = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"{self.report_template} - {self.date_created}"
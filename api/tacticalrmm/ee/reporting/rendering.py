@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2023-present Amidaware Inc.
+This file is subject to the EE License Agreement.
+For details, see: https://license.tacticalrmm.com/ee
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Literal, Optional, cast
+
+from django.core.cache import cache
+
+from .settings import settings as reporting_settings
+
+CHART_CACHE_PREFIX = "reporting_chart_"
+
+
+def warm_up() -> None:
+    # imports the rendering libraries so processes forked from the caller (celery pool
+    # workers) already have them loaded instead of paying for the import per report
+    import plotly.express  # noqa
+    import weasyprint  # noqa
+    from weasyprint.text.fonts import FontConfiguration
+
+    # loads the system fonts into fontconfig's cache
+    FontConfiguration()
+
+
+def render_pdf(*, html: str, css: str = "") -> bytes:
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    # @font-face rules and their temp files are added to the font configuration, so
+    # each document gets its own to keep them from leaking into later reports
+    font_config = FontConfiguration()
+
+    pdf_bytes: bytes = HTML(string=html).write_pdf(
+        stylesheets=[CSS(string=css, font_config=font_config)], font_config=font_config
+    )
+
+    return pdf_bytes
+
+
+def chart_cache_key(
+    *,
+    type: str,
+    options: Dict[str, Any],
+    traces: Optional[Dict[str, Any]] = None,
+    layout: Optional[Dict[str, Any]] = None,
+) -> str:
+    spec = json.dumps(
+        {"type": type, "options": options, "traces": traces, "layout": layout},
+        sort_keys=True,
+        default=str,
+    )
+    return f"{CHART_CACHE_PREFIX}{hashlib.sha256(spec.encode('utf-8')).hexdigest()}"
+
+
+def render_chart(
+    *,
+    type: Literal["pie", "bar", "line"],
+    format: Literal["html", "image"],
+    options: Dict[str, Any],
+    traces: Optional[Dict[str, Any]] = None,
+    layout: Optional[Dict[str, Any]] = None,
+) -> str:
+    # static images are the expensive ones to render (kaleido) and are identical for
+    # the same spec, so they are cached by a hash of the spec
+    cache_key = ""
+    if format == "image":
+        cache_key = chart_cache_key(
+            type=type, options=options, traces=traces, layout=layout
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cast(str, cached)
+
+    import plotly.express as px
+
+    fig = getattr(px, type)(**options)
+
+    if traces:
+        fig.update_traces(**traces)
+
+    if layout:
+        fig.update_layout(**layout)
+
+    if format == "html":
+        return cast(str, fig.to_html(full_html=False, include_plotlyjs="cdn"))
+
+    image = cast(str, fig.to_image(format="svg").decode("utf-8"))
+    cache.set(cache_key, image, reporting_settings.REPORTING_CHART_CACHE_TTL)
+    return image
@@ -4,6 +4,8 @@ This file is subject to the EE License Agreement.
 For details, see: https://license.tacticalrmm.com/ee
 """
 
+from typing import Optional
+
 from django.conf import settings as djangosettings
 
 
@@ -27,6 +29,40 @@ class Settings:
             f"https://{djangosettings.ALLOWED_HOSTS[0]}",
         )
 
+    @property
+    def REPORTING_TEMPLATE_CACHE_SIZE(self) -> int:
+        return getattr(self.settings, "REPORTING_TEMPLATE_CACHE_SIZE", 128)
+
+    @property
+    def REPORTING_JINJA_BYTECODE_CACHE_DIR(self) -> Optional[str]:
+        # None uses the jinja default which is a folder in the system temp dir
+        return getattr(self.settings, "REPORTING_JINJA_BYTECODE_CACHE_DIR", None)
+
+    @property
+    def REPORTING_DATA_SOURCE_CACHE_SIZE(self) -> int:
+        # max number of data source results shared between reports of one batch
+        return getattr(self.settings, "REPORTING_DATA_SOURCE_CACHE_SIZE", 32)
+
+    @property
+    def REPORTING_SCHEDULE_CONCURRENCY(self) -> int:
+        # max number of celery tasks scheduled reports are split across per run
+        return getattr(self.settings, "REPORTING_SCHEDULE_CONCURRENCY", 4)
+
+    @property
+    def REPORTING_EXPORT_CHUNK_SIZE(self) -> int:
+        # number of rows held in memory at once when streaming data query exports
+        return getattr(self.settings, "REPORTING_EXPORT_CHUNK_SIZE", 2000)
+
+    @property
+    def REPORTING_CHART_CACHE_TTL(self) -> int:
+        return getattr(self.settings, "REPORTING_CHART_CACHE_TTL", 60 * 60 * 24)
+
+    @property
+    def REPORTING_WARM_UP_WORKERS(self) -> bool:
+        # load the rendering libraries when a celery worker starts, for workers
+        # that render reports
+        return getattr(self.settings, "REPORTING_WARM_UP_WORKERS", False)
+
 
 # import this to load initialized settings during runtime
 settings = Settings()
@@ -13,14 +13,18 @@ from tacticalrmm.scheduler import (
 )
 from tacticalrmm.utils import get_core_settings, get_default_timezone
 
+from .settings import settings as reporting_settings
+
 
 @app.task
 def prune_report_history_task(older_than_days: int) -> str:
+    from tacticalrmm.pruning import prune_older_than
+
     from .models import ReportHistory
 
-    ReportHistory.objects.filter(
-        date_created__lt=djangotime.now() - djangotime.timedelta(days=older_than_days)
-    ).delete()
+    prune_older_than(
+        ReportHistory, field="date_created", older_than_days=older_than_days
+    )
 
     return "ok"
 
@@ -30,7 +34,6 @@ def scheduled_reports_runner():
     from tacticalrmm.constants import MonthlyType, ScheduleType
 
     from .models import ReportSchedule
-    from .utils import run_scheduled_report
 
     now = djangotime.now()
     tz = get_default_timezone()
@@ -104,15 +107,49 @@ def scheduled_reports_runner():
             report.save(update_fields=["locked_at"])
             run_list.append(report)
 
-    for report in run_list:
+    if not run_list:
+        return
+
+    # split the due schedules into at most REPORTING_SCHEDULE_CONCURRENCY batches. Schedules
+    # are ordered by template first so renders of the same template land in the same batch
+    # and can share data sources that don't depend on the client/site/agent
+    run_list.sort(key=lambda r: (r.report_template_id, r.pk))
+    batch_count = max(
+        1, min(reporting_settings.REPORTING_SCHEDULE_CONCURRENCY, len(run_list))
+    )
+    batch_size = -(-len(run_list) // batch_count)
+
+    for i in range(0, len(run_list), batch_size):
+        run_scheduled_reports_task.delay(
+            schedule_ids=[report.pk for report in run_list[i : i + batch_size]]
+        )
+
+
+@app.task
+def run_scheduled_reports_task(schedule_ids: List[int]) -> str:
+    from .models import ReportSchedule
+    from .utils import DataSourceCache, run_scheduled_report
+
+    schedules = ReportSchedule.objects.select_related("report_template").filter(
+        pk__in=schedule_ids
+    )
+
+    data_source_cache = DataSourceCache(
+        maxsize=reporting_settings.REPORTING_DATA_SOURCE_CACHE_SIZE
+    )
+    for report in sorted(schedules, key=lambda r: (r.report_template_id, r.pk)):
         try:
-            _, error = run_scheduled_report(schedule=report)
+            _, error = run_scheduled_report(
+                schedule=report, data_source_cache=data_source_cache
+            )
         except Exception as e:
             logger.error(str(e))
         else:
             if error:
                 logger.error(error)
 
+    return "ok"
+
 
 @app.task
 def email_report(
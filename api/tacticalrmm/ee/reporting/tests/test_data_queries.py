@@ -4,6 +4,7 @@ This file is subject to the EE License Agreement.
 For details, see: https://license.tacticalrmm.com/ee
 """
 
+import json
 from unittest.mock import patch
 
 import pytest
@@ -18,6 +19,7 @@ from ..utils import (
     build_queryset,
     resolve_model,
     add_fields,
+    stream_data_source,
 )
 
 
@@ -686,3 +688,65 @@ class TestAddingCustomFields:
 
         # Assert that the default value is used
         assert result["custom_fields"]["field1"] == default_value
+
+
+@pytest.mark.django_db()
+class TestStreamingDataSource:
+    @pytest.fixture
+    def setup_agents(self):
+        return baker.make_recipe("agents.online_agent", plat="windows", _quantity=5)
+
+    def test_stream_csv(self, setup_agents):
+        data_source = {
+            "model": Agent,
+            "only": ["hostname"],
+            "csv": {"hostname": "Hostname"},
+        }
+
+        chunks = list(
+            stream_data_source(data_source=data_source, format="csv", chunk_size=2)
+        )
+        lines = "".join(chunks).splitlines()
+
+        # 5 rows with a chunk size of 2 is written in 3 chunks
+        assert len(chunks) == 3
+        assert lines[0] == "Hostname"
+        assert sorted(lines[1:]) == sorted(agent.hostname for agent in setup_agents)
+
+    def test_stream_ndjson(self, setup_agents):
+        data_source = {"model": Agent, "only": ["hostname"], "limit": 3}
+
+        content = "".join(stream_data_source(data_source=data_source, format="ndjson"))
+        rows = [json.loads(line) for line in content.splitlines()]
+
+        assert len(rows) == 3
+        assert all(set(row.keys()) == {"hostname"} for row in rows)
+
+    def test_stream_custom_fields(self, setup_agents):
+        field = baker.make(
+            "core.CustomField", name="Field", model="agent", default_value_string=""
+        )
+        baker.make(
+            "agents.AgentCustomField",
+            agent=setup_agents[0],
+            field=field,
+            string_value="value",
+        )
+        data_source = {
+            "model": Agent,
+            "only": ["agent_id"],
+            "custom_fields": ["Field", "Missing"],
+        }
+
+        content = "".join(stream_data_source(data_source=data_source, format="csv"))
+        lines = content.splitlines()
+
+        assert lines[0] == "agent_id,custom_fields.Field"
+        assert f"{setup_agents[0].agent_id},value" in lines
+
+    @pytest.mark.parametrize("operation", ["get", "first", "count"])
+    def test_stream_unsupported_operations(self, operation):
+        data_source = {"model": Agent, operation: True}
+
+        with pytest.raises(InvalidDBOperationException):
+            stream_data_source(data_source=data_source, format="csv")
@@ -175,3 +175,87 @@ class TestQuerySchema:
     def test_unauthenticated_query_schema_view(self, unauthenticated_client):
         response = unauthenticated_client.delete("/reporting/queryschema/")
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+class TestExportReportDataQuery:
+    def test_export_data_query_csv(self, authenticated_client):
+        agent = baker.make_recipe("agents.agent")
+        query = baker.make(
+            "reporting.ReportDataQuery",
+            name="agents",
+            json_query={"model": "agent", "only": ["hostname"]},
+        )
+
+        response = authenticated_client.get(
+            f"/reporting/dataqueries/{query.id}/export/?type=csv"
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Disposition"] == 'attachment; filename="agents.csv"'
+        content = b"".join(response.streaming_content).decode()
+        assert content.splitlines() == ["hostname", agent.hostname]
+
+    def test_export_data_query_invalid_format(self, authenticated_client):
+        query = baker.make("reporting.ReportDataQuery", json_query={"model": "agent"})
+
+        response = authenticated_client.get(
+            f"/reporting/dataqueries/{query.id}/export/?type=xml"
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_export_data_query_invalid_query(self, authenticated_client):
+        query = baker.make(
+            "reporting.ReportDataQuery", json_query={"model": "agent", "count": True}
+        )
+
+        response = authenticated_client.get(
+            f"/reporting/dataqueries/{query.id}/export/"
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_export_data_query_ndjson(self, authenticated_client):
+        agent = baker.make_recipe("agents.agent")
+        query = baker.make(
+            "reporting.ReportDataQuery",
+            name='my "agents"',
+            json_query={"model": "agent", "only": ["hostname"]},
+        )
+
+        response = authenticated_client.get(
+            f"/reporting/dataqueries/{query.id}/export/?type=ndjson"
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert (
+            response["Content-Disposition"]
+            == 'attachment; filename="my \\"agents\\".ndjson"'
+        )
+        content = b"".join(response.streaming_content).decode()
+        # id is only included when the query asks for it
+        assert [json.loads(line) for line in content.splitlines()] == [
+            {"hostname": agent.hostname}
+        ]
+
+    @pytest.mark.parametrize(
+        "json_query",
+        [
+            {"model": "agent", "only": ["not_a_field"]},
+            {"model": "agent", "filter": {"not_a_field": 1}},
+            {"model": "agent", "filter": {"id": "abc"}},
+        ],
+    )
+    def test_export_data_query_bad_fields(self, authenticated_client, json_query):
+        query = baker.make("reporting.ReportDataQuery", json_query=json_query)
+
+        response = authenticated_client.get(
+            f"/reporting/dataqueries/{query.id}/export/"
+        )
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_unauthenticated_export_data_query(self, unauthenticated_client):
+        response = unauthenticated_client.get("/reporting/dataqueries/1/export/")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,86 @@
+"""
+Copyright (c) 2023-present Amidaware Inc.
+This file is subject to the EE License Agreement.
+For details, see: https://license.tacticalrmm.com/ee
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ..rendering import chart_cache_key, render_chart, render_pdf, warm_up
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class TestRenderChart:
+    @pytest.fixture(autouse=True)
+    def locmem_cache(self, settings):
+        settings.CACHES = LOCMEM_CACHE
+
+    @pytest.fixture
+    def mock_bar(self):
+        fig = MagicMock()
+        fig.to_image.return_value = b"<svg></svg>"
+        fig.to_html.return_value = "<div></div>"
+        with patch("plotly.express.bar", return_value=fig) as bar:
+            yield bar
+
+    def test_image_rendered_once_per_spec(self, mock_bar):
+        options = {"data_frame": [{"x": 1, "y": 2}], "x": "x", "y": "y"}
+
+        first = render_chart(type="bar", format="image", options=options)
+        second = render_chart(type="bar", format="image", options=dict(options))
+
+        assert first == second == "<svg></svg>"
+        mock_bar.assert_called_once()
+
+    def test_different_specs_are_rendered(self, mock_bar):
+        render_chart(type="bar", format="image", options={"x": "a"})
+        render_chart(type="bar", format="image", options={"x": "b"})
+
+        assert mock_bar.call_count == 2
+
+    def test_html_is_not_cached(self, mock_bar):
+        render_chart(type="bar", format="html", options={"x": "a"})
+        render_chart(type="bar", format="html", options={"x": "a"})
+
+        assert mock_bar.call_count == 2
+
+    def test_cache_key_ignores_key_order(self):
+        assert chart_cache_key(
+            type="bar", options={"x": "a", "y": "b"}
+        ) == chart_cache_key(type="bar", options={"y": "b", "x": "a"})
+
+
+class TestRenderPdf:
+    def test_font_config_per_document(self):
+        with patch("weasyprint.text.fonts.FontConfiguration") as font_config, patch(
+            "weasyprint.HTML"
+        ):
+            render_pdf(html="<p>one</p>")
+            render_pdf(html="<p>two</p>")
+
+        assert font_config.call_count == 2
+
+
+class TestWarmUp:
+    def test_warm_up_loads_fonts_without_rendering(self):
+        with patch("weasyprint.text.fonts.FontConfiguration") as font_config, patch(
+            "plotly.express.bar"
+        ) as mock_bar:
+            warm_up()
+
+        font_config.assert_called_once()
+        mock_bar.assert_not_called()
+
+    def test_worker_warm_up_is_opt_in(self, settings):
+        from tacticalrmm.celery import warm_up_report_rendering
+
+        with patch("ee.reporting.rendering.warm_up") as mock_warm_up:
+            warm_up_report_rendering()
+            mock_warm_up.assert_not_called()
+
+            settings.REPORTING_WARM_UP_WORKERS = True
+            warm_up_report_rendering()
+            mock_warm_up.assert_called_once()
@@ -4,11 +4,19 @@ This file is subject to the EE License Agreement.
 For details, see: https://license.tacticalrmm.com/ee
 """
 
+from unittest.mock import patch
+
 import pytest
 from model_bakery import baker
 
 from datetime import datetime
-from ..utils import db_template_loader, generate_html
+from ..utils import (
+    CompiledTemplateCache,
+    db_template_loader,
+    env,
+    generate_html,
+    template_cache,
+)
 
 
 @pytest.mark.django_db
@@ -75,6 +83,74 @@ class TestGenerateHTML:
         assert css in result
 
 
+@pytest.mark.django_db
+class TestCompiledTemplateCache:
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        template_cache.clear()
+        yield
+        template_cache.clear()
+
+    def test_template_compiled_once(self):
+        template = "# Cached {{ name }}"
+        with patch(
+            "ee.reporting.utils.env.from_string", wraps=env.from_string
+        ) as from_string:
+            first, _ = generate_html(
+                template=template, template_type="markdown", variables="name: one"
+            )
+            second, _ = generate_html(
+                template=template, template_type="markdown", variables="name: two"
+            )
+
+        from_string.assert_called_once()
+        assert "Cached one" in first
+        assert "Cached two" in second
+
+    def test_changed_template_recompiles(self):
+        generate_html(template="first", template_type="html")
+        result, _ = generate_html(template="second", template_type="html")
+
+        assert result == "second"
+        assert len(template_cache) == 2
+
+    def test_base_template_changes_are_picked_up(self):
+        base_template = baker.make(
+            "reporting.ReportHTMLTemplate",
+            name="Cached Base",
+            html="<div>{% block content %}{% endblock %}</div>",
+        )
+        template = "{% block content %}body{% endblock %}"
+
+        result, _ = generate_html(
+            template=template, template_type="html", html_template=base_template.id
+        )
+        assert result == "<div>body</div>"
+
+        base_template.html = "<p>{% block content %}{% endblock %}</p>"
+        base_template.save()
+
+        result, _ = generate_html(
+            template=template, template_type="html", html_template=base_template.id
+        )
+        assert result == "<p>body</p>"
+
+    def test_lru_eviction(self):
+        cache = CompiledTemplateCache(maxsize=2)
+        keys = [cache.make_key(template=str(i), template_type="html") for i in range(3)]
+        for key in keys[:2]:
+            cache.set(key, env.from_string("test"))
+
+        # touch the first key so the second one is the least recently used
+        cache.get(keys[0])
+        cache.set(keys[2], env.from_string("test"))
+
+        assert len(cache) == 2
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[2]) is not None
+
+
 @pytest.mark.django_db
 class TestJinjaDBLoader:
     @pytest.fixture
@@ -90,12 +166,12 @@ class TestJinjaDBLoader:
         )
 
     def test_load_base_template(self, report_base_template):
-        result = db_template_loader(report_base_template.name)
-        assert result == "Test HTML"
+        source, _, _ = db_template_loader(report_base_template.name)
+        assert source == "Test HTML"
 
     def test_fallback_to_md_template(self, report_template):
-        result = db_template_loader(report_template.name)
-        assert result == "Test MD"
+        source, _, _ = db_template_loader(report_template.name)
+        assert source == "Test MD"
 
     def test_no_template_found(self):
         # Will return None
@@ -110,8 +186,8 @@ class TestJinjaDBLoader:
             "reporting.ReportTemplate", name=template_name, template_md="Test MD"
         )
 
-        result = db_template_loader(template_name)
-        assert result == "Test HTML"  # HTML has priority
+        source, _, _ = db_template_loader(template_name)
+        assert source == "Test HTML"  # HTML has priority
 
 
 @pytest.mark.django_db
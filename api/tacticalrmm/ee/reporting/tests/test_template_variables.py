@@ -10,6 +10,7 @@ import pytest
 from model_bakery import baker
 
 from ..utils import (
+    DataSourceCache,
     prep_variables_for_template,
     process_chart_variables,
     process_data_sources,
@@ -176,6 +177,46 @@ class TestProcessDataSourceVariables:
             # Assert that the "source2" data remains unchanged
             assert result["data_sources"]["source2"] == "some_string_value"
 
+    def test_process_data_sources_shared_cache(self):
+        data_source_cache = DataSourceCache(maxsize=8)
+
+        def make_variables(agent_id):
+            return {
+                "data_sources": {
+                    "shared": {"model": "agent", "only": ["hostname"]},
+                    "per_agent": {"model": "agent", "filter": {"agent_id": agent_id}},
+                }
+            }
+
+        with patch(
+            "ee.reporting.utils.build_queryset", return_value=[{"id": 1}]
+        ) as build_queryset:
+            first = process_data_sources(
+                variables=make_variables("abc"), data_source_cache=data_source_cache
+            )
+            second = process_data_sources(
+                variables=make_variables("def"), data_source_cache=data_source_cache
+            )
+
+        # the shared query only runs once, the per agent query runs for each agent
+        assert build_queryset.call_count == 3
+        assert second["data_sources"]["shared"] == first["data_sources"]["shared"]
+        # cached results are copied so a render can't change them for the next one
+        assert second["data_sources"]["shared"] is not first["data_sources"]["shared"]
+
+    def test_data_source_cache_is_bounded(self):
+        data_source_cache = DataSourceCache(maxsize=2)
+        data_source_cache.set("a", [1])
+        data_source_cache.set("b", [2])
+        # touch "a" so "b" is the least recently used
+        data_source_cache.get("a")
+        data_source_cache.set("c", [3])
+
+        assert len(data_source_cache) == 2
+        assert "a" in data_source_cache
+        assert "b" not in data_source_cache
+        assert data_source_cache.get("c") == [3]
+
 
 class TestProcessChartVariables:
     def test_process_chart_no_replace_data_frame(self):
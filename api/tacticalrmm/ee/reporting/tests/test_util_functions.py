@@ -5,6 +5,7 @@ For details, see: https://license.tacticalrmm.com/ee
 """
 
 import base64
+from unittest.mock import patch
 
 import pytest
 from model_bakery import baker
@@ -110,3 +111,38 @@ class TestNormalizeAssets:
 
         # The text remains unchanged
         assert text == result
+
+
+@pytest.mark.django_db
+class TestRunReport:
+    def test_run_report_records_stage_timings(self):
+        template = baker.make(
+            "reporting.ReportTemplate",
+            template_md="Report",
+            type="html",
+            template_variables="",
+        )
+
+        _, error, history = ee.reporting.utils.run_report(
+            template=template, dependencies={}, format="html"
+        )
+
+        history.refresh_from_db()
+        assert error is None
+        assert set(history.timings.keys()) == {"query", "render"}
+
+    @patch("ee.reporting.utils.generate_pdf", return_value=b"pdf")
+    def test_run_report_records_pdf_timing(self, generate_pdf):
+        template = baker.make(
+            "reporting.ReportTemplate",
+            template_md="Report",
+            type="html",
+            template_variables="",
+        )
+
+        _, _, history = ee.reporting.utils.run_report(
+            template=template, dependencies={}, format="pdf"
+        )
+
+        history.refresh_from_db()
+        assert "pdf" in history.timings
@@ -4,15 +4,25 @@ This file is subject to the EE License Agreement.
 For details, see: https://license.tacticalrmm.com/ee
 """
 
+import copy
+import csv
 import datetime
+import hashlib
 import inspect
+import io
 import json
 import re
+import threading
+import time
+from collections import OrderedDict
 from enum import Enum
+from itertools import islice
 from typing import (
     TYPE_CHECKING,
     Any,
+    Callable,
     Dict,
+    Iterator,
     List,
     Literal,
     Optional,
@@ -27,15 +37,13 @@ import yaml
 from django.apps import apps
 from django.conf import settings
 from django.utils import timezone as djangotime
-from jinja2 import Environment, FunctionLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FunctionLoader, Template
 from jinja2.exceptions import TemplateError
 from rest_framework.serializers import ValidationError
-from weasyprint import CSS, HTML
-from weasyprint.text.fonts import FontConfiguration
 
 import ee.reporting.tasks
 from tacticalrmm.logger import logger
-from tacticalrmm.utils import RE_DB_VALUE, get_db_value
+from tacticalrmm.utils import RE_DB_VALUE, DbValueResolver, get_db_value
 
 from . import custom_filters
 from .constants import REPORTING_MODELS, get_property_fields
@@ -48,6 +56,8 @@ from .models import (
     ReportSchedule,
     ReportTemplate,
 )
+from .rendering import render_chart, render_pdf
+from .settings import settings as reporting_settings
 
 if TYPE_CHECKING:
     from accounts.models import User
@@ -61,20 +71,119 @@ RE_DEPENDENCY_VALUE = re.compile(r"(\{\{\s*(.*)\s*\}\})")
 
 # this will lookup the Jinja parent template in the DB
 # Example: {% extends "MASTER_TEMPLATE_NAME or REPORT_TEMPLATE_NAME" %}
-def db_template_loader(template_name: str) -> Optional[str]:
-    # trys the ReportHTMLTemplate table and ReportTemplate table
-    try:
-        return ReportHTMLTemplate.objects.get(name=template_name).html
-    except ReportHTMLTemplate.DoesNotExist:
-        pass
+# trys the ReportHTMLTemplate table and ReportTemplate table. Jinja keeps loaded parent
+# templates in its own cache and calls uptodate before reusing them, so a base template
+# saved from another process is reloaded instead of served stale
+def db_template_loader(
+    template_name: str,
+) -> Optional[Tuple[str, Optional[str], Callable[[], bool]]]:
+    Model: Union[Type[ReportHTMLTemplate], Type[ReportTemplate]] = ReportHTMLTemplate
+    found = (
+        ReportHTMLTemplate.objects.filter(name=template_name)
+        .values_list("html", "modified_time")
+        .first()
+    )
 
-    try:
-        template = ReportTemplate.objects.get(name=template_name)
-        return template.template_md
-    except ReportTemplate.DoesNotExist:
-        pass
+    if not found:
+        Model = ReportTemplate
+        found = (
+            ReportTemplate.objects.filter(name=template_name)
+            .values_list("template_md", "modified_time")
+            .first()
+        )
 
-    return None
+    if not found:
+        return None
+
+    source, modified_time = found
+
+    def uptodate() -> bool:
+        return Model.objects.filter(
+            name=template_name, modified_time=modified_time
+        ).exists()
+
+    return source, None, uptodate
+
+
+class CompiledTemplateCache:
+    """
+    Bounded LRU cache of compiled report templates.
+
+    Keys contain a hash of the template source so saving a template produces a new
+    key and the stale entry is eventually evicted.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._templates: "OrderedDict[Tuple[str, str, str], Template]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        *, template: str, template_type: str, html_template_name: str = ""
+    ) -> Tuple[str, str, str]:
+        digest = hashlib.sha256(template.encode("utf-8")).hexdigest()
+        return (template_type, html_template_name, digest)
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Template]:
+        with self._lock:
+            tm = self._templates.get(key)
+            if tm is not None:
+                self._templates.move_to_end(key)
+            return tm
+
+    def set(self, key: Tuple[str, str, str], tm: Template) -> None:
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._templates[key] = tm
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+
+class DataSourceCache:
+    """
+    Bounded LRU cache of data source results shared between the reports of a batch.
+
+    Keys are the data source after dependency substitution, so queries that depend
+    on the client, site or agent rarely hit again and are the first to be evicted.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._results: "OrderedDict[str, Any]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        if key not in self._results:
+            return None
+
+        self._results.move_to_end(key)
+        # copied so a render can't change the result for the next one
+        return copy.deepcopy(self._results[key])
+
+    def set(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+
+        self._results[key] = copy.deepcopy(value)
+        self._results.move_to_end(key)
+        while len(self._results) > self.maxsize:
+            self._results.popitem(last=False)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._results
+
+    def __len__(self) -> int:
+        return len(self._results)
 
 
 # sets up Jinja environment wiht the db loader template
@@ -84,6 +193,13 @@ env = Environment(
     comment_start_string="{=",
     comment_end_string="=}",
     extensions=["jinja2.ext.do", "jinja2.ext.loopcontrols"],
+    bytecode_cache=FileSystemBytecodeCache(
+        reporting_settings.REPORTING_JINJA_BYTECODE_CACHE_DIR
+    ),
+)
+
+template_cache = CompiledTemplateCache(
+    maxsize=reporting_settings.REPORTING_TEMPLATE_CACHE_SIZE
 )
 
 
@@ -101,13 +217,7 @@ for name, func in inspect.getmembers(custom_filters, inspect.isfunction):
 
 
 def generate_pdf(*, html: str, css: str = "") -> bytes:
-    font_config = FontConfiguration()
-
-    pdf_bytes: bytes = HTML(string=html).write_pdf(
-        stylesheets=[CSS(string=css, font_config=font_config)], font_config=font_config
-    )
-
-    return pdf_bytes
+    return render_pdf(html=html, css=css)
 
 
 def generate_html(
@@ -119,35 +229,61 @@ def generate_html(
     variables: str = "",
     dependencies: Optional[Dict[str, int]] = None,
     user: Optional["User"] = None,
+    data_source_cache: Optional[DataSourceCache] = None,
+    timings: Optional[Dict[str, float]] = None,
 ) -> Tuple[str, Dict[str, Any]]:
     if dependencies is None:
         dependencies = {}
 
-    # validate the template
-    env.parse(template)
-
-    # convert template
-    template_string = (
-        Markdown.convert(template) if template_type == "markdown" else template
-    )
+    if timings is None:
+        timings = {}
 
-    # append extends if base template is configured
+    html_template_name = ""
     if html_template:
         try:
             html_template_name = ReportHTMLTemplate.objects.get(pk=html_template).name
+        except ReportHTMLTemplate.DoesNotExist:
+            pass
+
+    cache_key = template_cache.make_key(
+        template=template,
+        template_type=template_type,
+        html_template_name=html_template_name,
+    )
+    tm = template_cache.get(cache_key)
+
+    if tm is None:
+        # validate the template
+        env.parse(template)
+
+        # convert template
+        template_string = (
+            Markdown.convert(template) if template_type == "markdown" else template
+        )
+
+        # append extends if base template is configured
+        if html_template_name:
             template_string = (
                 f"""{{% extends "{html_template_name}" %}}\n{template_string}"""
             )
-        except ReportHTMLTemplate.DoesNotExist:
-            pass
 
-    tm = env.from_string(template_string)
+        tm = env.from_string(template_string)
+        template_cache.set(cache_key, tm)
 
+    start = time.perf_counter()
     variables_dict = prep_variables_for_template(
-        variables=variables, dependencies=dependencies, user=user
+        variables=variables,
+        dependencies=dependencies,
+        user=user,
+        data_source_cache=data_source_cache,
     )
+    timings["query"] = round(time.perf_counter() - start, 3)
 
-    return (tm.render(css=css, **variables_dict), variables_dict)
+    start = time.perf_counter()
+    html = tm.render(css=css, **variables_dict)
+    timings["render"] = round(time.perf_counter() - start, 3)
+
+    return (html, variables_dict)
 
 
 def make_dataqueries_inline(*, variables: str) -> str:
@@ -175,6 +311,7 @@ def prep_variables_for_template(
     dependencies: Optional[Dict[str, Any]] = None,
     limit_query_results: Optional[int] = None,
     user: Optional["User"] = None,
+    data_source_cache: Optional[DataSourceCache] = None,
 ) -> Dict[str, Any]:
     if not dependencies:
         dependencies = {}
@@ -190,7 +327,10 @@ def prep_variables_for_template(
     # replace the data_sources with the actual data from DB. This will be passed to the template
     # in the form of {{data_sources.data_source_name}}
     variables_dict = process_data_sources(
-        variables=variables_dict, limit_query_results=limit_query_results, user=user
+        variables=variables_dict,
+        limit_query_results=limit_query_results,
+        user=user,
+        data_source_cache=data_source_cache,
     )
 
     # generate and replace charts in the variables
@@ -255,6 +395,18 @@ class InvalidDBOperationException(Exception):
     pass
 
 
+# create a base reporting queryset
+def _get_base_queryset(*, Model: Any, user: Optional["User"] = None) -> Any:
+    try:
+        if user and hasattr(Model.objects, "filter_by_role"):
+            return Model.objects.filter_by_role(user)
+        else:
+            return Model.objects.using("default")
+    except Exception as e:
+        logger.error(str(e))
+        return Model.objects.using("default")
+
+
 def build_queryset(
     *,
     data_source: Dict[str, Any],
@@ -280,15 +432,7 @@ def build_queryset(
         all_properties = get_property_fields(Model)
         properties = [property for property in properties if property in all_properties]
 
-    # create a base reporting queryset
-    try:
-        if user and hasattr(Model.objects, "filter_by_role"):
-            queryset = Model.objects.filter_by_role(user)
-        else:
-            queryset = Model.objects.using("default")
-    except Exception as e:
-        logger.error(str(e))
-        queryset = Model.objects.using("default")
+    queryset = _get_base_queryset(Model=Model, user=user)
 
     properties_queryset = None
 
@@ -422,6 +566,170 @@ def build_queryset(
             return queryset
 
 
+# operations that need the full result set and can't be streamed
+STREAM_UNSUPPORTED_OPERATIONS = (
+    AllowedOperations.GET.value,
+    AllowedOperations.FIRST.value,
+    AllowedOperations.COUNT.value,
+    AllowedOperations.AGGREGATE.value,
+    AllowedOperations.VALUES.value,
+)
+
+
+def stream_data_source(
+    *,
+    data_source: Dict[str, Any],
+    format: Literal["csv", "ndjson"],
+    user: Optional["User"] = None,
+    chunk_size: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Streams the results of a data query as csv or newline delimited json.
+
+    Rows are read with a server side cursor and written out chunk_size rows at a
+    time so memory use doesn't grow with the size of the result set. The query is
+    built before the iterator is returned so invalid queries raise immediately.
+    """
+    if not chunk_size:
+        chunk_size = reporting_settings.REPORTING_EXPORT_CHUNK_SIZE
+
+    local_data_source = dict(data_source)
+    Model = local_data_source.pop("model")
+    model_name = Model.__name__.lower()
+    limit = local_data_source.pop("limit", None)
+    columns = local_data_source.pop("only", None)
+    defer = local_data_source.pop("defer", None) or []
+    properties = local_data_source.pop("properties", None) or []
+    requested_custom_fields = local_data_source.pop("custom_fields", None)
+    csv_columns = local_data_source.pop("csv", None)
+    local_data_source.pop("json", None)
+
+    if not isinstance(csv_columns, dict):
+        csv_columns = {}
+
+    if properties:
+        all_properties = get_property_fields(Model)
+        properties = [property for property in properties if property in all_properties]
+
+    custom_fields: List[str] = []
+    if isinstance(requested_custom_fields, list) and model_name in (
+        "client",
+        "site",
+        "agent",
+    ):
+        from core.models import CustomField
+
+        existing = set(
+            CustomField.objects.filter(
+                model=model_name, name__in=requested_custom_fields
+            ).values_list("name", flat=True)
+        )
+        custom_fields = [
+            field for field in requested_custom_fields if field in existing
+        ]
+
+    queryset = _get_base_queryset(Model=Model, user=user)
+    allowed_operations = [op.value for op in AllowedOperations]
+    for operation, values in local_data_source.items():
+        if operation not in allowed_operations:
+            raise InvalidDBOperationException(
+                f"DB operation: {operation} not allowed. Supported operations: {', '.join(allowed_operations)}"
+            )
+        elif operation in STREAM_UNSUPPORTED_OPERATIONS:
+            raise InvalidDBOperationException(
+                f"DB operation: {operation} is not supported when exporting"
+            )
+        elif operation == AllowedOperations.ALL.value:
+            continue
+        elif isinstance(values, list):
+            queryset = getattr(queryset, operation)(*values)
+        elif isinstance(values, dict):
+            queryset = getattr(queryset, operation)(**values)
+        else:
+            queryset = getattr(queryset, operation)(values)
+
+    # server side cursors need a stable ordering to page through the results
+    if not queryset.ordered:
+        queryset = queryset.order_by("pk")
+
+    if limit:
+        queryset = queryset[:limit]
+
+    if columns:
+        fields = [column for column in columns if column not in defer]
+    else:
+        fields = [
+            field.name for field in Model._meta.local_fields if field.name not in defer
+        ]
+
+    # id is needed to attach custom fields and properties. Only output it if asked for
+    include_id = "id" in fields
+    if not include_id:
+        fields.append("id")
+
+    rows = queryset.values(*fields).iterator(chunk_size=chunk_size)
+
+    def _generate() -> Iterator[str]:
+        header: List[str] = []
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            if custom_fields or properties:
+                chunk = cast(
+                    List[Dict[str, Any]],
+                    add_fields(
+                        data=chunk,
+                        custom_fields=custom_fields,
+                        properties=properties,
+                        properties_queryset=Model.objects.filter(
+                            pk__in=[row["id"] for row in chunk]
+                        ),
+                        model_name=cast(Literal["client", "site", "agent"], model_name),
+                    ),
+                )
+
+            if not include_id:
+                for row in chunk:
+                    del row["id"]
+
+            if format == "ndjson":
+                yield "".join(json.dumps(row, default=str) + "\n" for row in chunk)
+                continue
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in chunk:
+                # flatten custom fields into their own columns
+                for name, value in row.pop("custom_fields", {}).items():
+                    row[f"custom_fields.{name}"] = value
+
+                if not header:
+                    header = list(row.keys())
+                    writer.writerow([csv_columns.get(key, key) for key in header])
+
+                writer.writerow([row.get(key) for key in header])
+
+            yield buffer.getvalue()
+
+    return _generate()
+
+
+def export_data_source_to_file(
+    *,
+    data_source: Dict[str, Any],
+    format: Literal["csv", "ndjson"],
+    path: str,
+    user: Optional["User"] = None,
+) -> None:
+    with open(path, "w", newline="") as f:
+        for chunk in stream_data_source(
+            data_source=data_source, format=format, user=user
+        ):
+            f.write(chunk)
+
+
 def add_fields(
     *,
     data: Union[Dict[str, Any], List[Dict[str, Any]]],
@@ -577,12 +885,25 @@ def process_data_sources(
     variables: Dict[str, Any],
     limit_query_results: Optional[int] = None,
     user: Optional["User"] = None,
+    data_source_cache: Optional[DataSourceCache] = None,
 ) -> Dict[str, Any]:
     data_sources = variables.get("data_sources")
 
     if isinstance(data_sources, dict):
         for key, value in data_sources.items():
             if isinstance(value, dict):
+                # data_source_cache is shared between renders in the same batch. The key is
+                # the query after dependency substitution so a query that doesn't reference
+                # the client/site/agent is only evaluated once per batch
+                cache_key = ""
+                if data_source_cache is not None:
+                    cache_key = json.dumps(
+                        [value, limit_query_results], sort_keys=True, default=str
+                    )
+                    if cache_key in data_source_cache:
+                        data_sources[key] = data_source_cache.get(cache_key)
+                        continue
+
                 modified_datasource = resolve_model(data_source=value)
                 queryset = build_queryset(
                     data_source=modified_datasource,
@@ -591,6 +912,9 @@ def process_data_sources(
                 )
                 data_sources[key] = queryset
 
+                if data_source_cache is not None:
+                    data_source_cache.set(cache_key, queryset)
+
     return variables
 
 
@@ -612,8 +936,18 @@ def process_dependencies(
             dependencies[dep] = Model.objects.get(**{lookup_param: dependencies[dep]})
 
     # Handle database value placeholders
-    for string, model, prop in RE_DB_VALUE.findall(variables):
-        value = get_value_for_model(model, prop, dependencies)
+    placeholders = RE_DB_VALUE.findall(variables)
+    resolver = DbValueResolver(
+        strings=[
+            f"{model}.{prop}" if model == "global" else prop
+            for _, model, prop in placeholders
+        ],
+        instances=[
+            dependencies[dep] for dep in DEPENDENCY_MODELS if dep in dependencies
+        ],
+    )
+    for string, model, prop in placeholders:
+        value = get_value_for_model(model, prop, dependencies, resolver=resolver)
         if value:
             variables = variables.replace(string, str(value))
 
@@ -629,11 +963,17 @@ def process_dependencies(
     return {**variables, **dependencies}
 
 
-def get_value_for_model(model: str, prop: str, dependencies: Dict[str, Any]) -> Any:
+def get_value_for_model(
+    model: str,
+    prop: str,
+    dependencies: Dict[str, Any],
+    resolver: Optional[DbValueResolver] = None,
+) -> Any:
+    lookup = resolver.get_db_value if resolver else get_db_value
     if model == "global":
-        return get_db_value(string=f"{model}.{prop}")
+        return lookup(string=f"{model}.{prop}")
     instance = dependencies.get(model)
-    return get_db_value(string=prop, instance=instance) if instance else None
+    return lookup(string=prop, instance=instance) if instance else None
 
 
 def process_chart_variables(*, variables: Dict[str, Any]) -> Dict[str, Any]:
@@ -695,21 +1035,9 @@ def generate_chart(
     traces: Optional[Dict[str, Any]] = None,
     layout: Optional[Dict[str, Any]] = None,
 ) -> str:
-    # TODO figure out why plotly affects perf
-    import plotly.express as px
-
-    fig = getattr(px, type)(**options)
-
-    if traces:
-        fig.update_traces(**traces)
-
-    if layout:
-        fig.update_layout(**layout)
-
-    if format == "html":
-        return cast(str, fig.to_html(full_html=False, include_plotlyjs="cdn"))
-    elif format == "image":
-        return cast(str, fig.to_image(format="svg").decode("utf-8"))
+    return render_chart(
+        type=type, format=format, options=options, traces=traces, layout=layout
+    )
 
 
 def create_report_history(
@@ -718,12 +1046,14 @@ def create_report_history(
     report_data: str,
     error_data: Optional[str],
     user: str,
+    timings: Optional[Dict[str, float]] = None,
 ) -> "ReportHistory":
     return ReportHistory.objects.create(
         report_template=template,
         report_data=report_data,
         error_data=error_data,
         run_by=user,
+        timings=timings or {},
     )
 
 
@@ -733,8 +1063,10 @@ def run_report(
     dependencies: Dict[str, int],
     format: Literal["html", "pdf", "plaintext"],
     user: Optional["User"] = None,
+    data_source_cache: Optional[DataSourceCache] = None,
 ) -> Tuple[Optional[str] | bytes, Optional[str], "ReportHistory"]:
     error_text = ""
+    timings: Dict[str, float] = {}
     try:
         html_report, _ = generate_html(
             template=template.template_md,
@@ -746,6 +1078,8 @@ def run_report(
             variables=template.template_variables,
             dependencies=dependencies,
             user=user,
+            data_source_cache=data_source_cache,
+            timings=timings,
         )
 
         html_report = normalize_asset_url(html_report, format)
@@ -754,12 +1088,18 @@ def run_report(
             report_data=html_report,
             user=user.username if user else "system",
             error_data=None,
+            timings=timings,
         )
 
         if format != "pdf":
             return html_report, None, history
         else:
+            start = time.perf_counter()
             pdf_bytes = generate_pdf(html=html_report)
+            timings["pdf"] = round(time.perf_counter() - start, 3)
+
+            ReportHistory.objects.filter(pk=history.pk).update(timings=timings)
+            history.timings = timings
             return pdf_bytes, None, history
     except TemplateError as error:
         if hasattr(error, "lineno"):
@@ -776,6 +1116,7 @@ def run_report(
         report_data="",
         error_data=error_text,
         user=user.username if user else "system",
+        timings=timings,
     )
     return None, error_text, history
 
@@ -788,6 +1129,7 @@ def run_scheduled_report(
     *,
     schedule: "ReportSchedule",
     user: Optional["User"] = None,
+    data_source_cache: Optional[DataSourceCache] = None,
 ) -> Tuple["ReportHistory", Optional[str]]:
 
     report, error, history = run_report(
@@ -795,6 +1137,7 @@ def run_scheduled_report(
         dependencies=schedule.dependencies,
         format=schedule.format,
         user=user,
+        data_source_cache=data_source_cache,
     )
     schedule.last_run = djangotime.now()
     schedule.save(update_fields=["last_run"])
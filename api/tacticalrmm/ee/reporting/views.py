@@ -4,6 +4,7 @@ This file is subject to the EE License Agreement.
 For details, see: https://license.tacticalrmm.com/ee
 """
 
+import copy
 import json
 import os
 import shutil
@@ -13,14 +14,21 @@ from typing import Any, Dict, List, Literal, Optional, Union
 import requests
 from django.conf import settings as djangosettings
 from django.core.exceptions import (
+    FieldError,
     ObjectDoesNotExist,
     PermissionDenied,
     SuspiciousFileOperation,
 )
 from django.core.files.base import ContentFile
 from django.db import transaction
-from django.http import FileResponse, HttpResponse, JsonResponse
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
+from django.utils.http import content_disposition_header
 from jinja2.exceptions import TemplateError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.request import Request
@@ -53,6 +61,8 @@ from .models import (
 from .permissions import GenerateReportPerms, ReportingPerms
 from .storage import report_assets_fs
 from .utils import (
+    InvalidDBOperationException,
+    ResolveModelException,
     _import_assets,
     _import_base_template,
     _import_report_template,
@@ -62,8 +72,10 @@ from .utils import (
     generate_pdf,
     normalize_asset_url,
     prep_variables_for_template,
+    resolve_model,
     run_report,
     run_scheduled_report,
+    stream_data_source,
 )
 
 
@@ -452,6 +464,7 @@ class ReportHistorySerializer(ModelSerializer):
             "run_by",
             "error_data",
             "date_created",
+            "timings",
         ]
 
 
@@ -1005,6 +1018,41 @@ class GetEditDeleteReportDataQuery(APIView):
         return Response()
 
 
+class ExportReportDataQuery(APIView):
+    permission_classes = [IsAuthenticated, ReportingPerms]
+
+    def get(self, request: Request, pk: int) -> Union[Response, StreamingHttpResponse]:
+        query = get_object_or_404(ReportDataQuery, pk=pk)
+
+        # "format" is reserved by drf for content negotiation
+        format = request.query_params.get("type", "csv")
+        if format not in ("csv", "ndjson"):
+            return notify_error("Export format is incorrect.")
+
+        try:
+            data_source = resolve_model(data_source=copy.deepcopy(query.json_query))
+            content = stream_data_source(
+                data_source=data_source, format=format, user=request.user
+            )
+        except (
+            ResolveModelException,
+            InvalidDBOperationException,
+            FieldError,
+            ValueError,
+            TypeError,
+        ) as e:
+            return notify_error(str(e))
+
+        response = StreamingHttpResponse(
+            content,
+            content_type="text/csv" if format == "csv" else "application/x-ndjson",
+        )
+        response["Content-Disposition"] = content_disposition_header(
+            as_attachment=True, filename=f"{query.name}.{format}"
+        )
+        return response
+
+
 class NginxRedirect(APIView):
     permission_classes = (AllowAny,)
 
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.25 on 2026-10-19 09:21
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the log tables can be large, build the indexes without locking out writes
+    atomic = False
+
+    dependencies = [
+        ('logs', '0025_alter_auditlog_id_alter_debuglog_id_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='auditlog',
+            index=models.Index(fields=['-entry_time', '-id'], name='logs_auditl_entry_t_532db5_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='auditlog',
+            index=models.Index(fields=['username', '-entry_time'], name='logs_auditl_usernam_26b980_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='auditlog',
+            index=models.Index(fields=['action', '-entry_time'], name='logs_auditl_action_b8663b_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='auditlog',
+            index=models.Index(fields=['object_type', '-entry_time'], name='logs_auditl_object__ad358f_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='auditlog',
+            index=models.Index(fields=['agent_id', '-entry_time'], name='logs_auditl_agent_i_493489_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='debuglog',
+            index=models.Index(fields=['-entry_time', '-id'], name='logs_debugl_entry_t_7c2b73_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='debuglog',
+            index=models.Index(fields=['agent', '-entry_time'], name='logs_debugl_agent_i_ff42aa_idx'),
+        ),
+    ]
@@ -1,5 +1,16 @@
+import copy
 from abc import abstractmethod
-from typing import TYPE_CHECKING, Any, Dict, Literal, Optional, Tuple, Union, cast
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Literal,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 
 from django.db import models
 
@@ -25,7 +36,21 @@ def get_debug_level() -> str:
     return get_core_settings().agent_debug_level
 
 
+def _loaded_value(value: Any) -> Any:
+    # json and array values are copied so changes made in place can be detected
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
 class AuditLog(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["-entry_time", "-id"]),
+            models.Index(fields=["username", "-entry_time"]),
+            models.Index(fields=["action", "-entry_time"]),
+            models.Index(fields=["object_type", "-entry_time"]),
+            models.Index(fields=["agent_id", "-entry_time"]),
+        ]
+
     id = models.BigAutoField(primary_key=True)
     username = models.CharField(max_length=255)
     agent = models.CharField(max_length=255, null=True, blank=True)
@@ -42,19 +67,34 @@ class AuditLog(models.Model):
         return f"{self.username} {self.action} {self.object_type}"
 
     def save(self, *args: Any, **kwargs: Any) -> None:
-        if not self.pk and self.message:
-            # truncate message field if longer than 255 characters
-            self.message = (
-                (self.message[:253] + "..") if len(self.message) > 255 else self.message
-            )
+        if not self.pk:
+            self.truncate_message()
 
         return super().save(*args, **kwargs)
 
+    def truncate_message(self) -> None:
+        # truncate message field if longer than 255 characters
+        if self.message and len(self.message) > 255:
+            self.message = self.message[:253] + ".."
+
+    @classmethod
+    def _write(cls, **kwargs: Any) -> None:
+        from .sink import log_sink, log_sink_enabled
+
+        if not log_sink_enabled():
+            cls.objects.create(**kwargs)
+            return
+
+        entry = cls(**kwargs)
+        # bulk_create skips save()
+        entry.truncate_message()
+        log_sink.add(entry)
+
     @staticmethod
     def audit_mesh_session(
         username: str, agent: "Agent", debug_info: Dict[Any, Any] = {}
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             agent=agent.hostname,
             agent_id=agent.agent_id,
@@ -72,7 +112,7 @@ class AuditLog(models.Model):
         shell: str,
         debug_info: Dict[Any, Any] = {},
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             agent=agent.hostname,
             agent_id=agent.agent_id,
@@ -92,7 +132,7 @@ class AuditLog(models.Model):
         name: str = "",
         debug_info: Dict[Any, Any] = {},
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             object_type=object_type,
             agent=before["hostname"] if object_type == AuditObjType.AGENT else None,
@@ -112,7 +152,7 @@ class AuditLog(models.Model):
         name: str = "",
         debug_info: Dict[Any, Any] = {},
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             object_type=object_type,
             agent=after["hostname"] if object_type == AuditObjType.AGENT else None,
@@ -131,7 +171,7 @@ class AuditLog(models.Model):
         name: str = "",
         debug_info: Dict[Any, Any] = {},
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             object_type=object_type,
             agent=before["hostname"] if object_type == AuditObjType.AGENT else None,
@@ -149,7 +189,7 @@ class AuditLog(models.Model):
         agent: Optional["Agent"],
         debug_info: Dict[Any, Any] = {},
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             agent=agent.hostname if agent else "Tactical RMM Server",
             agent_id=agent.agent_id if agent else "N/A",
             username=username,
@@ -168,7 +208,7 @@ class AuditLog(models.Model):
         debug_info: dict[Any, Any] = {},
     ) -> None:
 
-        AuditLog.objects.create(
+        AuditLog._write(
             agent=agent.hostname if agent else "Tactical RMM Server",
             agent_id=agent.agent_id if agent else "N/A",
             username=username,
@@ -182,7 +222,7 @@ class AuditLog(models.Model):
 
     @staticmethod
     def audit_user_failed_login(username: str, debug_info: Dict[Any, Any] = {}) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             object_type=AuditObjType.USER,
             action=AuditActionType.FAILED_LOGIN,
@@ -194,7 +234,7 @@ class AuditLog(models.Model):
     def audit_user_failed_twofactor(
         username: str, debug_info: Dict[Any, Any] = {}
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             object_type=AuditObjType.USER,
             action=AuditActionType.FAILED_LOGIN,
@@ -206,7 +246,7 @@ class AuditLog(models.Model):
     def audit_user_login_successful(
         username: str, debug_info: Dict[Any, Any] = {}
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             object_type=AuditObjType.USER,
             action=AuditActionType.LOGIN,
@@ -218,7 +258,7 @@ class AuditLog(models.Model):
     def audit_user_login_successful_sso(
         username: str, provider: str, debug_info: Dict[Any, Any] = {}
     ) -> None:
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             object_type=AuditObjType.USER,
             action=AuditActionType.LOGIN,
@@ -237,7 +277,7 @@ class AuditLog(models.Model):
 
         name = instance.hostname if isinstance(instance, Agent) else instance.name
         classname = type(instance).__name__
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             agent=name if isinstance(instance, Agent) else None,
             agent_id=instance.agent_id if isinstance(instance, Agent) else None,
@@ -279,7 +319,7 @@ class AuditLog(models.Model):
         else:
             name = "None"
         classname = type(instance).__name__
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             agent=name if isinstance(instance, Agent) else None,
             agent_id=instance.agent_id if isinstance(instance, Agent) else None,
@@ -324,7 +364,7 @@ class AuditLog(models.Model):
         if agents:
             affected["agent_hostnames"] = list(agents)
 
-        AuditLog.objects.create(
+        AuditLog._write(
             username=username,
             object_type=AuditObjType.BULK,
             action=AuditActionType.BULK_ACTION,
@@ -335,6 +375,14 @@ class AuditLog(models.Model):
 
 
 class DebugLog(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["-entry_time", "-id"]),
+            # log_level and log_type have only a few values and debug logs are
+            # written constantly, filters on them use the entry_time scan
+            models.Index(fields=["agent", "-entry_time"]),
+        ]
+
     objects = PermissionQuerySet.as_manager()
 
     id = models.BigAutoField(primary_key=True)
@@ -354,6 +402,16 @@ class DebugLog(models.Model):
     )
     message = models.TextField(null=True, blank=True)
 
+    @classmethod
+    def _write(cls, **kwargs: Any) -> None:
+        from .sink import log_sink, log_sink_enabled
+
+        if not log_sink_enabled():
+            cls.objects.create(**kwargs)
+            return
+
+        log_sink.add(cls(**kwargs))
+
     @classmethod
     def info(
         cls,
@@ -362,7 +420,7 @@ class DebugLog(models.Model):
         log_type: str = DebugLogType.SYSTEM_ISSUES,
     ) -> None:
         if get_debug_level() == DebugLogLevel.INFO:
-            cls.objects.create(
+            cls._write(
                 log_level=DebugLogLevel.INFO,
                 agent=agent,
                 log_type=log_type,
@@ -377,7 +435,7 @@ class DebugLog(models.Model):
         log_type: str = DebugLogType.SYSTEM_ISSUES,
     ) -> None:
         if get_debug_level() in (DebugLogLevel.INFO, DebugLogLevel.WARN):
-            cls.objects.create(
+            cls._write(
                 log_level=DebugLogLevel.INFO,
                 agent=agent,
                 log_type=log_type,
@@ -396,7 +454,7 @@ class DebugLog(models.Model):
             DebugLogLevel.WARN,
             DebugLogLevel.ERROR,
         ):
-            cls.objects.create(
+            cls._write(
                 log_level=DebugLogLevel.ERROR,
                 agent=agent,
                 log_type=log_type,
@@ -416,7 +474,7 @@ class DebugLog(models.Model):
             DebugLogLevel.ERROR,
             DebugLogLevel.CRITICAL,
         ):
-            cls.objects.create(
+            cls._write(
                 log_level=DebugLogLevel.CRITICAL,
                 agent=agent,
                 log_type=log_type,
@@ -491,16 +549,108 @@ class BaseAuditModel(models.Model):
     modified_by = models.CharField(max_length=255, null=True, blank=True)
     modified_time = models.DateTimeField(auto_now=True, null=True, blank=True)
 
+    # changes to these fields alone don't create an audit entry
+    AUDIT_IGNORED_FIELDS = (
+        "created_by",
+        "created_time",
+        "modified_by",
+        "modified_time",
+    )
+    # kept in audit payloads even when unchanged so the entry identifies the object
+    AUDIT_IDENTITY_FIELDS = ("id", "name", "hostname", "agent_id")
+
     @abstractmethod
     def serialize(class_name: models.Model) -> Dict[str, Any]:
         pass
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # keep the values as loaded, json and array values are copied since they
+        # can be changed in place
+        instance._loaded_values = {
+            attname: _loaded_value(value) for attname, value in zip(field_names, values)
+        }
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs) -> None:
+        super().refresh_from_db(*args, **kwargs)
+        if not kwargs.get("fields"):
+            self._snapshot_fields()
+
+    def _snapshot_fields(self, update_fields: Optional[Iterable[str]] = None) -> None:
+        deferred = self.get_deferred_fields()
+        if update_fields is None:
+            fields = self._meta.concrete_fields
+            self._loaded_values = {}
+        else:
+            # only the saved fields are in the database now, the others keep
+            # their loaded values
+            fields = [self._meta.get_field(name) for name in update_fields]
+            self._loaded_values = getattr(self, "_loaded_values", None) or {}
+
+        for field in fields:
+            if field.attname not in deferred:
+                self._loaded_values[field.attname] = _loaded_value(
+                    getattr(self, field.attname)
+                )
+
+    def get_dirty_fields(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the loaded values of the audited fields changed since the instance
+        was loaded, or None if the instance wasn't loaded from the database.
+        Fields that were deferred when loading and have been set or loaded since
+        are returned as DEFERRED since their old value isn't known.
+        """
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None:
+            return None
+
+        deferred = self.get_deferred_fields()
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            attname = field.attname
+            if attname in self.AUDIT_IGNORED_FIELDS or attname in deferred:
+                continue
+
+            if attname not in loaded:
+                dirty[attname] = models.DEFERRED
+            elif getattr(self, attname) != loaded[attname]:
+                dirty[attname] = loaded[attname]
+
+        return dirty
+
+    def get_old_model(self) -> Optional[models.Model]:
+        """
+        Returns the instance as it was loaded from the database, built from the
+        loaded values when possible instead of fetching the row again.
+        """
+        if not self.pk:
+            return None
+
+        dirty_fields = self.get_dirty_fields()
+        if dirty_fields is None or models.DEFERRED in dirty_fields.values():
+            return type(self).objects.get(pk=self.pk)
+
+        return self._loaded_copy(dirty_fields)
+
+    def _loaded_copy(self, dirty_fields: Dict[str, Any]) -> models.Model:
+        old_model = copy.copy(self)
+        old_model._state = copy.copy(self._state)
+        old_model._state.fields_cache = {
+            name: value
+            for name, value in self._state.fields_cache.items()
+            if f"{name}_id" not in dirty_fields
+        }
+        for attname, value in dirty_fields.items():
+            setattr(old_model, attname, value)
+        return old_model
+
     def save(self, old_model: Optional[models.Model] = None, *args, **kwargs) -> None:
         username = get_username()
         if username:
             object_class = type(self)
             object_name = object_class.__name__.lower()
-            after_value = object_class.serialize(self)
 
             # populate created_by and modified_by fields on instance
             if not getattr(self, "created_by", None):
@@ -513,29 +663,43 @@ class BaseAuditModel(models.Model):
                 AuditLog.audit_object_add(
                     username,
                     object_name,
-                    after_value,
+                    object_class.serialize(self),
                     self.__str__(),
                     debug_info=get_debug_info(),
                 )
             else:
-                if old_model:
-                    before_value = object_class.serialize(old_model)
-                else:
-                    before_value = object_class.serialize(
-                        object_class.objects.get(pk=self.pk)
-                    )
+                dirty_fields = self.get_dirty_fields()
+
+                # nothing audited changed since the instance was loaded
+                if dirty_fields == {}:
+                    super().save(*args, **kwargs)
+                    self._snapshot_fields(kwargs.get("update_fields"))
+                    return
+
+                if not old_model:
+                    old_model = self.get_old_model()
+
+                before_value = object_class.serialize(old_model)
+                after_value = object_class.serialize(self)
                 # only create an audit entry if the values have changed
                 if before_value != after_value and username:
+                    changed = [
+                        key
+                        for key in after_value.keys() | before_value.keys()
+                        if before_value.get(key) != after_value.get(key)
+                        or key in self.AUDIT_IDENTITY_FIELDS
+                    ]
                     AuditLog.audit_object_changed(
                         username,
                         object_class.__name__.lower(),
-                        before_value,
-                        after_value,
+                        {key: before_value.get(key) for key in changed},
+                        {key: after_value.get(key) for key in changed},
                         self.__str__(),
                         debug_info=get_debug_info(),
                     )
 
         super().save(*args, **kwargs)
+        self._snapshot_fields(kwargs.get("update_fields"))
 
     def delete(self, *args, **kwargs) -> Tuple[int, Dict[str, int]]:
         super().delete(*args, **kwargs)
@@ -0,0 +1,93 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple, Union
+
+from django.db import connection
+from django.db.models import Q, QuerySet
+
+# above this many rows totals come from the query planner instead of COUNT(*)
+COUNT_ESTIMATE_THRESHOLD = 10000
+
+
+def encode_cursor(value: Union[datetime, int], pk: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Union[datetime, int], int]:
+    # raises ValueError on a malformed cursor
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if isinstance(value, str):
+            return datetime.fromisoformat(value), int(pk)
+
+        return int(value), int(pk)
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_page(
+    queryset: QuerySet,
+    *,
+    cursor: Optional[str],
+    page_size: int,
+    descending: bool,
+    field: str = "entry_time",
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Returns one page of queryset ordered by (field, id) starting after cursor,
+    and the cursor for the next page or None if this is the last page. field is
+    a datetime or integer field. Works on .values() querysets too, as long as
+    they include field and id.
+    """
+    if descending:
+        queryset = queryset.order_by(f"-{field}", "-id")
+    else:
+        queryset = queryset.order_by(field, "id")
+
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        if descending:
+            queryset = queryset.filter(
+                Q(**{f"{field}__lt": value}) | Q(**{field: value, "id__lt": pk})
+            )
+        else:
+            queryset = queryset.filter(
+                Q(**{f"{field}__gt": value}) | Q(**{field: value, "id__gt": pk})
+            )
+
+    rows = list(queryset[: page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    last = rows[page_size - 1]
+    if isinstance(last, dict):
+        return rows[:page_size], encode_cursor(last[field], last["id"])
+
+    return rows[:page_size], encode_cursor(getattr(last, field), last.pk)
+
+
+def approximate_count(
+    queryset: QuerySet, threshold: int = COUNT_ESTIMATE_THRESHOLD
+) -> Tuple[int, bool]:
+    """
+    Returns the number of rows in queryset and whether it is an estimate. Results
+    up to threshold rows are counted exactly, larger ones use the planner estimate.
+    """
+    queryset = queryset.order_by()
+    count = queryset[: threshold + 1].count()
+    if count <= threshold:
+        return count, False
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return max(int(plan[0]["Plan"]["Plan Rows"]), count), True
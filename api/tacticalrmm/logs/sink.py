@@ -0,0 +1,186 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Union
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from tacticalrmm.logger import logger
+
+if TYPE_CHECKING:
+    from .models import AuditLog, DebugLog
+
+    LogEntry = Union[AuditLog, DebugLog]
+
+
+class LogSink:
+    """
+    Buffers unsaved DebugLog and AuditLog rows in process and writes them with
+    bulk_create, either when batch_size rows are waiting or every flush_interval
+    seconds from a background thread.
+
+    Rows are written in the order they were added so logs for an agent keep their
+    order. Once max_backlog rows are waiting new debug rows are dropped and
+    counted, audit rows are written straight away instead. The counters are
+    logged as a warning at most every report_interval seconds while rows are
+    being dropped.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int,
+        flush_interval: float,
+        max_backlog: int,
+        report_interval: float = 300,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.report_interval = report_interval
+
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._buffer: "Deque[LogEntry]" = deque()
+        self._lock = threading.Lock()
+        # only one flush at a time so batches are written in order
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+        self.flushed = 0
+        self.overflowed = 0
+        self._reported_dropped = 0
+        self._last_report = 0.0
+
+    def _ensure_started(self) -> None:
+        # the buffer and thread don't survive forking into a celery pool process
+        if self._pid != os.getpid():
+            self._reset()
+
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="log-sink", daemon=True
+            )
+            self._thread.start()
+
+    def add(self, entry: "LogEntry") -> None:
+        from .models import AuditLog
+
+        with self._lock:
+            self._ensure_started()
+
+            if len(self._buffer) < self.max_backlog:
+                self._buffer.append(entry)
+                if len(self._buffer) >= self.batch_size:
+                    self._wakeup.set()
+                return
+
+            if not isinstance(entry, AuditLog):
+                self.dropped += 1
+                return
+
+            self.overflowed += 1
+
+        # audit rows are never dropped, write them outside the lock
+        entry.save()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self.report()
+            finally:
+                close_old_connections()
+
+    def _take(self) -> "List[LogEntry]":
+        with self._lock:
+            batch = [
+                self._buffer.popleft()
+                for _ in range(min(self.batch_size, len(self._buffer)))
+            ]
+        return batch
+
+    def flush(self) -> int:
+        written = 0
+        with self._flush_lock:
+            while batch := self._take():
+                written += self._write(batch)
+
+        return written
+
+    def _write(self, batch: "List[LogEntry]") -> int:
+        written = 0
+        # group consecutive rows of the same model to keep the overall order
+        start = 0
+        for i in range(1, len(batch) + 1):
+            if i == len(batch) or type(batch[i]) is not type(batch[start]):
+                chunk = batch[start:i]
+                try:
+                    with transaction.atomic():
+                        type(chunk[0]).objects.bulk_create(chunk)
+                    written += len(chunk)
+                except Exception:
+                    # e.g. the agent was deleted before the batch was written,
+                    # save what can be saved one row at a time
+                    for entry in chunk:
+                        try:
+                            with transaction.atomic():
+                                entry.save()
+                            written += 1
+                        except Exception:
+                            with self._lock:
+                                self.dropped += 1
+                start = i
+
+        with self._lock:
+            self.flushed += written
+        return written
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "backlog": len(self._buffer),
+                "dropped": self.dropped,
+                "flushed": self.flushed,
+                "overflowed": self.overflowed,
+            }
+
+    def report(self) -> bool:
+        # warns when rows were dropped since the last report
+        now = time.monotonic()
+        if now - self._last_report < self.report_interval:
+            return False
+
+        stats = self.stats()
+        if stats["dropped"] == self._reported_dropped:
+            return False
+
+        self._last_report = now
+        self._reported_dropped = stats["dropped"]
+        logger.warning(
+            f"Log sink dropped {stats['dropped']} rows, {stats['backlog']} rows waiting, "
+            f"{stats['overflowed']} audit rows written directly, {stats['flushed']} flushed"
+        )
+        return True
+
+
+log_sink = LogSink(
+    batch_size=getattr(settings, "LOG_SINK_BATCH_SIZE", 500),
+    flush_interval=getattr(settings, "LOG_SINK_FLUSH_INTERVAL", 2),
+    max_backlog=getattr(settings, "LOG_SINK_MAX_BACKLOG", 50000),
+    report_interval=getattr(settings, "LOG_SINK_REPORT_INTERVAL", 300),
+)
+
+atexit.register(log_sink.flush)
+
+
+def log_sink_enabled() -> bool:
+    return getattr(settings, "LOG_SINK_ENABLED", False)
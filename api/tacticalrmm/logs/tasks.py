@@ -1,15 +1,12 @@
-from django.utils import timezone as djangotime
-
 from tacticalrmm.celery import app
+from tacticalrmm.pruning import prune_older_than
 
 
 @app.task
 def prune_debug_log(older_than_days: int) -> str:
     from .models import DebugLog
 
-    DebugLog.objects.filter(
-        entry_time__lt=djangotime.now() - djangotime.timedelta(days=older_than_days)
-    ).delete()
+    prune_older_than(DebugLog, field="entry_time", older_than_days=older_than_days)
 
     return "ok"
 
@@ -18,8 +15,6 @@ def prune_debug_log(older_than_days: int) -> str:
 def prune_audit_log(older_than_days: int) -> str:
     from .models import AuditLog
 
-    AuditLog.objects.filter(
-        entry_time__lt=djangotime.now() - djangotime.timedelta(days=older_than_days)
-    ).delete()
+    prune_older_than(AuditLog, field="entry_time", older_than_days=older_than_days)
 
     return "ok"
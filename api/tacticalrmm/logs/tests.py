@@ -1,6 +1,8 @@
 from itertools import cycle
 from unittest.mock import patch
 
+from django.db.models import DEFERRED
+from django.test import override_settings
 from django.utils import timezone as djangotime
 from model_bakery import baker, seq
 
@@ -162,6 +164,44 @@ class TestAuditViews(TacticalTestCase):
 
         self.check_not_authenticated("patch", url)
 
+    def test_get_audit_logs_keyset(self):
+        from .models import AuditLog
+
+        url = "/logs/audit/"
+        self.create_audit_records()
+
+        pagination = {
+            "rowsPerPage": 25,
+            "cursor": None,
+            "sortBy": "entry_time",
+            "descending": True,
+        }
+
+        ids = []
+        while True:
+            resp = self.client.patch(url, {"pagination": pagination}, format="json")
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.data["total"], 86)  # type:ignore
+            self.assertFalse(resp.data["total_is_estimate"])  # type:ignore
+            ids += [log["id"] for log in resp.data["audit_logs"]]  # type:ignore
+
+            if not resp.data["next_cursor"]:  # type:ignore
+                break
+            pagination["cursor"] = resp.data["next_cursor"]  # type:ignore
+
+        self.assertEqual(
+            ids,
+            list(
+                AuditLog.objects.order_by("-entry_time", "-id").values_list(
+                    "id", flat=True
+                )
+            ),
+        )
+
+        pagination["cursor"] = "invalid"
+        resp = self.client.patch(url, {"pagination": pagination}, format="json")
+        self.assertEqual(resp.status_code, 400)
+
     def test_get_pending_actions(self):
         url = "/logs/pendingactions/"
         agent1 = baker.make_recipe("agents.online_agent")
@@ -238,6 +278,42 @@ class TestAuditViews(TacticalTestCase):
 
         self.check_not_authenticated("delete", url)
 
+    def test_get_debug_log_keyset(self):
+        url = "/logs/debug/"
+        baker.make("logs.DebugLog", log_level=DebugLogLevel.ERROR, _quantity=30)
+
+        resp = self.client.patch(
+            url, {"pagination": {"rowsPerPage": 20, "cursor": None}}, format="json"
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["debug_logs"]), 20)  # type:ignore
+        self.assertEqual(resp.data["total"], 30)  # type:ignore
+
+        resp = self.client.patch(
+            url,
+            {
+                "pagination": {
+                    "rowsPerPage": 20,
+                    "cursor": resp.data["next_cursor"],  # type:ignore
+                }
+            },
+            format="json",
+        )
+        self.assertEqual(len(resp.data["debug_logs"]), 10)  # type:ignore
+        self.assertIsNone(resp.data["next_cursor"])  # type:ignore
+
+    def test_approximate_count(self):
+        from .models import DebugLog
+        from .pagination import approximate_count
+
+        baker.make("logs.DebugLog", _quantity=10)
+
+        self.assertEqual(approximate_count(DebugLog.objects.all()), (10, False))
+
+        total, estimated = approximate_count(DebugLog.objects.all(), threshold=5)
+        self.assertTrue(estimated)
+        self.assertGreaterEqual(total, 6)
+
     def test_get_debug_log(self):
         url = "/logs/debug/"
 
@@ -520,3 +596,209 @@ class TestLogTasks(TacticalTestCase):
         prune_audit_log(30)
 
         self.assertEqual(AuditLog.objects.count(), 6)
+
+
+class TestLogSink(TacticalTestCase):
+    def setUp(self):
+        from .sink import LogSink
+
+        # long interval so the background thread never flushes during the test
+        self.setup_coresettings()
+        self.sink = LogSink(batch_size=100, flush_interval=3600, max_backlog=5)
+
+    def test_flush_keeps_order(self):
+        from .models import AuditLog, DebugLog
+
+        agent = baker.make_recipe("agents.agent")
+        for i in range(4):
+            self.sink.add(DebugLog(agent=agent, message=f"debug {i}"))
+        self.sink.add(AuditLog(username="user", message="a" * 300))
+
+        self.assertEqual(DebugLog.objects.count(), 0)
+        self.assertEqual(self.sink.flush(), 5)
+
+        self.assertEqual(
+            list(DebugLog.objects.order_by("id").values_list("message", flat=True)),
+            [f"debug {i}" for i in range(4)],
+        )
+        self.assertEqual(AuditLog.objects.count(), 1)
+        self.assertEqual(
+            self.sink.stats(),
+            {"backlog": 0, "dropped": 0, "flushed": 5, "overflowed": 0},
+        )
+
+    def test_drops_when_backlog_full(self):
+        from .models import DebugLog
+
+        for i in range(7):
+            self.sink.add(DebugLog(message=f"debug {i}"))
+
+        self.assertEqual(
+            self.sink.stats(),
+            {"backlog": 5, "dropped": 2, "flushed": 0, "overflowed": 0},
+        )
+
+    def test_audit_rows_are_written_when_backlog_full(self):
+        from .models import AuditLog, DebugLog
+
+        for i in range(5):
+            self.sink.add(DebugLog(message=f"debug {i}"))
+        self.sink.add(AuditLog(username="user", message="audit"))
+
+        self.assertEqual(AuditLog.objects.count(), 1)
+        self.assertEqual(DebugLog.objects.count(), 0)
+        self.assertEqual(
+            self.sink.stats(),
+            {"backlog": 5, "dropped": 0, "flushed": 0, "overflowed": 1},
+        )
+
+    def test_report_warns_on_new_drops(self):
+        from .models import DebugLog
+
+        self.sink.report_interval = 0
+        self.assertFalse(self.sink.report())
+
+        for i in range(6):
+            self.sink.add(DebugLog(message=f"debug {i}"))
+
+        with patch("logs.sink.logger.warning") as warning:
+            self.assertTrue(self.sink.report())
+            self.assertFalse(self.sink.report())
+
+        warning.assert_called_once()
+        self.assertIn("dropped 1 rows", warning.call_args[0][0])
+
+    def test_failed_rows_are_dropped(self):
+        from .models import DebugLog
+
+        agent = baker.make_recipe("agents.agent")
+        self.sink.add(DebugLog(message="kept"))
+        self.sink.add(DebugLog(agent=agent, message="lost"))
+        agent.delete()
+
+        with patch.object(DebugLog, "save", side_effect=Exception):
+            with patch.object(DebugLog.objects, "bulk_create", side_effect=Exception):
+                self.sink.flush()
+
+        self.assertEqual(self.sink.stats()["dropped"], 2)
+
+    @override_settings(LOG_SINK_ENABLED=True)
+    def test_logs_are_buffered_when_enabled(self):
+        from .models import AuditLog, DebugLog
+
+        with patch("logs.sink.log_sink", self.sink):
+            DebugLog.error(message="buffered")
+            AuditLog.audit_user_failed_login(username="user")
+
+        self.assertEqual(DebugLog.objects.count(), 0)
+        self.assertEqual(AuditLog.objects.count(), 0)
+        self.assertEqual(self.sink.stats()["backlog"], 2)
+
+
+@patch("logs.models.get_username", return_value="user")
+class TestAuditModelSave(TacticalTestCase):
+    def setUp(self):
+        from scripts.models import Script
+
+        self.script = baker.make(
+            "scripts.Script", name="script", args=["-one"], category="cat"
+        )
+        # loaded during a request
+        with patch("logs.models.get_username", return_value="user"):
+            self.script = Script.objects.get(pk=self.script.pk)
+
+    def test_unchanged_save_skips_audit(self, get_username):
+        from .models import AuditLog
+
+        # only the update, no refetch of the old row
+        with self.assertNumQueries(1):
+            self.script.save()
+
+        self.assertEqual(AuditLog.objects.count(), 0)
+
+    def test_changed_save_audits_changed_fields(self, get_username):
+        from .models import AuditLog
+
+        self.script.name = "renamed"
+        self.script.save()
+
+        log = AuditLog.objects.get()
+        self.assertEqual(log.before_value, {"id": self.script.pk, "name": "script"})
+        self.assertEqual(log.after_value, {"id": self.script.pk, "name": "renamed"})
+
+        # the snapshot is refreshed after saving
+        self.script.save()
+        self.assertEqual(AuditLog.objects.count(), 1)
+
+    def test_in_place_changes_are_audited(self, get_username):
+        from .models import AuditLog
+
+        self.script.args.append("-two")
+        self.script.save()
+
+        log = AuditLog.objects.get()
+        self.assertEqual(
+            log.before_value, {"id": self.script.pk, "name": "script", "args": ["-one"]}
+        )
+        self.assertEqual(
+            log.after_value,
+            {"id": self.script.pk, "name": "script", "args": ["-one", "-two"]},
+        )
+
+    def test_in_place_changes_outside_requests_are_audited(self, get_username):
+        from scripts.models import Script
+
+        from .models import AuditLog
+
+        # loaded outside a request, saved during one
+        get_username.return_value = None
+        script = Script.objects.get(pk=self.script.pk)
+        script.args.append("-two")
+
+        get_username.return_value = "user"
+        script.save()
+
+        log = AuditLog.objects.get()
+        self.assertEqual(log.before_value["args"], ["-one"])
+        self.assertEqual(log.after_value["args"], ["-one", "-two"])
+
+    def test_update_fields_only_snapshots_saved_fields(self, get_username):
+        from .models import AuditLog
+
+        self.script.name = "renamed"
+        self.script.category = "new cat"
+        self.script.save(update_fields=["name"])
+        self.assertEqual(self.script.get_dirty_fields(), {"category": "cat"})
+
+        # the unsaved change is still audited on the next save
+        self.script.save()
+        log = AuditLog.objects.last()
+        self.assertEqual(log.before_value["category"], "cat")
+        self.assertEqual(log.after_value["category"], "new cat")
+
+    def test_loaded_deferred_fields_are_compared_with_db(self, get_username):
+        from scripts.models import Script
+
+        from .models import AuditLog
+
+        script = Script.objects.only("id", "name").get(pk=self.script.pk)
+        script.category = "new cat"
+        self.assertEqual(script.get_dirty_fields(), {"category": DEFERRED})
+
+        script.save()
+
+        log = AuditLog.objects.get()
+        self.assertEqual(log.before_value["category"], "cat")
+        self.assertEqual(log.after_value["category"], "new cat")
+
+    def test_unloaded_instance_is_compared_with_db(self, get_username):
+        from scripts.models import Script
+
+        from .models import AuditLog
+
+        script = Script(pk=self.script.pk, name="new", category="cat", args=["-one"])
+        script.save()
+
+        log = AuditLog.objects.get()
+        self.assertEqual(log.before_value["name"], "script")
+        self.assertEqual(log.after_value["name"], "new")
@@ -17,6 +17,7 @@ from tacticalrmm.permissions import _audit_log_filter, _has_perm_on_agent
 from tacticalrmm.utils import get_default_timezone
 
 from .models import AuditLog, DebugLog, PendingAction
+from .pagination import approximate_count, keyset_page
 from .permissions import AuditLogPerms, DebugLogPerms, PendingActionPerms
 from .serializers import AuditLogSerializer, DebugLogSerializer, PendingActionSerializer
 
@@ -76,11 +77,33 @@ class GetAuditLogs(APIView):
             .filter(objectFilter)
             .filter(timeFilter)
             .filter(_audit_log_filter(request.user))
-        ).order_by(order_by)
-
-        paginator = Paginator(audit_logs, pagination["rowsPerPage"])
+        )
         ctx = {"default_tz": get_default_timezone()}
 
+        # keyset pagination on (entry_time, id), avoids the offset scan on deep pages
+        if "cursor" in pagination:
+            try:
+                rows, next_cursor = keyset_page(
+                    audit_logs,
+                    cursor=pagination["cursor"],
+                    page_size=pagination["rowsPerPage"],
+                    descending=pagination["descending"],
+                )
+            except ValueError as e:
+                return notify_error(str(e))
+
+            total, estimated = approximate_count(audit_logs)
+            return Response(
+                {
+                    "audit_logs": AuditLogSerializer(rows, many=True, context=ctx).data,
+                    "next_cursor": next_cursor,
+                    "total": total,
+                    "total_is_estimate": estimated,
+                }
+            )
+
+        paginator = Paginator(audit_logs.order_by(order_by), pagination["rowsPerPage"])
+
         return Response(
             {
                 "audit_logs": AuditLogSerializer(
@@ -162,6 +185,29 @@ class GetDebugLog(APIView):
         )
 
         ctx = {"default_tz": get_default_timezone()}
+
+        if "pagination" in request.data:
+            pagination = request.data["pagination"]
+            try:
+                rows, next_cursor = keyset_page(
+                    debug_logs,
+                    cursor=pagination.get("cursor"),
+                    page_size=pagination["rowsPerPage"],
+                    descending=pagination.get("descending", True),
+                )
+            except ValueError as e:
+                return notify_error(str(e))
+
+            total, estimated = approximate_count(debug_logs)
+            return Response(
+                {
+                    "debug_logs": DebugLogSerializer(rows, many=True, context=ctx).data,
+                    "next_cursor": next_cursor,
+                    "total": total,
+                    "total_is_estimate": estimated,
+                }
+            )
+
         ret = DebugLogSerializer(
             debug_logs.order_by("-entry_time")[0:1000], many=True, context=ctx
         ).data
@@ -1,16 +1,29 @@
 import hashlib
 import hmac
 import re
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
 
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.db.models.fields import CharField, TextField
 
 from logs.models import BaseAuditModel
 from tacticalrmm.constants import ScriptShell, ScriptType
 from tacticalrmm.utils import replace_arg_db_values
 
+if TYPE_CHECKING:
+    from tacticalrmm.utils import DbValueResolver
+
+# pattern to match for injection
+RE_SCRIPT_PLACEHOLDER = re.compile(".*\\{\\{(.*)\\}\\}.*")
+RE_SCRIPT_PLACEHOLDER_SUB = re.compile("\\{\\{.*\\}\\}")
+
+
+def clear_check_plans() -> None:
+    # once committed, otherwise a check runner request could cache the old plan
+    transaction.on_commit(lambda: cache.delete_many_pattern("agent_*_runner_checks"))
+
 
 class Script(BaseAuditModel):
     guid = models.CharField(max_length=64, null=True, blank=True)
@@ -51,6 +64,14 @@ class Script(BaseAuditModel):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        changed = self.get_dirty_fields() != {}
+        super().save(*args, **kwargs)
+
+        # script checks are sent to agents from their cached check plans
+        if changed and self.script.exists():  # type: ignore
+            clear_check_plans()
+
     @property
     def code_no_snippets(self):
         return self.script_body or ""
@@ -62,13 +83,19 @@ class Script(BaseAuditModel):
     @classmethod
     def replace_with_snippets(cls, code):
         # check if snippet has been added to script body
-        matches = re.finditer(r"{{(.*)}}", code)
+        matches = list(re.finditer(r"{{(.*)}}", code))
         if matches:
+            # fetch all the referenced snippets in one query
+            snippets = dict(
+                ScriptSnippet.objects.filter(
+                    name__in={snippet.group(1).strip() for snippet in matches}
+                ).values_list("name", "code")
+            )
             replaced_code = code
             for snippet in matches:
                 snippet_name = snippet.group(1).strip()
-                if ScriptSnippet.objects.filter(name=snippet_name).exists():
-                    value = ScriptSnippet.objects.get(name=snippet_name).code
+                if snippet_name in snippets:
+                    value = snippets[snippet_name]
                     replaced_code = re.sub(
                         snippet.group(), value.replace("\\", "\\\\"), replaced_code
                     )
@@ -200,19 +227,31 @@ class Script(BaseAuditModel):
 
         return ScriptSerializer(script).data
 
+    @staticmethod
+    def get_placeholders(values: List[str]) -> List[str]:
+        # returns the db value placeholders used in a list of args or env vars
+        return [
+            match.group(1)
+            for value in values
+            if (match := RE_SCRIPT_PLACEHOLDER.match(value))
+        ]
+
     @classmethod
     # TODO refactor common functionality of parse functions
-    def parse_script_args(cls, agent, shell: str, args: List[str] = []) -> list:
+    def parse_script_args(
+        cls,
+        agent,
+        shell: str,
+        args: List[str] = [],
+        resolver: "Optional[DbValueResolver]" = None,
+    ) -> list:
         if not args:
             return []
 
         temp_args = []
 
-        # pattern to match for injection
-        pattern = re.compile(".*\\{\\{(.*)\\}\\}.*")
-
         for arg in args:
-            if match := pattern.match(arg):
+            if match := RE_SCRIPT_PLACEHOLDER.match(arg):
                 # only get the match between the () in regex
                 string = match.group(1)
                 value = replace_arg_db_values(
@@ -220,14 +259,15 @@ class Script(BaseAuditModel):
                     instance=agent,
                     shell=shell,
                     quotes=shell != ScriptShell.CMD,
+                    resolver=resolver,
                 )
 
                 if value:
                     try:
-                        temp_args.append(re.sub("\\{\\{.*\\}\\}", value, arg))
+                        temp_args.append(RE_SCRIPT_PLACEHOLDER_SUB.sub(value, arg))
                     except re.error:
                         temp_args.append(
-                            re.sub("\\{\\{.*\\}\\}", re.escape(value), arg)
+                            RE_SCRIPT_PLACEHOLDER_SUB.sub(re.escape(value), arg)
                         )
                 else:
                     # pass parameter unaltered
@@ -240,12 +280,17 @@ class Script(BaseAuditModel):
 
     @classmethod
     # TODO refactor common functionality of parse functions
-    def parse_script_env_vars(cls, agent, shell: str, env_vars: list[str] = []) -> list:
+    def parse_script_env_vars(
+        cls,
+        agent,
+        shell: str,
+        env_vars: list[str] = [],
+        resolver: "Optional[DbValueResolver]" = None,
+    ) -> list:
         if not env_vars:
             return []
 
         temp_env_vars = []
-        pattern = re.compile(".*\\{\\{(.*)\\}\\}.*")
         for env_var in env_vars:
             # must be in format KEY=VALUE
             try:
@@ -253,20 +298,23 @@ class Script(BaseAuditModel):
                 env_val = env_var.split("=")[1]
             except:
                 continue
-            if match := pattern.match(env_val):
+            if match := RE_SCRIPT_PLACEHOLDER.match(env_val):
                 string = match.group(1)
                 value = replace_arg_db_values(
                     string=string,
                     instance=agent,
                     shell=shell,
                     quotes=False,
+                    resolver=resolver,
                 )
 
                 if value:
                     try:
-                        new_val = re.sub("\\{\\{.*\\}\\}", value, env_val)
+                        new_val = RE_SCRIPT_PLACEHOLDER_SUB.sub(value, env_val)
                     except re.error:
-                        new_val = re.sub("\\{\\{.*\\}\\}", re.escape(value), env_val)
+                        new_val = RE_SCRIPT_PLACEHOLDER_SUB.sub(
+                            re.escape(value), env_val
+                        )
                     temp_env_vars.append(f"{env_key}={new_val}")
             else:
                 # pass parameter unaltered
@@ -285,3 +333,13 @@ class ScriptSnippet(models.Model):
 
     def __str__(self):
         return self.name
+
+    # snippets are replaced into the script checks of the cached check plans
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        clear_check_plans()
+
+    def delete(self, *args, **kwargs):
+        ret = super().delete(*args, **kwargs)
+        clear_check_plans()
+        return ret
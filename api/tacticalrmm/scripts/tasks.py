@@ -1,12 +1,35 @@
 import asyncio
 
 from django.conf import settings
+from django.utils import timezone as djangotime
 
-from agents.models import Agent, AgentHistory
+from agents.models import Agent, AgentHistory, BulkJob
 from scripts.models import Script
 from tacticalrmm.celery import app
 from tacticalrmm.constants import AgentHistoryType
-from tacticalrmm.nats_utils import abulk_nats_command
+from tacticalrmm.exceptions import NatsDown
+from tacticalrmm.nats_utils import BULK_NATS_TASKS, abulk_nats_command
+from tacticalrmm.utils import DbValueResolver
+
+
+def publish_bulk_job(items: BULK_NATS_TASKS, bulk_job_pk: int | None) -> None:
+    """
+    Sends the commands of a bulk run to the agents, recording on its bulk job
+    how many were sent and accepted by nats.
+    """
+    if not bulk_job_pk:
+        asyncio.run(abulk_nats_command(items=items))
+        return
+
+    jobs = BulkJob.objects.filter(pk=bulk_job_pk)
+    jobs.update(dispatched=len(items))
+    try:
+        asyncio.run(abulk_nats_command(items=items))
+    except NatsDown:
+        jobs.update(dispatched_at=djangotime.now())
+        raise
+
+    jobs.update(acknowledged=len(items), dispatched_at=djangotime.now())
 
 
 @app.task
@@ -18,8 +41,8 @@ def bulk_command_task(
     timeout: int,
     username: str,
     run_as_user: bool = False,
+    bulk_job_pk: int | None = None,
 ) -> None:
-    items = []
     nats_data = {
         "func": "rawcmd",
         "timeout": timeout,
@@ -29,19 +52,25 @@ def bulk_command_task(
         },
         "run_as_user": run_as_user,
     }
-    agent: "Agent"
-    for agent in Agent.objects.filter(pk__in=agent_pks):
-        hist = AgentHistory.objects.create(
-            agent=agent,
-            type=AgentHistoryType.CMD_RUN,
-            command=cmd,
-            username=username,
-        )
-        tmp = {**nats_data}
-        tmp["id"] = hist.pk
-        items.append((agent.agent_id, tmp))
+    agents = list(Agent.objects.filter(pk__in=agent_pks).only("pk", "agent_id"))
+    history = AgentHistory.objects.bulk_create(
+        [
+            AgentHistory(
+                agent=agent,
+                type=AgentHistoryType.CMD_RUN,
+                command=cmd,
+                username=username,
+                bulk_job_id=bulk_job_pk,
+            )
+            for agent in agents
+        ]
+    )
 
-    asyncio.run(abulk_nats_command(items=items))
+    items = [
+        (agent.agent_id, {**nats_data, "id": hist.pk})
+        for agent, hist in zip(agents, history)
+    ]
+    publish_bulk_job(items, bulk_job_pk)
 
 
 @app.task
@@ -57,6 +86,7 @@ def bulk_script_task(
     custom_field_pk: int | None,
     collector_all_output: bool = False,
     save_to_agent_note: bool = False,
+    bulk_job_pk: int | None = None,
 ) -> None:
     script = Script.objects.get(pk=script_pk)
     # always override if set on script model
@@ -69,33 +99,51 @@ def bulk_script_task(
 
         custom_field = CustomField.objects.get(pk=custom_field_pk)
 
+    # prepare everything that is the same for every agent once: snippets are resolved,
+    # and the custom fields and key store values used by the args are fetched in bulk
+    code = script.code
+    agents = list(Agent.objects.select_related("site__client").filter(pk__in=agent_pks))
+    resolver = DbValueResolver(
+        strings=Script.get_placeholders(args + env_vars), instances=agents
+    )
+
+    history = AgentHistory.objects.bulk_create(
+        [
+            AgentHistory(
+                agent=agent,
+                type=AgentHistoryType.SCRIPT_RUN,
+                script=script,
+                username=username,
+                custom_field=custom_field,
+                collector_all_output=collector_all_output,
+                save_to_agent_note=save_to_agent_note,
+                bulk_job_id=bulk_job_pk,
+            )
+            for agent in agents
+        ]
+    )
+
     items = []
-    agent: "Agent"
-    for agent in Agent.objects.filter(pk__in=agent_pks):
-        hist = AgentHistory.objects.create(
-            agent=agent,
-            type=AgentHistoryType.SCRIPT_RUN,
-            script=script,
-            username=username,
-            custom_field=custom_field,
-            collector_all_output=collector_all_output,
-            save_to_agent_note=save_to_agent_note,
-        )
+    for agent, hist in zip(agents, history):
         data = {
             "func": "runscriptfull",
             "id": hist.pk,
             "timeout": timeout,
-            "script_args": script.parse_script_args(agent, script.shell, args),
+            "script_args": script.parse_script_args(
+                agent, script.shell, args, resolver=resolver
+            ),
             "payload": {
-                "code": script.code,
+                "code": code,
                 "shell": script.shell,
             },
             "run_as_user": run_as_user,
-            "env_vars": script.parse_script_env_vars(agent, script.shell, env_vars),
+            "env_vars": script.parse_script_env_vars(
+                agent, script.shell, env_vars, resolver=resolver
+            ),
             "nushell_enable_config": settings.NUSHELL_ENABLE_CONFIG,
             "deno_default_permissions": settings.DENO_DEFAULT_PERMISSIONS,
         }
         tup = (agent.agent_id, data)
         items.append(tup)
 
-    asyncio.run(abulk_nats_command(items=items))
+    publish_bulk_job(items, bulk_job_pk)
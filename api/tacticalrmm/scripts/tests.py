@@ -570,6 +570,103 @@ class TestScriptViews(TacticalTestCase):
         )
 
 
+class TestBulkScriptTask(TacticalTestCase):
+    def setUp(self):
+        self.setup_coresettings()
+
+    @patch("scripts.tasks.abulk_nats_command")
+    def test_bulk_script_task(self, abulk_nats_command):
+        from agents.models import AgentHistory
+        from scripts.tasks import bulk_script_task
+
+        baker.make("scripts.ScriptSnippet", name="snippet", code="Snippet Code")
+        script = baker.make(
+            "scripts.Script", script_body="{{snippet}}", shell=ScriptShell.POWERSHELL
+        )
+        field = baker.make(
+            "core.CustomField",
+            name="Test Field",
+            model=CustomFieldModel.AGENT,
+            type=CustomFieldType.TEXT,
+            default_value_string="DEFAULT",
+        )
+        agents = baker.make_recipe("agents.agent", _quantity=5)
+        baker.make(
+            "agents.AgentCustomField",
+            agent=agents[0],
+            field=field,
+            string_value="VALUE",
+        )
+
+        bulk_script_task(
+            script_pk=script.pk,
+            agent_pks=[agent.pk for agent in agents],
+            args=["-Field {{agent.Test Field}}", "-Client {{client.name}}"],
+            env_vars=["FIELD={{agent.Test Field}}"],
+            timeout=30,
+            username="john",
+            custom_field_pk=None,
+        )
+
+        items = dict(abulk_nats_command.call_args.kwargs["items"])
+        self.assertEqual(len(items), 5)
+        self.assertEqual(AgentHistory.objects.filter(script=script).count(), 5)
+
+        for agent in agents:
+            data = items[agent.agent_id]
+            value = "VALUE" if agent == agents[0] else "DEFAULT"
+            self.assertEqual(data["payload"]["code"], "Snippet Code")
+            self.assertEqual(
+                data["script_args"],
+                [f"-Field '{value}'", f"-Client '{agent.client.name}'"],
+            )
+            self.assertEqual(data["env_vars"], [f"FIELD={value}"])
+            self.assertEqual(AgentHistory.objects.get(pk=data["id"]).agent_id, agent.pk)
+
+    @patch("scripts.tasks.abulk_nats_command")
+    def test_bulk_command_task_job(self, abulk_nats_command):
+        from agents.models import AgentHistory, BulkJob
+        from scripts.tasks import bulk_command_task
+        from tacticalrmm.exceptions import NatsDown
+
+        agents = baker.make_recipe("agents.agent", _quantity=3)
+        job = baker.make("agents.BulkJob", total=3)
+
+        bulk_command_task(
+            agent_pks=[agent.pk for agent in agents],
+            cmd="whoami",
+            shell="cmd",
+            timeout=30,
+            username="john",
+            bulk_job_pk=job.pk,
+        )
+
+        items = dict(abulk_nats_command.call_args.kwargs["items"])
+        self.assertEqual(len(items), 3)
+        self.assertEqual(AgentHistory.objects.filter(bulk_job=job).count(), 3)
+
+        job.refresh_from_db()
+        self.assertEqual((job.dispatched, job.acknowledged), (3, 3))
+        self.assertIsNotNone(job.dispatched_at)
+
+        # nothing was accepted by nats
+        abulk_nats_command.side_effect = NatsDown
+        job = baker.make("agents.BulkJob", total=3)
+        with self.assertRaises(NatsDown):
+            bulk_command_task(
+                agent_pks=[agent.pk for agent in agents],
+                cmd="whoami",
+                shell="cmd",
+                timeout=30,
+                username="john",
+                bulk_job_pk=job.pk,
+            )
+
+        job = BulkJob.objects.get(pk=job.pk)
+        self.assertEqual((job.dispatched, job.acknowledged), (3, 0))
+        self.assertTrue(job.finished)
+
+
 class TestScriptSnippetViews(TacticalTestCase):
     def setUp(self):
         self.setup_coresettings()
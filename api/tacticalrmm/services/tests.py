@@ -59,6 +59,12 @@ class TestServiceViews(TacticalTestCase):
         nats_cmd.assert_called_with(data={"func": "winservices"}, timeout=10)
         self.assertEqual(Agent.objects.get(pk=agent.pk).services, nats_return)
 
+        # unchanged services aren't saved again
+        with patch("agents.models.Agent.save") as save:
+            resp = self.client.get(url, format="json")
+            self.assertEqual(resp.status_code, 200)
+            save.assert_not_called()
+
         self.check_not_authenticated("get", url)
 
     @patch("agents.models.Agent.nats_cmd")
@@ -44,8 +44,11 @@ class GetServices(APIView):
         if r in ("timeout", "natsdown"):
             return notify_error("Unable to contact the agent")
 
-        agent.services = r
-        agent.save(update_fields=["services"])
+        # the services rarely change between refreshes, skip rewriting the row
+        if r != agent.services:
+            agent.services = r
+            agent.save(update_fields=["services"])
+
         return Response(agent.services)
 
 
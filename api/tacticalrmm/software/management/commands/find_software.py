@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 
-from software.models import InstalledSoftware
+from software.models import AgentSoftware
 
 
 class Command(BaseCommand):
@@ -10,17 +10,20 @@ class Command(BaseCommand):
         parser.add_argument("name", type=str)
 
     def handle(self, *args, **kwargs):
-        search = kwargs["name"].lower()
-
-        all_sw = InstalledSoftware.objects.select_related(
-            "agent", "agent__site", "agent__site__client"
+        links = (
+            AgentSoftware.objects.filter(software__name__icontains=kwargs["name"])
+            .order_by("agent_id")
+            .distinct("agent_id")
+            .values_list(
+                "software__name",
+                "agent__site__client__name",
+                "agent__site__name",
+                "agent__hostname",
+            )
         )
-        for instance in all_sw.iterator(chunk_size=20):
-            for sw in instance.software:
-                if search in sw["name"].lower():
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f"Found {sw['name']} installed on: {instance.agent.client.name}\\{instance.agent.site.name}\\{instance.agent.hostname}"
-                        )
-                    )
-                    break
+        for name, client, site, hostname in links.iterator(chunk_size=500):
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Found {name} installed on: {client}\\{site}\\{hostname}"
+                )
+            )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from software.models import InstalledSoftware
+from software.utils import sync_software_catalog
+
+
+class Command(BaseCommand):
+    help = "Fills the software catalog from the software lists of all agents"
+
+    def handle(self, *args, **kwargs):
+        count = 0
+        for instance in InstalledSoftware.objects.select_related("agent").iterator(
+            chunk_size=20
+        ):
+            sync_software_catalog(instance.agent, instance.software)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Synced the software of {count} agents"))
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.25 on 2026-10-19 10:26
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0062_agent_installomator_fields"),
+        ("software", "0005_installomatorlabel"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Software",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=255)),
+                ("publisher", models.CharField(blank=True, default="", max_length=255)),
+                ("version", models.CharField(blank=True, default="", max_length=255)),
+                (
+                    "version_parts",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.BigIntegerField(),
+                        blank=True,
+                        default=list,
+                        size=None,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["name", "version_parts"],
+                        name="software_so_name_af15d5_idx",
+                    )
+                ],
+                "unique_together": {("name", "publisher", "version")},
+            },
+        ),
+        migrations.CreateModel(
+            name="AgentSoftware",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("install_date", models.DateField(blank=True, null=True)),
+                ("first_seen", models.DateTimeField(auto_now_add=True)),
+                (
+                    "agent",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="software_links",
+                        to="agents.agent",
+                    ),
+                ),
+                (
+                    "software",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="agent_links",
+                        to="software.software",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("software", "agent")},
+            },
+        ),
+    ]
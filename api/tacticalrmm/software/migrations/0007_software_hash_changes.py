@@ -0,0 +1,38 @@
+# Generated by Django 4.2.25 on 2026-10-19 10:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("agents", "0062_agent_installomator_fields"),
+        ("software", "0006_software_catalog"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="installedsoftware",
+            name="software_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name="SoftwareChange",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("time", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("added", models.JSONField(default=list)),
+                ("removed", models.JSONField(default=list)),
+                ("updated", models.JSONField(default=list)),
+                (
+                    "agent",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="software_changes",
+                        to="agents.agent",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.25 on 2026-10-19 11:38
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("software", "0007_software_hash_changes"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="software",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["name"], name="software_name_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ),
+    ]
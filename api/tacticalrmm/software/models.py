@@ -1,3 +1,5 @@
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 from agents.models import Agent
@@ -14,6 +16,7 @@ class ChocoSoftware(models.Model):
 
 class InstallomatorLabel(models.Model):
     """Stores Installomator label catalog for macOS software deployment"""
+
     labels = models.JSONField(default=list)
     version = models.CharField(max_length=20)  # Installomator version (e.g., "11.0")
     added = models.DateTimeField(auto_now_add=True)
@@ -32,6 +35,76 @@ class InstalledSoftware(models.Model):
     id = models.BigAutoField(primary_key=True)
     agent = models.ForeignKey(Agent, on_delete=models.CASCADE)
     software = models.JSONField()
+    # sha256 of the software list, unchanged lists sent by the agent aren't saved
+    software_hash = models.CharField(max_length=64, null=True, blank=True)
 
     def __str__(self):
         return self.agent.hostname
+
+
+class SoftwareChange(models.Model):
+    """
+    Software installed, uninstalled or upgraded on an agent between two of the
+    software lists it sent.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    agent = models.ForeignKey(
+        Agent, related_name="software_changes", on_delete=models.CASCADE
+    )
+    time = models.DateTimeField(auto_now_add=True, db_index=True)
+    # [{"name": ..., "version": ...}]
+    added = models.JSONField(default=list)
+    removed = models.JSONField(default=list)
+    # [{"name": ..., "from": ..., "to": ...}]
+    updated = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.agent.hostname} - {self.time}"
+
+
+class Software(models.Model):
+    """
+    Deduplicated catalog of the software reported by agents, linked to the agents
+    that have it installed through AgentSoftware.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=255)
+    publisher = models.CharField(max_length=255, blank=True, default="")
+    version = models.CharField(max_length=255, blank=True, default="")
+    # numeric parts of the version so versions can be compared in sql
+    version_parts = ArrayField(models.BigIntegerField(), blank=True, default=list)
+
+    class Meta:
+        unique_together = (("name", "publisher", "version"),)
+        indexes = [
+            models.Index(fields=["name", "version_parts"]),
+            # for the substring searches of SearchSoftware
+            GinIndex(
+                fields=["name"], name="software_name_trgm", opclasses=["gin_trgm_ops"]
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.version}"
+
+
+class AgentSoftware(models.Model):
+    objects = PermissionQuerySet.as_manager()
+
+    id = models.BigAutoField(primary_key=True)
+    agent = models.ForeignKey(
+        Agent, related_name="software_links", on_delete=models.CASCADE
+    )
+    software = models.ForeignKey(
+        Software, related_name="agent_links", on_delete=models.CASCADE
+    )
+    install_date = models.DateField(null=True, blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("software", "agent"),)
+
+    def __str__(self):
+        return f"{self.agent.hostname} - {self.software}"
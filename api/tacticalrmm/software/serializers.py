@@ -6,4 +6,4 @@ from .models import InstalledSoftware
 class InstalledSoftwareSerializer(serializers.ModelSerializer):
     class Meta:
         model = InstalledSoftware
-        fields = "__all__"
+        exclude = ("software_hash",)
@@ -0,0 +1,21 @@
+from django.db import transaction
+
+from tacticalrmm.celery import app
+
+
+@app.task
+def prune_orphaned_software() -> str:
+    from .models import Software
+
+    # catalog entries no agent has installed anymore, entries sync_software_catalog
+    # is linking to an agent are locked and left for the next run
+    with transaction.atomic():
+        pks = list(
+            Software.objects.filter(agent_links__isnull=True)
+            .select_for_update(skip_locked=True, of=("self",))
+            .values_list("pk", flat=True)
+        )
+        # checked again since entries can be linked before they are locked
+        Software.objects.filter(pk__in=pks, agent_links__isnull=True).delete()
+
+    return "ok"
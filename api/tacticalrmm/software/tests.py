@@ -7,8 +7,23 @@ from model_bakery import baker
 
 from tacticalrmm.test import TacticalTestCase
 
-from .models import ChocoSoftware
+from .models import (
+    AgentSoftware,
+    ChocoSoftware,
+    InstalledSoftware,
+    Software,
+    SoftwareChange,
+)
 from .serializers import InstalledSoftwareSerializer
+from .tasks import prune_orphaned_software
+from .utils import (
+    diff_software,
+    hash_payload,
+    parse_install_date,
+    parse_version_parts,
+    save_software_list,
+    sync_software_catalog,
+)
 
 base_url = "/software"
 
@@ -244,3 +259,212 @@ class TestSoftwarePermissions(TacticalTestCase):
 
         # should work now
         self.check_authorized("post", url)
+
+
+class TestSoftwareCatalog(TacticalTestCase):
+    def setUp(self):
+        self.authenticate()
+        self.setup_coresettings()
+
+    def make_software(self, name, version, install_date="0001-01-01 00:00:00"):
+        return {
+            "name": name,
+            "publisher": "Google LLC",
+            "version": version,
+            "install_date": install_date,
+        }
+
+    def test_parse(self):
+        self.assertEqual(parse_version_parts("120.0.6099.110"), [120, 0, 6099, 110])
+        self.assertEqual(parse_version_parts("2.22.0.windows.1"), [2, 22, 0, 1])
+        self.assertEqual(parse_version_parts(""), [])
+        self.assertIsNone(parse_install_date("0001-01-01 00:00:00 +0000 UTC"))
+        self.assertIsNone(parse_install_date(""))
+        self.assertEqual(
+            str(parse_install_date("2023-05-04 00:00:00 +0000 UTC")), "2023-05-04"
+        )
+
+    def test_sync_software_catalog(self):
+        agent1 = baker.make_recipe("agents.agent")
+        agent2 = baker.make_recipe("agents.agent")
+
+        chrome = self.make_software("Google Chrome", "119.0.6045.200", "2023-05-04")
+        earth = self.make_software("Google Earth", "7.3")
+        sync_software_catalog(agent1, [chrome, earth])
+        sync_software_catalog(agent2, [chrome])
+
+        # titles are shared between agents
+        self.assertEqual(Software.objects.count(), 2)
+        self.assertEqual(AgentSoftware.objects.filter(agent=agent1).count(), 2)
+        self.assertEqual(
+            str(AgentSoftware.objects.get(agent=agent2).install_date), "2023-05-04"
+        )
+
+        # an unchanged list only reads the agent's links
+        with self.assertNumQueries(1):
+            sync_software_catalog(agent1, [chrome, earth])
+
+        # error strings from the agent don't wipe the catalog
+        sync_software_catalog(agent1, "timeout")  # type: ignore
+        self.assertEqual(AgentSoftware.objects.filter(agent=agent1).count(), 2)
+
+        # chrome was upgraded and earth uninstalled on agent1
+        new_chrome = self.make_software("Google Chrome", "120.0.6099.110")
+        sync_software_catalog(agent1, [new_chrome])
+        self.assertEqual(
+            list(
+                AgentSoftware.objects.filter(agent=agent1).values_list(
+                    "software__version", flat=True
+                )
+            ),
+            ["120.0.6099.110"],
+        )
+        # earth isn't installed anywhere anymore, the old chrome still is
+        prune_orphaned_software()
+        self.assertFalse(Software.objects.filter(name="Google Earth").exists())
+        self.assertTrue(Software.objects.filter(version="119.0.6045.200").exists())
+
+    @patch("agents.models.Agent.nats_cmd")
+    def test_search_software(self, nats_cmd):
+        agent1 = baker.make_recipe("agents.agent", hostname="DESKTOP-1")
+        agent2 = baker.make_recipe("agents.agent", hostname="DESKTOP-2")
+        sync_software_catalog(
+            agent1, [self.make_software("Google Chrome", "119.0.6045.200")]
+        )
+
+        # refreshing the software list updates the catalog
+        nats_cmd.return_value = [self.make_software("Google Chrome", "120.0.6099.9")]
+        r = self.client.put(f"{base_url}/{agent2.agent_id}/", format="json")
+        self.assertEqual(r.status_code, 200)
+
+        url = f"{base_url}/search/"
+        r = self.client.get(url, format="json")
+        self.assertEqual(r.status_code, 400)
+
+        r = self.client.get(url, {"name": "chrome"}, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            [i["agent__hostname"] for i in r.data["software"]],
+            ["DESKTOP-1", "DESKTOP-2"],
+        )
+        self.assertIsNone(r.data["next_cursor"])
+
+        # versions are compared numerically, not as strings
+        r = self.client.get(
+            url, {"name": "chrome", "version_lt": "120.0.6099.110"}, format="json"
+        )
+        self.assertEqual(
+            [i["software__version"] for i in r.data["software"]],
+            ["119.0.6045.200", "120.0.6099.9"],
+        )
+
+        r = self.client.get(
+            url, {"name": "chrome", "version_gte": "120.0.6099.10"}, format="json"
+        )
+        self.assertEqual(r.data["software"], [])
+
+        r = self.client.get(
+            url, {"name": "chrome", "version_gte": "120"}, format="json"
+        )
+        self.assertEqual(
+            [i["agent__hostname"] for i in r.data["software"]], ["DESKTOP-2"]
+        )
+
+        # results are paged
+        r = self.client.get(url, {"name": "chrome", "page_size": 1}, format="json")
+        self.assertEqual(
+            [i["agent__hostname"] for i in r.data["software"]], ["DESKTOP-1"]
+        )
+        r = self.client.get(
+            url,
+            {"name": "chrome", "page_size": 1, "cursor": r.data["next_cursor"]},
+            format="json",
+        )
+        self.assertEqual(
+            [i["agent__hostname"] for i in r.data["software"]], ["DESKTOP-2"]
+        )
+        self.assertIsNone(r.data["next_cursor"])
+
+        r = self.client.get(url, {"name": "chrome", "cursor": "bad"}, format="json")
+        self.assertEqual(r.status_code, 400)
+
+        self.check_not_authenticated("get", url)
+
+    def test_catalog_commands(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        agent = baker.make_recipe("agents.agent", hostname="DESKTOP-1")
+        baker.make(
+            "software.InstalledSoftware",
+            agent=agent,
+            software=[self.make_software("Google Chrome", "120.0.6099.110")],
+        )
+
+        call_command("sync_software_catalog", stdout=StringIO())
+        self.assertTrue(AgentSoftware.objects.filter(agent=agent).exists())
+
+        out = StringIO()
+        call_command("find_software", "chrome", stdout=out)
+        self.assertIn("DESKTOP-1", out.getvalue())
+
+
+class TestSoftwareChanges(TacticalTestCase):
+    def setUp(self):
+        self.setup_coresettings()
+        self.agent = baker.make_recipe("agents.agent")
+        self.software = [
+            {"name": "7-Zip", "publisher": "Igor Pavlov", "version": "19.00"},
+            {"name": "Git", "publisher": "Git", "version": "2.22.0"},
+        ]
+
+    def test_hash_payload(self):
+        self.assertEqual(
+            hash_payload([{"name": "Git", "version": "2.22.0"}]),
+            hash_payload([{"version": "2.22.0", "name": "Git"}]),
+        )
+        self.assertNotEqual(
+            hash_payload([{"name": "Git", "version": "2.22.0"}]),
+            hash_payload([{"name": "Git", "version": "2.23.0"}]),
+        )
+
+    def test_diff_software(self):
+        new = [
+            {"name": "7-Zip", "publisher": "Igor Pavlov", "version": "23.01"},
+            {"name": "Firefox", "publisher": "Mozilla", "version": "120.0"},
+        ]
+        self.assertEqual(
+            diff_software(self.software, new),
+            {
+                "added": [{"name": "Firefox", "version": "120.0"}],
+                "removed": [{"name": "Git", "version": "2.22.0"}],
+                "updated": [{"name": "7-Zip", "from": "19.00", "to": "23.01"}],
+            },
+        )
+        self.assertEqual(
+            diff_software("timeout", []), {"added": [], "removed": [], "updated": []}
+        )
+
+    def test_save_software_list(self):
+        # the first list has nothing to compare against
+        self.assertTrue(save_software_list(self.agent, self.software))
+        self.assertFalse(SoftwareChange.objects.exists())
+
+        # an unchanged list is acknowledged with one read and no writes
+        with self.assertNumQueries(1):
+            self.assertFalse(save_software_list(self.agent, self.software))
+
+        new = self.software[:1]
+        self.assertTrue(save_software_list(self.agent, new))
+        change = SoftwareChange.objects.get(agent=self.agent)
+        self.assertEqual(change.removed, [{"name": "Git", "version": "2.22.0"}])
+        self.assertEqual(change.added, [])
+        self.assertEqual(InstalledSoftware.objects.get(agent=self.agent).software, new)
+        self.assertEqual(AgentSoftware.objects.filter(agent=self.agent).count(), 1)
+
+        # lists saved before hashing was added are compared once
+        InstalledSoftware.objects.filter(agent=self.agent).update(software_hash=None)
+        self.assertTrue(save_software_list(self.agent, new))
+        self.assertEqual(SoftwareChange.objects.count(), 1)
+        self.assertFalse(save_software_list(self.agent, new))
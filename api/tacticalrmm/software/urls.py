@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path("chocos/", views.chocos),
     path("installomator/labels/", views.installomator_labels),
+    path("search/", views.SearchSoftware.as_view()),
     path("", views.GetSoftware.as_view()),
     path("<agent:agent_id>/", views.GetSoftware.as_view()),
     path("<agent:agent_id>/uninstall/", views.UninstallSoftware.as_view()),
@@ -0,0 +1,206 @@
+import datetime as dt
+import hashlib
+import json
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import AgentSoftware, InstalledSoftware, Software, SoftwareChange
+
+if TYPE_CHECKING:
+    from agents.models import Agent
+
+RE_VERSION_PART = re.compile(r"\d+")
+
+SoftwareKey = Tuple[str, str, str]
+
+
+def parse_version_parts(version: str) -> List[int]:
+    # "120.0.6099.110" -> [120, 0, 6099, 110], parts too big for a bigint are capped
+    return [min(int(part), 2**63 - 1) for part in RE_VERSION_PART.findall(version)]
+
+
+def parse_install_date(value: Any) -> Optional[dt.date]:
+    # agents send "2019-06-09 00:00:00 +0000 UTC", or year 1 when it's unknown
+    try:
+        date = dt.date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+    return date if date.year > 1 else None
+
+
+def _software_key(sw: Dict[str, Any]) -> SoftwareKey:
+    return (
+        str(sw.get("name") or "")[:255],
+        str(sw.get("publisher") or "")[:255],
+        str(sw.get("version") or "")[:255],
+    )
+
+
+def sync_software_catalog(agent: "Agent", software: List[Dict[str, Any]]) -> None:
+    """
+    Updates the agent's links to the software catalog from a software list sent
+    by the agent, only adding and removing what changed since the last list.
+    """
+    # error strings from the agent, leave the catalog as it is
+    if not isinstance(software, list):
+        return
+
+    incoming: Dict[SoftwareKey, Optional[dt.date]] = {}
+    for sw in software:
+        if not isinstance(sw, dict) or not sw.get("name"):
+            continue
+        incoming[_software_key(sw)] = parse_install_date(sw.get("install_date"))
+
+    existing: Dict[SoftwareKey, AgentSoftware] = {
+        (link.software.name, link.software.publisher, link.software.version): link
+        for link in AgentSoftware.objects.filter(agent=agent).select_related("software")
+    }
+
+    removed = [link for key, link in existing.items() if key not in incoming]
+    added = [key for key in incoming if key not in existing]
+    changed = []
+    for key, link in existing.items():
+        if key in incoming and link.install_date != incoming[key]:
+            link.install_date = incoming[key]
+            changed.append(link)
+
+    if not (removed or added or changed):
+        return
+
+    with transaction.atomic():
+        if removed:
+            AgentSoftware.objects.filter(pk__in=[link.pk for link in removed]).delete()
+
+        if changed:
+            AgentSoftware.objects.bulk_update(changed, ["install_date"])
+
+        if added:
+            ids: Dict[SoftwareKey, int] = {}
+            missing = added
+            # catalog entries removed by prune_orphaned_software after they were
+            # found to exist are created again
+            while missing:
+                Software.objects.bulk_create(
+                    [
+                        Software(
+                            name=name,
+                            publisher=publisher,
+                            version=version,
+                            version_parts=parse_version_parts(version),
+                        )
+                        for name, publisher, version in missing
+                    ],
+                    ignore_conflicts=True,
+                )
+
+                # bulk_create doesn't return the ids of rows that already existed,
+                # they are locked so they can't be pruned before they are linked
+                lookup = Q()
+                for name, publisher, version in missing:
+                    lookup |= Q(name=name, publisher=publisher, version=version)
+                ids.update(
+                    {
+                        (name, publisher, version): pk
+                        for pk, name, publisher, version in Software.objects.filter(
+                            lookup
+                        )
+                        .select_for_update(no_key=True)
+                        .values_list("pk", "name", "publisher", "version")
+                    }
+                )
+                missing = [key for key in missing if key not in ids]
+
+            AgentSoftware.objects.bulk_create(
+                [
+                    AgentSoftware(
+                        agent=agent, software_id=ids[key], install_date=incoming[key]
+                    )
+                    for key in added
+                ],
+                ignore_conflicts=True,
+            )
+
+
+def hash_payload(payload: Any) -> str:
+    # the same payload always hashes the same, regardless of dict key order
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def diff_software(old: Any, new: Any) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Compares two software lists sent by an agent and returns the software that
+    was added, removed or had its version changed, by name and publisher.
+    """
+
+    def by_title(software: Any) -> Dict[Tuple[str, str], str]:
+        if not isinstance(software, list):
+            return {}
+
+        return {
+            key[:2]: key[2]
+            for key in (_software_key(sw) for sw in software if isinstance(sw, dict))
+            if key[0]
+        }
+
+    old_titles, new_titles = by_title(old), by_title(new)
+    return {
+        "added": [
+            {"name": title[0], "version": version}
+            for title, version in new_titles.items()
+            if title not in old_titles
+        ],
+        "removed": [
+            {"name": title[0], "version": version}
+            for title, version in old_titles.items()
+            if title not in new_titles
+        ],
+        "updated": [
+            {"name": title[0], "from": old_titles[title], "to": version}
+            for title, version in new_titles.items()
+            if title in old_titles and old_titles[title] != version
+        ],
+    }
+
+
+def save_software_list(agent: "Agent", software: Any) -> bool:
+    """
+    Saves the software list sent by an agent, recording what changed since its
+    last list. A list that is the same as the last one isn't written. Returns
+    whether the list changed.
+    """
+    software_hash = hash_payload(software)
+    current = (
+        InstalledSoftware.objects.filter(agent=agent)
+        .only("id", "agent_id", "software_hash")
+        .first()
+    )
+    if current and current.software_hash == software_hash:
+        return False
+
+    with transaction.atomic():
+        if current is None:
+            InstalledSoftware.objects.create(
+                agent=agent, software=software, software_hash=software_hash
+            )
+        else:
+            # the previous list is only loaded when there is something to compare
+            old = InstalledSoftware.objects.values_list("software", flat=True).get(
+                pk=current.pk
+            )
+            changes = diff_software(old, software)
+            if any(changes.values()):
+                SoftwareChange.objects.create(agent=agent, **changes)
+
+            current.software = software
+            current.software_hash = software_hash
+            current.save(update_fields=["software", "software_hash"])
+
+        sync_software_catalog(agent, software)
+
+    return True
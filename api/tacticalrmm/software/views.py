@@ -9,12 +9,14 @@ from rest_framework.views import APIView
 
 from agents.models import Agent, AgentHistory
 from logs.models import AuditLog, PendingAction
+from logs.pagination import keyset_page
 from tacticalrmm.constants import AgentHistoryType, PAAction
 from tacticalrmm.helpers import notify_error
 
-from .models import ChocoSoftware, InstalledSoftware, InstallomatorLabel
+from .models import AgentSoftware, ChocoSoftware, InstalledSoftware, InstallomatorLabel
 from .permissions import SoftwarePerms, UninstallSoftwarePerms
 from .serializers import InstalledSoftwareSerializer
+from .utils import parse_version_parts, save_software_list
 
 
 @api_view(["GET"])
@@ -119,16 +121,68 @@ class GetSoftware(APIView):
         if r in ("timeout", "natsdown"):
             return notify_error("Unable to contact the agent")
 
-        if not InstalledSoftware.objects.filter(agent=agent).exists():
-            InstalledSoftware(agent=agent, software=r).save()
-        else:
-            s = agent.installedsoftware_set.first()  # type: ignore
-            s.software = r
-            s.save(update_fields=["software"])
-
+        save_software_list(agent, r)
         return Response("ok")
 
 
+class SearchSoftware(APIView):
+    permission_classes = [IsAuthenticated, SoftwarePerms]
+
+    # find the agents that have some software installed, optionally older or newer
+    # than a version, e.g. ?name=chrome&version_lt=120.0.6099.110
+    # results are paged by agent, pass next_cursor as ?cursor= for the next page
+    def get(self, request):
+        name = request.query_params.get("name", "").strip()
+        if not name:
+            return notify_error("A software name is required")
+
+        try:
+            page_size = min(int(request.query_params.get("page_size", 100)), 1000)
+        except ValueError:
+            return notify_error("Invalid page size")
+
+        links = AgentSoftware.objects.filter_by_role(request.user).filter(  # type: ignore
+            software__name__icontains=name
+        )
+
+        if publisher := request.query_params.get("publisher"):
+            links = links.filter(software__publisher__icontains=publisher)
+
+        if version := request.query_params.get("version_lt"):
+            links = links.filter(
+                software__version_parts__lt=parse_version_parts(version)
+            )
+
+        if version := request.query_params.get("version_gte"):
+            links = links.filter(
+                software__version_parts__gte=parse_version_parts(version)
+            )
+
+        try:
+            rows, next_cursor = keyset_page(
+                links.values(
+                    "id",
+                    "agent_id",
+                    "agent__agent_id",
+                    "agent__hostname",
+                    "agent__site__client__name",
+                    "agent__site__name",
+                    "software__name",
+                    "software__publisher",
+                    "software__version",
+                    "install_date",
+                ),
+                cursor=request.query_params.get("cursor"),
+                page_size=page_size,
+                descending=False,
+                field="agent_id",
+            )
+        except ValueError as e:
+            return notify_error(str(e))
+
+        return Response({"software": rows, "next_cursor": next_cursor})
+
+
 class UninstallSoftware(APIView):
     permission_classes = [IsAuthenticated, UninstallSoftwarePerms]
 
@@ -1,7 +1,11 @@
 from typing import Optional
 
+from django.conf import settings
 from django.core.cache.backends.dummy import DummyCache
 from django.core.cache.backends.redis import RedisCache
+from redis import Redis, from_url
+
+_redis: Optional[Redis] = None
 
 
 class TacticalRedisCache(RedisCache):
@@ -19,3 +23,15 @@ class TacticalRedisCache(RedisCache):
 class TacticalDummyCache(DummyCache):
     def delete_many_pattern(self, pattern: str, version: Optional[int] = None) -> None:
         return None
+
+
+def get_redis_client() -> Redis:
+    # plain client on the cache's redis db, for data structures the cache api lacks
+    global _redis
+    if _redis is None:
+        cache_settings = settings.CACHES["default"]
+        _redis = from_url(
+            cache_settings.get("LOCATION") or f"redis://{settings.REDIS_HOST}:6379",
+            db=int(cache_settings.get("OPTIONS", {}).get("db", 0)),
+        )
+    return _redis
@@ -5,6 +5,13 @@ from datetime import timedelta
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
 from django.conf import settings
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tacticalrmm.settings")
@@ -29,6 +36,10 @@ app.conf.beat_schedule = {
         "task": "winupdate.tasks.check_agent_update_schedule_task",
         "schedule": crontab(minute=5, hour="*"),
     },
+    "process-task-results": {
+        "task": "autotasks.tasks.process_task_results_task",
+        "schedule": timedelta(seconds=10.0),
+    },
     "agent-auto-update": {
         "task": "agents.tasks.auto_self_agent_update_task",
         "schedule": crontab(minute=35, hour="*"),
@@ -80,6 +91,43 @@ app.conf.beat_schedule = {
 }
 
 
+@worker_init.connect
+def warm_up_report_rendering(**kwargs) -> None:
+    # load the report rendering libraries in the main worker process before the pool
+    # is forked. Pool processes are recycled often so importing them per process is slow
+    if "ee.reporting" not in settings.INSTALLED_APPS:
+        return
+
+    from ee.reporting.rendering import warm_up
+    from ee.reporting.settings import settings as reporting_settings
+
+    if reporting_settings.REPORTING_WARM_UP_WORKERS:
+        warm_up()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_log_sink(**kwargs) -> None:
+    from logs.sink import log_sink
+
+    log_sink.flush()
+
+
+@task_prerun.connect
+def start_task_metrics(task_id=None, task=None, **kwargs) -> None:
+    from tacticalrmm.task_metrics import start_run, task_metrics_enabled
+
+    if task_metrics_enabled():
+        start_run(task.name, task_id)
+
+
+@task_postrun.connect
+def finish_task_metrics(state=None, **kwargs) -> None:
+    from tacticalrmm.task_metrics import finish_run
+
+    finish_run(failed=state == "FAILURE")
+
+
 @app.task(bind=True)
 def debug_task(self):
     print("Request: {0!r}".format(self.request))
@@ -1,3 +1,4 @@
+import random
 import threading
 from contextlib import suppress
 from typing import Any, Dict, Optional
@@ -8,6 +9,7 @@ from rest_framework.exceptions import AuthenticationFailed
 
 from tacticalrmm.constants import DEMO_NOT_ALLOWED
 from tacticalrmm.helpers import notify_error
+from tacticalrmm.logger import logger
 
 request_local = threading.local()
 
@@ -140,3 +142,67 @@ class DemoMiddleware:
         for i in self.not_allowed:
             if view_Name == i["name"] and request.method in i["methods"]:
                 return self.drf_mock_response(request, notify_error(err))
+
+
+class QueryProfilerMiddleware:
+    """
+    Records SQL count and time, duplicate queries, serializer time and response
+    size for a sample of requests, or requests sent with an X-Query-Profile header
+    by a superuser, and aggregates them per view.
+    """
+
+    def __init__(self, get_response):
+        from tacticalrmm.query_profiler import instrument_serializers
+
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "QUERY_PROFILER_SAMPLE_RATE", 0.01)
+
+        instrument_serializers()
+
+    def __call__(self, request):
+        from django.db import connection
+
+        from tacticalrmm.query_profiler import save_profile, start_profile, stop_profile
+
+        sampled = random.random() < self.sample_rate
+        if not (sampled or "HTTP_X_QUERY_PROFILE" in request.META):
+            return self.get_response(request)
+
+        profile = start_profile()
+        try:
+            with connection.execute_wrapper(profile.record_query):
+                response = self.get_response(request)
+        finally:
+            stop_profile()
+
+        view = getattr(request, "_profiled_view", None)
+        # drf only authenticates the user in the view, so check after the response
+        if view and (sampled or self.header_allowed(request)):
+            summary = profile.summary(
+                view=view,
+                response_bytes=(0 if response.streaming else len(response.content)),
+            )
+            try:
+                save_profile(summary)
+            except Exception as e:
+                logger.error(f"Unable to save query profile for {view}: {e}")
+
+        return response
+
+    @staticmethod
+    def header_allowed(request) -> bool:
+        if settings.DEBUG or getattr(settings, "QUERY_PROFILER_HEADER_ENABLED", False):
+            return True
+
+        user = getattr(request, "user", None)
+        return bool(user and user.is_authenticated and user.is_superuser)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "cls", None) or getattr(
+            view_func, "view_class", None
+        )
+        request._profiled_view = (
+            f"{view_class.__module__}.{view_class.__name__}"
+            if view_class
+            else f"{view_func.__module__}.{view_func.__name__}"
+        )
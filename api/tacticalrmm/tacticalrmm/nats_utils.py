@@ -7,6 +7,7 @@ from nats.errors import TimeoutError as NatsTimeout
 
 from tacticalrmm.exceptions import NatsDown
 from tacticalrmm.helpers import setup_nats_options
+from tacticalrmm.task_metrics import record_nats_request
 
 if TYPE_CHECKING:
     from nats.aio.client import Client as NClient
@@ -33,6 +34,7 @@ async def abulk_nats_command(*, items: "BULK_NATS_TASKS") -> None:
     except Exception:
         raise NatsDown
 
+    record_nats_request(len(items))
     tasks = [_anats_message(nc=nc, subject=item[0], data=item[1]) for item in items]
     await asyncio.gather(*tasks)
     await nc.flush()
@@ -42,6 +44,7 @@ async def abulk_nats_command(*, items: "BULK_NATS_TASKS") -> None:
 async def a_nats_cmd(
     *, nc: "NClient", sub: str, data: NATS_DATA, timeout: int = 10
 ) -> str | Any:
+    record_nats_request()
     try:
         msg = await nc.request(
             subject=sub, payload=msgpack.dumps(data), timeout=timeout
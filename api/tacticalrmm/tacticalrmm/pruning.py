@@ -0,0 +1,137 @@
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Optional, Type
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, pre_delete
+from django.utils import timezone as djangotime
+
+from tacticalrmm.logger import logger
+
+if TYPE_CHECKING:
+    from django.db.models import QuerySet
+
+PRUNE_CHECKPOINT_PREFIX = "prune_checkpoint_"
+PRUNE_LOCK_PREFIX = "prune_lock_"
+# a checkpoint older than this is stale and the next run starts with a new cutoff
+PRUNE_CHECKPOINT_TTL = 60 * 60 * 6
+# refreshed after every batch so the lock of a crashed run expires quickly
+PRUNE_LOCK_TIMEOUT = 60 * 10
+
+
+def _needs_collector(model: Type[models.Model]) -> bool:
+    # rows that other tables reference or that have delete signals have to go
+    # through django's delete collector, everything else can be deleted directly
+    if pre_delete.has_listeners(model) or post_delete.has_listeners(model):
+        return True
+
+    if model._meta.many_to_many:
+        return True
+
+    return any(
+        relation.many_to_many or relation.on_delete is not models.DO_NOTHING
+        for relation in model._meta.related_objects
+    )
+
+
+def _delete_batch(queryset: "QuerySet", batch_size: int) -> int:
+    model = queryset.model
+    batch = queryset.order_by("pk").values_list("pk", flat=True)[:batch_size]
+
+    with transaction.atomic():
+        if _needs_collector(model):
+            # only count rows of this model, not the ones removed by cascades
+            _, deleted = model.objects.filter(pk__in=list(batch)).delete()
+            return deleted.get(model._meta.label, 0)
+
+        sql, params = batch.query.sql_with_params()
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk = connection.ops.quote_name(model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({sql})", params)
+            return cursor.rowcount
+
+
+def prune_older_than(
+    model: Type[models.Model],
+    *,
+    field: str,
+    older_than_days: int,
+    filters: Optional[Q] = None,
+    batch_size: Optional[int] = None,
+    pause: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Deletes the rows of model where field is older than older_than_days in batches
+    of batch_size, sleeping pause seconds between batches so each transaction stays
+    short. The cutoff and progress are checkpointed in the cache so a run that was
+    interrupted by a worker restart resumes with the same cutoff. Only one run per
+    table at a time, a run that can't get the lock returns without deleting.
+    """
+    batch_size = batch_size or getattr(settings, "PRUNE_BATCH_SIZE", 5000)
+    pause = getattr(settings, "PRUNE_BATCH_PAUSE", 0.1) if pause is None else pause
+
+    table = model._meta.db_table
+    lock_key = f"{PRUNE_LOCK_PREFIX}{table}"
+    if not cache.add(lock_key, True, PRUNE_LOCK_TIMEOUT):
+        logger.info(f"Pruning of {table} is already running")
+        return {"table": table, "deleted": 0, "elapsed": 0.0, "skipped": True}
+
+    try:
+        return _prune(model, table, field, older_than_days, filters, batch_size, pause)
+    finally:
+        cache.delete(lock_key)
+
+
+def _prune(
+    model: Type[models.Model],
+    table: str,
+    field: str,
+    older_than_days: int,
+    filters: Optional[Q],
+    batch_size: int,
+    pause: float,
+) -> Dict[str, Any]:
+    checkpoint_key = f"{PRUNE_CHECKPOINT_PREFIX}{table}"
+    checkpoint = cache.get(checkpoint_key)
+
+    if checkpoint and checkpoint["older_than_days"] == older_than_days:
+        cutoff = datetime.fromisoformat(checkpoint["cutoff"])
+        deleted = checkpoint["deleted"]
+    else:
+        cutoff = djangotime.now() - djangotime.timedelta(days=older_than_days)
+        deleted = 0
+
+    queryset = model.objects.filter(**{f"{field}__lt": cutoff})
+    if filters:
+        queryset = queryset.filter(filters)
+
+    start = time.monotonic()
+    while True:
+        cache.set(
+            checkpoint_key,
+            {
+                "older_than_days": older_than_days,
+                "cutoff": cutoff.isoformat(),
+                "deleted": deleted,
+            },
+            timeout=PRUNE_CHECKPOINT_TTL,
+        )
+        cache.touch(f"{PRUNE_LOCK_PREFIX}{table}", PRUNE_LOCK_TIMEOUT)
+
+        count = _delete_batch(queryset, batch_size)
+        deleted += count
+        if count < batch_size:
+            break
+
+        time.sleep(pause)
+
+    cache.delete(checkpoint_key)
+
+    elapsed = time.monotonic() - start
+    logger.info(f"Pruned {deleted} rows from {table} in {elapsed:.2f}s")
+
+    return {"table": table, "deleted": deleted, "elapsed": elapsed, "skipped": False}
@@ -0,0 +1,171 @@
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from tacticalrmm.cache import get_redis_client
+from tacticalrmm.task_metrics import SET_MAX_SCRIPT
+
+QUERY_PROFILE_PREFIX = "query_profile:"
+QUERY_PROFILE_VIEWS_KEY = f"{QUERY_PROFILE_PREFIX}views"
+
+RE_SQL_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+RE_WHITESPACE = re.compile(r"\s+")
+
+_local = threading.local()
+
+
+def fingerprint(sql: str) -> str:
+    # queries that only differ in their parameters or IN list length are the same
+    return RE_SQL_IN_LIST.sub("IN (...)", RE_WHITESPACE.sub(" ", sql)).strip()
+
+
+class RequestProfile:
+    def __init__(self) -> None:
+        self.start = time.monotonic()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.fingerprints: Counter = Counter()
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.monotonic() - start
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def summary(self, *, view: str, response_bytes: int) -> Dict[str, Any]:
+        duplicates = {sql: n for sql, n in self.fingerprints.items() if n > 1}
+        top_sql, top_count = max(
+            duplicates.items(), key=lambda i: i[1], default=(None, 0)
+        )
+        return {
+            "view": view,
+            "seconds": time.monotonic() - self.start,
+            "queries": self.queries,
+            "query_seconds": self.query_seconds,
+            # queries beyond the first run of each fingerprint, likely n+1 lookups
+            "duplicate_queries": sum(n - 1 for n in duplicates.values()),
+            "top_duplicate": {"sql": top_sql, "count": top_count} if top_sql else None,
+            "serializer_seconds": self.serializer_seconds,
+            "response_bytes": response_bytes,
+        }
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return getattr(_local, "profile", None)
+
+
+def start_profile() -> RequestProfile:
+    _local.profile = RequestProfile()
+    return _local.profile
+
+
+def stop_profile() -> None:
+    _local.profile = None
+
+
+def _timed_data(prop: property) -> property:
+    def data(self):
+        profile = current_profile()
+        # only time the outermost serializer, nested ones are part of it
+        if not profile or profile.serializer_depth:
+            return prop.fget(self)
+
+        profile.serializer_depth += 1
+        start = time.monotonic()
+        try:
+            return prop.fget(self)
+        finally:
+            profile.serializer_depth -= 1
+            profile.serializer_seconds += time.monotonic() - start
+
+    data.__wrapped__ = prop  # type:ignore
+    return property(data)
+
+
+def instrument_serializers() -> None:
+    from rest_framework.serializers import ListSerializer, Serializer
+
+    for cls in (Serializer, ListSerializer):
+        if not hasattr(cls.data.fget, "__wrapped__"):
+            cls.data = _timed_data(cls.data)
+
+
+def save_profile(summary: Dict[str, Any]) -> None:
+    r = get_redis_client()
+    key = f"{QUERY_PROFILE_PREFIX}{summary['view']}"
+
+    pipe = r.pipeline()
+    pipe.sadd(QUERY_PROFILE_VIEWS_KEY, summary["view"])
+    pipe.hincrby(key, "requests", 1)
+    pipe.hincrby(key, "queries", summary["queries"])
+    pipe.hincrbyfloat(key, "seconds", summary["seconds"])
+    pipe.hincrbyfloat(key, "query_seconds", summary["query_seconds"])
+    pipe.hincrby(key, "duplicate_queries", summary["duplicate_queries"])
+    pipe.hincrbyfloat(key, "serializer_seconds", summary["serializer_seconds"])
+    pipe.hincrby(key, "response_bytes", summary["response_bytes"])
+    pipe.eval(SET_MAX_SCRIPT, 1, key, "max_queries", summary["queries"])
+    if top := summary["top_duplicate"]:
+        pipe.eval(
+            SET_MAX_SCRIPT,
+            1,
+            key,
+            "top_duplicate_count",
+            top["count"],
+            "top_duplicate_sql",
+            top["sql"],
+        )
+    pipe.execute()
+
+
+def get_profiles() -> List[Dict[str, Any]]:
+    r = get_redis_client()
+    ret = []
+    for view in sorted(v.decode() for v in r.smembers(QUERY_PROFILE_VIEWS_KEY)):
+        values = {
+            k.decode(): v.decode()
+            for k, v in r.hgetall(f"{QUERY_PROFILE_PREFIX}{view}").items()
+        }
+        if not values:
+            continue
+
+        requests = int(values["requests"])
+        ret.append(
+            {
+                "view": view,
+                "requests": requests,
+                "avg_seconds": float(values["seconds"]) / requests,
+                "avg_queries": int(values["queries"]) / requests,
+                "max_queries": int(values.get("max_queries", 0)),
+                "avg_query_seconds": float(values["query_seconds"]) / requests,
+                "avg_duplicate_queries": int(values["duplicate_queries"]) / requests,
+                "avg_serializer_seconds": float(values["serializer_seconds"])
+                / requests,
+                "avg_response_bytes": int(values["response_bytes"]) / requests,
+                "top_duplicate": (
+                    {
+                        "sql": values["top_duplicate_sql"],
+                        "count": int(values["top_duplicate_count"]),
+                    }
+                    if "top_duplicate_sql" in values
+                    else None
+                ),
+            }
+        )
+
+    return sorted(
+        ret, key=lambda p: p["avg_query_seconds"] * p["requests"], reverse=True
+    )
+
+
+def reset_profiles() -> None:
+    r = get_redis_client()
+    keys = list(r.scan_iter(match=f"{QUERY_PROFILE_PREFIX}*", count=500))
+    if keys:
+        r.delete(*keys)
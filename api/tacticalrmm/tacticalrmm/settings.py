@@ -118,6 +118,35 @@ SWAGGER_ENABLED = False
 REDIS_HOST = "127.0.0.1"
 TRMM_LOG_LEVEL = "ERROR"
 TRMM_LOG_TO = "file"
+# buffer debug and audit logs in process and write them in batches
+LOG_SINK_ENABLED = False
+LOG_SINK_BATCH_SIZE = 500
+LOG_SINK_FLUSH_INTERVAL = 2
+LOG_SINK_MAX_BACKLOG = 50000
+LOG_SINK_REPORT_INTERVAL = 300
+# rows deleted per transaction and seconds to wait between batches when pruning
+PRUNE_BATCH_SIZE = 5000
+PRUNE_BATCH_PAUSE = 0.1
+# record duration, queries, nats requests and lock contention of celery tasks
+TASK_METRICS_ENABLED = False
+TASK_METRICS_SLOWEST_RUNS = 50
+# agent history output over this many bytes is stored gzipped outside the row, 0 disables
+AGENT_HISTORY_INLINE_MAX = 65536
+# characters of each output returned by the history list endpoints
+AGENT_HISTORY_PREVIEW_CHARS = 2000
+# seconds past a bulk job's timeout before agents that didn't report count as timed out
+BULK_JOB_GRACE_SECONDS = 60
+# result groups returned in a bulk job summary
+BULK_JOB_SUMMARY_GROUPS = 100
+# seconds between the progress updates sent to bulk job websockets
+BULK_JOB_PROGRESS_INTERVAL = 2
+# seconds alert template updates are collected for before the affected agents are recomputed
+ALERT_TEMPLATE_DEBOUNCE = 10
+# profile queries of a sample of api requests and superuser ones sent with X-Query-Profile
+QUERY_PROFILER_ENABLED = False
+QUERY_PROFILER_SAMPLE_RATE = 0.01
+# honour the X-Query-Profile header for every user, not only superusers
+QUERY_PROFILER_HEADER_ENABLED = False
 TRMM_PROTO = "https"
 TRMM_BACKEND_PORT = None
 
@@ -280,6 +309,9 @@ MIDDLEWARE = [
     "ee.sso.middleware.SSOIconMiddleware",
 ]
 
+if QUERY_PROFILER_ENABLED:
+    MIDDLEWARE.append("tacticalrmm.middleware.QueryProfilerMiddleware")
+
 if SWAGGER_ENABLED:
     INSTALLED_APPS += ("drf_spectacular",)
 
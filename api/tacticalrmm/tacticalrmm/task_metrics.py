@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection
+
+from tacticalrmm.cache import get_redis_client
+from tacticalrmm.logger import logger
+
+TASK_METRICS_PREFIX = "task_metrics:"
+SLOWEST_RUNS_KEY = f"{TASK_METRICS_PREFIX}slowest"
+# redis hash holding each counter, keyed by task name
+TASK_METRICS = {
+    "runs": "trmm_task_runs_total",
+    "failures": "trmm_task_failures_total",
+    "seconds": "trmm_task_duration_seconds_total",
+    "seconds_max": "trmm_task_duration_seconds_max",
+    "queries": "trmm_task_db_queries_total",
+    "query_seconds": "trmm_task_db_query_seconds_total",
+    "nats_requests": "trmm_task_nats_requests_total",
+    "lock_contended": "trmm_task_lock_contended_total",
+}
+
+# redis hash holding each counter of request stages, keyed by "name.stage"
+STAGE_METRICS = {
+    "stage_runs": "trmm_stage_runs_total",
+    "stage_seconds": "trmm_stage_duration_seconds_total",
+}
+
+# only raises the stored max, atomically so concurrent workers can't lower it.
+# Any further field, value pairs are set together with the new max
+SET_MAX_SCRIPT = """
+local current = redis.call("HGET", KEYS[1], ARGV[1])
+if not current or tonumber(ARGV[2]) > tonumber(current) then
+    redis.call("HSET", KEYS[1], unpack(ARGV))
+end
+"""
+
+_local = threading.local()
+
+
+def task_metrics_enabled() -> bool:
+    return getattr(settings, "TASK_METRICS_ENABLED", False)
+
+
+def _current_run() -> Optional[Dict[str, Any]]:
+    return getattr(_local, "run", None)
+
+
+def record_nats_request(count: int = 1) -> None:
+    if run := _current_run():
+        run["nats_requests"] += count
+
+
+def record_lock_contention(lock_id: str) -> None:
+    if run := _current_run():
+        run["lock_contended"] += 1
+        logger.debug(f"{run['task']} could not acquire {lock_id}")
+
+
+def _count_queries(execute, sql, params, many, context):
+    start = time.monotonic()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if run := _current_run():
+            run["queries"] += 1
+            run["query_seconds"] += time.monotonic() - start
+
+
+def start_run(task_name: str, task_id: str) -> None:
+    _local.run = {
+        "task": task_name,
+        "id": task_id,
+        "start": time.monotonic(),
+        "queries": 0,
+        "query_seconds": 0.0,
+        "nats_requests": 0,
+        "lock_contended": 0,
+    }
+    connection.execute_wrappers.append(_count_queries)
+
+
+def finish_run(failed: bool = False) -> Optional[Dict[str, Any]]:
+    run = _current_run()
+    if not run:
+        return None
+
+    _local.run = None
+    if _count_queries in connection.execute_wrappers:
+        connection.execute_wrappers.remove(_count_queries)
+
+    run["seconds"] = time.monotonic() - run.pop("start")
+    run["failed"] = failed
+
+    try:
+        _save_run(run)
+    except Exception as e:
+        logger.error(f"Unable to save task metrics for {run['task']}: {e}")
+
+    return run
+
+
+def _save_run(run: Dict[str, Any]) -> None:
+    r = get_redis_client()
+    task = run["task"]
+
+    pipe = r.pipeline()
+    pipe.hincrby(f"{TASK_METRICS_PREFIX}runs", task, 1)
+    pipe.hincrby(f"{TASK_METRICS_PREFIX}failures", task, int(run["failed"]))
+    pipe.hincrbyfloat(f"{TASK_METRICS_PREFIX}seconds", task, run["seconds"])
+    pipe.hincrby(f"{TASK_METRICS_PREFIX}queries", task, run["queries"])
+    pipe.hincrbyfloat(f"{TASK_METRICS_PREFIX}query_seconds", task, run["query_seconds"])
+    pipe.hincrby(f"{TASK_METRICS_PREFIX}nats_requests", task, run["nats_requests"])
+    pipe.hincrby(f"{TASK_METRICS_PREFIX}lock_contended", task, run["lock_contended"])
+    pipe.eval(
+        SET_MAX_SCRIPT, 1, f"{TASK_METRICS_PREFIX}seconds_max", task, run["seconds"]
+    )
+    pipe.execute()
+
+    # keep only the slowest runs
+    keep = getattr(settings, "TASK_METRICS_SLOWEST_RUNS", 50)
+    entry = {**run, "finished": time.time()}
+    r.zadd(SLOWEST_RUNS_KEY, {json.dumps(entry): run["seconds"]})
+    r.zremrangebyrank(SLOWEST_RUNS_KEY, 0, -keep - 1)
+
+
+class StageTimer:
+    """
+    Times the consecutive stages of a request or job, e.g.
+
+        timer = StageTimer("taskrunner")
+        ...
+        timer.lap("upsert")
+        ...
+        timer.lap("enqueue")
+        timer.save()
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.stages: Dict[str, float] = {}
+        self._last = time.monotonic()
+
+    def lap(self, stage: str) -> None:
+        now = time.monotonic()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def save(self) -> None:
+        if not task_metrics_enabled() or not self.stages:
+            return
+
+        try:
+            pipe = get_redis_client().pipeline()
+            for stage, seconds in self.stages.items():
+                key = f"{self.name}.{stage}"
+                pipe.hincrby(f"{TASK_METRICS_PREFIX}stage_runs", key, 1)
+                pipe.hincrbyfloat(f"{TASK_METRICS_PREFIX}stage_seconds", key, seconds)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Unable to save stage metrics for {self.name}: {e}")
+
+
+def get_slowest_runs() -> List[Dict[str, Any]]:
+    return [
+        json.loads(entry)
+        for entry in get_redis_client().zrevrange(SLOWEST_RUNS_KEY, 0, -1)
+    ]
+
+
+def render_prometheus() -> str:
+    r = get_redis_client()
+    lines = []
+    for field, metric in TASK_METRICS.items():
+        kind = "gauge" if field == "seconds_max" else "counter"
+        lines.append(f"# TYPE {metric} {kind}")
+        values = r.hgetall(f"{TASK_METRICS_PREFIX}{field}")
+        for task, value in sorted(values.items()):
+            lines.append(f'{metric}{{task="{task.decode()}"}} {float(value)}')
+
+    for field, metric in STAGE_METRICS.items():
+        lines.append(f"# TYPE {metric} counter")
+        values = r.hgetall(f"{TASK_METRICS_PREFIX}{field}")
+        for key, value in sorted(values.items()):
+            name, _, stage = key.decode().rpartition(".")
+            lines.append(f'{metric}{{name="{name}",stage="{stage}"}} {float(value)}')
+
+    return "\n".join(lines) + "\n"
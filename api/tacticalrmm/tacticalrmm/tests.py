@@ -1,9 +1,12 @@
 from unittest.mock import mock_open, patch
 
 import requests
+from django.db.models import Q
 from django.test import override_settings
+from model_bakery import baker
 
 from checks.constants import CHECK_DEFER, CHECK_RESULT_DEFER
+from agents.models import Agent
 from tacticalrmm.constants import (
     AGENT_DEFER,
     CHECKS_NON_EDITABLE_FIELDS,
@@ -11,10 +14,19 @@ from tacticalrmm.constants import (
     ONLINE_AGENTS,
     POLICY_CHECK_FIELDS_TO_COPY,
     POLICY_TASK_FIELDS_TO_COPY,
+    CustomFieldModel,
+    CustomFieldType,
 )
 from tacticalrmm.test import TacticalTestCase
 
-from .utils import bitdays_to_string, generate_winagent_exe, get_bit_days, reload_nats
+from .utils import (
+    DbValueResolver,
+    bitdays_to_string,
+    generate_winagent_exe,
+    get_bit_days,
+    get_db_value,
+    reload_nats,
+)
 
 
 class TestUtils(TacticalTestCase):
@@ -134,3 +146,440 @@ class TestUtils(TacticalTestCase):
 
         for i in CHECK_RESULT_DEFER:
             self.assertIn(i, check_result_fields)
+
+
+class TestDbValueResolver(TacticalTestCase):
+    def setUp(self):
+        self.setup_coresettings()
+
+        self.agents = baker.make_recipe("agents.agent", _quantity=3)
+        self.agent_field = baker.make(
+            "core.CustomField",
+            name="Agent Field",
+            model=CustomFieldModel.AGENT,
+            type=CustomFieldType.TEXT,
+            default_value_string="DEFAULT",
+        )
+        self.client_field = baker.make(
+            "core.CustomField",
+            name="Client Field",
+            model=CustomFieldModel.CLIENT,
+            type=CustomFieldType.CHECKBOX,
+        )
+        baker.make(
+            "agents.AgentCustomField",
+            agent=self.agents[0],
+            field=self.agent_field,
+            string_value="VALUE",
+        )
+        baker.make(
+            "clients.ClientCustomField",
+            client=self.agents[1].client,
+            field=self.client_field,
+            bool_value=True,
+        )
+        baker.make("core.GlobalKVStore", name="key", value="global value")
+
+        self.strings = [
+            "agent.Agent Field",
+            "client.Client Field",
+            "global.key",
+            "global.missing",
+            "agent.hostname",
+            "site.client.name",
+        ]
+
+    def test_matches_get_db_value(self):
+        agents = Agent.objects.select_related("site__client").filter(
+            pk__in=[agent.pk for agent in self.agents]
+        )
+        resolver = DbValueResolver(strings=self.strings, instances=agents)
+
+        for agent in agents:
+            for string in self.strings:
+                self.assertEqual(
+                    resolver.get_db_value(string=string, instance=agent),
+                    get_db_value(string=string, instance=agent),
+                    string,
+                )
+
+    def test_queries_dont_scale_with_instances(self):
+        agents = list(
+            Agent.objects.select_related("site__client").filter(
+                pk__in=[agent.pk for agent in self.agents]
+            )
+        )
+
+        # key store, custom field definitions and one query per custom field model
+        with self.assertNumQueries(4):
+            resolver = DbValueResolver(strings=self.strings, instances=agents)
+
+        with self.assertNumQueries(0):
+            for agent in agents:
+                for string in (
+                    "agent.Agent Field",
+                    "client.Client Field",
+                    "global.key",
+                ):
+                    resolver.get_db_value(string=string, instance=agent)
+
+    def test_from_texts_and_alert_instances(self):
+        agent = Agent.objects.select_related("site__client").get(pk=self.agents[0].pk)
+        alert = baker.make("alerts.Alert", agent=agent)
+        resolver = DbValueResolver.from_texts(
+            texts=["{{agent.Agent Field}} {{global.key}}", None, "{{alert.id}}"],
+            instances=[alert],
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                resolver.get_db_value(string="agent.Agent Field", instance=alert),
+                "VALUE",
+            )
+            self.assertEqual(
+                resolver.get_db_value(string="global.key", instance=alert),
+                "global value",
+            )
+            self.assertEqual(
+                resolver.get_db_value(string="alert.id", instance=alert), alert.id
+            )
+
+    def test_values_are_memoized(self):
+        resolver = DbValueResolver(strings=["site.client.name"], instances=[])
+        agent = Agent.objects.get(pk=self.agents[0].pk)
+
+        with self.assertNumQueries(2):
+            name = resolver.get_db_value(string="site.client.name", instance=agent)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                resolver.get_db_value(string="site.client.name", instance=agent), name
+            )
+
+
+class TestPruning(TacticalTestCase):
+    def _make_logs(self, model: str, quantity: int, days_old: int):
+        from django.utils import timezone as djangotime
+
+        logs = baker.make(model, _quantity=quantity)
+        for log in logs:
+            log.entry_time = djangotime.now() - djangotime.timedelta(days=days_old)
+            log.save()
+
+    def test_prune_in_batches(self):
+        from logs.models import DebugLog
+
+        from .pruning import prune_older_than
+
+        self._make_logs("logs.DebugLog", 25, 40)
+        self._make_logs("logs.DebugLog", 5, 1)
+
+        with patch("tacticalrmm.pruning.time.sleep") as sleep:
+            ret = prune_older_than(
+                DebugLog, field="entry_time", older_than_days=30, batch_size=10
+            )
+
+        self.assertEqual(ret["deleted"], 25)
+        self.assertEqual(ret["table"], "logs_debuglog")
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(DebugLog.objects.count(), 5)
+
+    @patch("tacticalrmm.pruning.cache")
+    def test_prune_resumes_from_checkpoint(self, cache):
+        from django.utils import timezone as djangotime
+
+        from logs.models import DebugLog
+
+        from .pruning import PRUNE_CHECKPOINT_TTL, prune_older_than
+
+        self._make_logs("logs.DebugLog", 5, 20)
+
+        # an interrupted run with a cutoff of 10 days ago had already deleted 7 rows
+        cutoff = djangotime.now() - djangotime.timedelta(days=10)
+        cache.get.return_value = {
+            "older_than_days": 30,
+            "cutoff": cutoff.isoformat(),
+            "deleted": 7,
+        }
+
+        ret = prune_older_than(DebugLog, field="entry_time", older_than_days=30)
+
+        self.assertEqual(ret["deleted"], 12)
+        self.assertEqual(DebugLog.objects.count(), 0)
+        cache.get.assert_called_with("prune_checkpoint_logs_debuglog")
+        cache.set.assert_called_with(
+            "prune_checkpoint_logs_debuglog",
+            {"older_than_days": 30, "cutoff": cutoff.isoformat(), "deleted": 7},
+            timeout=PRUNE_CHECKPOINT_TTL,
+        )
+        cache.delete.assert_any_call("prune_checkpoint_logs_debuglog")
+        cache.delete.assert_called_with("prune_lock_logs_debuglog")
+
+    @patch("tacticalrmm.pruning.cache")
+    def test_prune_skips_when_locked(self, cache):
+        from logs.models import DebugLog
+
+        from .pruning import prune_older_than
+
+        self._make_logs("logs.DebugLog", 5, 40)
+        cache.add.return_value = False
+
+        ret = prune_older_than(DebugLog, field="entry_time", older_than_days=30)
+
+        self.assertTrue(ret["skipped"])
+        self.assertEqual(DebugLog.objects.count(), 5)
+        cache.delete.assert_not_called()
+
+    def test_needs_collector(self):
+        from logs.models import AuditLog, DebugLog
+
+        from .pruning import _needs_collector
+
+        self.assertTrue(_needs_collector(Agent))
+        self.assertFalse(_needs_collector(DebugLog))
+        self.assertFalse(_needs_collector(AuditLog))
+
+    def test_prune_with_filters(self):
+        from django.utils import timezone as djangotime
+
+        from alerts.models import Alert
+
+        from .pruning import prune_older_than
+
+        old = djangotime.now() - djangotime.timedelta(days=40)
+        baker.make("alerts.Alert", resolved=True, alert_time=old, _quantity=3)
+        baker.make("alerts.Alert", resolved=False, alert_time=old, _quantity=2)
+
+        ret = prune_older_than(
+            Alert,
+            field="alert_time",
+            older_than_days=30,
+            filters=Q(resolved=True),
+            batch_size=2,
+            pause=0,
+        )
+
+        self.assertEqual(ret["deleted"], 3)
+        self.assertEqual(Alert.objects.count(), 2)
+
+
+class TestTaskMetrics(TacticalTestCase):
+    def setUp(self):
+        from .cache import get_redis_client
+
+        self.redis = get_redis_client()
+        self.clear()
+
+    def tearDown(self):
+        self.clear()
+
+    def clear(self):
+        keys = self.redis.keys("task_metrics:*")
+        if keys:
+            self.redis.delete(*keys)
+
+    def test_task_run_is_recorded(self):
+        from .task_metrics import (
+            finish_run,
+            get_slowest_runs,
+            record_lock_contention,
+            record_nats_request,
+            render_prometheus,
+            start_run,
+        )
+
+        start_run("core.tasks.test_task", "abc")
+        Agent.objects.count()
+        record_nats_request(2)
+        record_lock_contention("test-lock")
+        run = finish_run()
+
+        self.assertEqual(run["queries"], 1)
+        self.assertEqual(run["nats_requests"], 2)
+        self.assertEqual(run["lock_contended"], 1)
+
+        # nothing is recorded outside of a task run
+        Agent.objects.count()
+        record_nats_request()
+        self.assertIsNone(finish_run())
+
+        metrics = render_prometheus()
+        self.assertIn('trmm_task_runs_total{task="core.tasks.test_task"} 1.0', metrics)
+        self.assertIn(
+            'trmm_task_db_queries_total{task="core.tasks.test_task"} 1.0', metrics
+        )
+        self.assertIn(
+            'trmm_task_nats_requests_total{task="core.tasks.test_task"} 2.0', metrics
+        )
+
+        slowest = get_slowest_runs()
+        self.assertEqual(len(slowest), 1)
+        self.assertEqual(slowest[0]["id"], "abc")
+
+    @override_settings(TASK_METRICS_SLOWEST_RUNS=2)
+    def test_only_slowest_runs_are_kept(self):
+        from .task_metrics import finish_run, get_slowest_runs, start_run
+
+        for i in range(4):
+            start_run("core.tasks.test_task", str(i))
+            finish_run()
+
+        self.assertEqual(len(get_slowest_runs()), 2)
+
+    def test_seconds_max_only_rises(self):
+        from .task_metrics import finish_run, start_run
+
+        key = "task_metrics:seconds_max"
+        self.redis.hset(key, "core.tasks.test_task", 100)
+        start_run("core.tasks.test_task", "abc")
+        finish_run()
+        self.assertEqual(float(self.redis.hget(key, "core.tasks.test_task")), 100)
+
+        self.redis.hset(key, "core.tasks.test_task", -1)
+        start_run("core.tasks.test_task", "abc")
+        run = finish_run()
+        self.assertEqual(
+            float(self.redis.hget(key, "core.tasks.test_task")), run["seconds"]
+        )
+
+    def test_stage_timer(self):
+        from .task_metrics import StageTimer, render_prometheus
+
+        # nothing is saved unless metrics are enabled
+        timer = StageTimer("taskrunner")
+        timer.lap("upsert")
+        timer.save()
+        self.assertEqual(self.redis.keys("task_metrics:stage_*"), [])
+
+        with override_settings(TASK_METRICS_ENABLED=True):
+            for _ in range(2):
+                timer = StageTimer("taskrunner")
+                timer.lap("upsert")
+                timer.lap("enqueue")
+                timer.save()
+
+        metrics = render_prometheus()
+        self.assertIn(
+            'trmm_stage_runs_total{name="taskrunner",stage="upsert"} 2.0', metrics
+        )
+        self.assertIn(
+            'trmm_stage_duration_seconds_total{name="taskrunner",stage="enqueue"}',
+            metrics,
+        )
+
+    @override_settings(MON_TOKEN="token")
+    def test_task_metrics_view(self):
+        r = self.client.get("/core/v2/metrics/tasks/", HTTP_X_MON_TOKEN="token")
+        self.assertEqual(r.status_code, 200)
+        self.assertIn("# TYPE trmm_task_runs_total counter", r.content.decode())
+
+        r = self.client.get("/core/v2/metrics/tasks/")
+        self.assertEqual(r.status_code, 401)
+
+
+class TestQueryProfiler(TacticalTestCase):
+    def setUp(self):
+        from .query_profiler import reset_profiles
+
+        self.authenticate()
+        self.setup_coresettings()
+        reset_profiles()
+
+    def tearDown(self):
+        from .query_profiler import reset_profiles
+
+        reset_profiles()
+
+    def test_fingerprint(self):
+        from .query_profiler import fingerprint
+
+        self.assertEqual(
+            fingerprint('SELECT * FROM "a" WHERE "id" IN (%s, %s,\n %s)'),
+            'SELECT * FROM "a" WHERE "id" IN (...)',
+        )
+
+    def test_profiled_request(self):
+        from django.conf import settings
+
+        baker.make_recipe("agents.agent", _quantity=3)
+
+        with override_settings(
+            MIDDLEWARE=[
+                *settings.MIDDLEWARE,
+                "tacticalrmm.middleware.QueryProfilerMiddleware",
+            ],
+            QUERY_PROFILER_SAMPLE_RATE=0,
+        ):
+            # not sampled and no header
+            self.client.get("/agents/")
+            r = self.client.get("/core/queryprofile/")
+            self.assertEqual(r.data, [])
+
+            self.client.get("/agents/", HTTP_X_QUERY_PROFILE="1")
+            r = self.client.get("/core/queryprofile/")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.data), 1)
+        profile = r.data[0]
+        self.assertEqual(profile["view"], "agents.views.GetAgents")
+        self.assertEqual(profile["requests"], 1)
+        self.assertGreater(profile["avg_queries"], 0)
+        self.assertGreater(profile["avg_serializer_seconds"], 0)
+        self.assertGreater(profile["avg_response_bytes"], 0)
+
+        r = self.client.delete("/core/queryprofile/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.client.get("/core/queryprofile/").data, [])
+
+        self.check_not_authenticated("get", "/core/queryprofile/")
+
+    def test_save_profile_keeps_max(self):
+        from .query_profiler import get_profiles, save_profile
+
+        summary = {
+            "view": "view",
+            "seconds": 1.0,
+            "queries": 10,
+            "query_seconds": 0.5,
+            "duplicate_queries": 4,
+            "top_duplicate": {"sql": "SELECT 1", "count": 5},
+            "serializer_seconds": 0.1,
+            "response_bytes": 100,
+        }
+        save_profile(summary)
+        save_profile(
+            {**summary, "queries": 3, "top_duplicate": {"sql": "SELECT 2", "count": 2}}
+        )
+
+        profile = get_profiles()[0]
+        self.assertEqual(profile["requests"], 2)
+        self.assertEqual(profile["max_queries"], 10)
+        self.assertEqual(profile["top_duplicate"], {"sql": "SELECT 1", "count": 5})
+
+        save_profile({**summary, "top_duplicate": {"sql": "SELECT 3", "count": 6}})
+        self.assertEqual(
+            get_profiles()[0]["top_duplicate"], {"sql": "SELECT 3", "count": 6}
+        )
+
+    def test_header_needs_superuser(self):
+        from django.conf import settings
+
+        from .query_profiler import get_profiles
+
+        user = baker.make("accounts.User", is_active=True, is_superuser=False)
+        self.client.force_authenticate(user=user)
+
+        with override_settings(
+            MIDDLEWARE=[
+                *settings.MIDDLEWARE,
+                "tacticalrmm.middleware.QueryProfilerMiddleware",
+            ],
+            QUERY_PROFILER_SAMPLE_RATE=0,
+        ):
+            self.client.get("/agents/", HTTP_X_QUERY_PROFILE="1")
+            self.assertEqual(get_profiles(), [])
+
+            with override_settings(QUERY_PROFILER_HEADER_ENABLED=True):
+                self.client.get("/agents/", HTTP_X_QUERY_PROFILE="1")
+
+        self.assertEqual(len(get_profiles()), 1)
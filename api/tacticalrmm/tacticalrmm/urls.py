@@ -6,7 +6,7 @@ from accounts.views import CheckCredsV2, LoginViewV2
 from ee.sso.urls import allauth_urls
 
 # from agents.consumers import SendCMD
-from core.consumers import DashInfo, TerminalConsumer
+from core.consumers import BulkJobProgress, DashInfo, TerminalConsumer
 from core.views import home
 
 
@@ -81,6 +81,7 @@ if getattr(settings, "SWAGGER_ENABLED", False):
 
 ws_urlpatterns = [
     path("ws/dashinfo/", DashInfo.as_asgi()),
+    path("ws/bulkjob/<int:pk>/", BulkJobProgress.as_asgi()),
     # path("ws/sendcmd/", SendCMD.as_asgi()),
 ]
 
@@ -6,7 +6,17 @@ import subprocess
 import tempfile
 import time
 from contextlib import contextmanager
-from typing import TYPE_CHECKING, List, Literal, Optional, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Union,
+)
 from zoneinfo import ZoneInfo
 
 import requests
@@ -15,11 +25,12 @@ from channels.db import database_sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
+from django.db.models import Q
 from django.http import FileResponse
 from knox.auth import TokenAuthentication
 from rest_framework.response import Response
 
-from agents.models import Agent
+from agents.models import Agent, AgentCustomField
 from core.utils import get_core_settings, token_is_valid
 from logs.models import DebugLog
 from tacticalrmm.celery import app as celery_app
@@ -41,6 +52,7 @@ from tacticalrmm.helpers import (
     get_nats_ports,
     notify_error,
 )
+from tacticalrmm.task_metrics import record_lock_contention
 
 if TYPE_CHECKING:
     from alerts.models import Alert
@@ -185,7 +197,7 @@ def reload_nats() -> None:
     ]
     agents = Agent.objects.prefetch_related("user").only(
         "pk", "agent_id"
-    )  # type:ignore
+    )  # type: ignore
     for agent in agents:
         try:
             users.append(
@@ -366,9 +378,15 @@ def get_db_value(
     except CustomField.DoesNotExist:
         pass
 
+    return _get_instance_value(props=props, instance=instance)
+
+
+# walks the properties of a model instance and returns the value. Relations are resolved
+# recursively i.e. ["client", "site", "id"]
+def _get_instance_value(*, props: List[str], instance: Any) -> Any:
     # if the instance is the same as the first prop. We remove it.
     if props[0] == instance.__class__.__name__.lower():
-        del props[0]
+        props = props[1:]
 
     instance_value = instance
 
@@ -386,11 +404,188 @@ def get_db_value(
     return instance_value
 
 
+class DbValueResolver:
+    """
+    Resolves the same placeholders as get_db_value for many instances at once.
+
+    The custom field definitions, custom field values and global key store entries
+    used by the placeholders are fetched up front with one query each, instead of
+    several queries per placeholder per instance. Instances should be loaded with
+    select_related("site__client") so relation lookups don't query either.
+    Resolved values are memoized, so a resolver should only live for one run.
+    """
+
+    CUSTOM_FIELD_MODELS = ("agent", "client", "site")
+
+    def __init__(
+        self,
+        *,
+        strings: Iterable[str],
+        instances: Iterable[Union["Agent", "Client", "Site", "Alert"]],
+    ) -> None:
+        from core.models import CustomField, GlobalKVStore
+
+        self._values: Dict[Tuple[str, Optional[str], Any], Any] = {}
+
+        all_props = [string.strip().split(".") for string in strings]
+
+        global_names = {
+            props[1] for props in all_props if props[0] == "global" and len(props) == 2
+        }
+        self.global_values: Dict[str, str] = (
+            dict(
+                GlobalKVStore.objects.filter(name__in=global_names).values_list(
+                    "name", "value"
+                )
+            )
+            if global_names
+            else {}
+        )
+
+        field_lookup = Q()
+        for props in all_props:
+            if len(props) == 2 and props[0] in self.CUSTOM_FIELD_MODELS:
+                field_lookup |= Q(model=props[0], name=props[1])
+
+        self.custom_fields: Dict[Tuple[str, str], "CustomField"] = (
+            {
+                (field.model, field.name): field
+                for field in CustomField.objects.filter(field_lookup)
+            }
+            if field_lookup
+            else {}
+        )
+
+        # keyed on model, field id and id of the client, site or agent the value is for
+        self.custom_field_values: Dict[Tuple[str, int, int], Any] = {}
+        instances = list(instances)
+        for model in {model for model, _ in self.custom_fields}:
+            fields = {
+                field.id: field
+                for (field_model, _), field in self.custom_fields.items()
+                if field_model == model
+            }
+            related_ids = {
+                self._related_id(instance=instance, model=model)
+                for instance in instances
+            } - {None}
+
+            for field_value in self._value_model(model).objects.filter(
+                field_id__in=fields.keys(), **{f"{model}_id__in": related_ids}
+            ):
+                # reuse the fetched definition so .value doesn't query it again
+                field_value.field = fields[field_value.field_id]
+                self.custom_field_values[
+                    (model, field_value.field_id, getattr(field_value, f"{model}_id"))
+                ] = field_value
+
+    @classmethod
+    def from_texts(
+        cls,
+        *,
+        texts: Iterable[Optional[str]],
+        instances: Iterable[Union["Agent", "Client", "Site", "Alert"]],
+    ) -> "DbValueResolver":
+        return cls(
+            strings=[
+                f"{model}.{prop}"
+                for text in texts
+                if text
+                for _, model, prop in RE_DB_VALUE.findall(text)
+            ],
+            instances=instances,
+        )
+
+    @staticmethod
+    def _value_model(model: str) -> Any:
+        from clients.models import ClientCustomField, SiteCustomField
+
+        return {
+            "agent": AgentCustomField,
+            "client": ClientCustomField,
+            "site": SiteCustomField,
+        }[model]
+
+    @staticmethod
+    def _related_id(*, instance: Any, model: str) -> Optional[int]:
+        if model == instance.__class__.__name__.lower():
+            return instance.id
+
+        related = getattr(instance, model, None)
+        return getattr(related, "id", None)
+
+    def get_db_value(
+        self,
+        *,
+        string: str,
+        instance: Optional[Union["Agent", "Client", "Site", "Alert"]] = None,
+    ) -> Union[str, List[str], Literal[True], Literal[False], None]:
+        key = (
+            string,
+            instance.__class__.__name__ if instance else None,
+            instance.pk if instance else None,
+        )
+        if key not in self._values:
+            self._values[key] = self._resolve(string=string, instance=instance)
+
+        return self._values[key]
+
+    def _resolve(
+        self,
+        *,
+        string: str,
+        instance: Optional[Union["Agent", "Client", "Site", "Alert"]] = None,
+    ) -> Union[str, List[str], Literal[True], Literal[False], None]:
+        props = string.strip().split(".")
+
+        if props[0] == "global" and len(props) == 2:
+            if props[1] in self.global_values:
+                return self.global_values[props[1]]
+
+            DebugLog.error(
+                log_type=DebugLogType.SCRIPTING,
+                message=f"Couldn't lookup value for: {string}. Make sure it exists in CoreSettings > Key Store",
+            )
+            return None
+
+        if not instance:
+            return None
+
+        field = (
+            self.custom_fields.get((props[0], props[1])) if len(props) == 2 else None
+        )
+        if field:
+            related_id = self._related_id(instance=instance, model=props[0])
+            field_value = self.custom_field_values.get((props[0], field.id, related_id))
+
+            if field_value is None:
+                return (
+                    field.default_value
+                    if field.type != CustomFieldType.CHECKBOX
+                    else bool(field.default_value)
+                )
+
+            value = field_value.value
+            if field.type != CustomFieldType.CHECKBOX:
+                return value or field.default_value
+
+            return bool(value)
+
+        return _get_instance_value(props=props, instance=instance)
+
+
 def replace_arg_db_values(
-    string: str, instance=None, shell: str = None, quotes=True  # type:ignore
+    string: str,
+    instance=None,
+    shell: str = None,  # type: ignore
+    quotes=True,
+    resolver: Optional[DbValueResolver] = None,
 ) -> Union[str, None]:
     # resolve the value
-    value = get_db_value(string=string, instance=instance)
+    if resolver:
+        value = resolver.get_db_value(string=string, instance=instance)
+    else:
+        value = get_db_value(string=string, instance=instance)
 
     # check for model and property
     if value is None:
@@ -446,6 +641,8 @@ def format_shell_bool(value: bool, shell: Optional[str]) -> str:
 def redis_lock(lock_id, oid):
     timeout_at = time.monotonic() + REDIS_LOCK_EXPIRE - 3
     status = cache.add(lock_id, oid, REDIS_LOCK_EXPIRE)
+    if not status:
+        record_lock_contention(lock_id)
     try:
         yield status
     finally:
@@ -1,8 +1,6 @@
 import asyncio
-import datetime as dt
 import time
 from contextlib import suppress
-from zoneinfo import ZoneInfo
 
 from django.conf import settings
 from django.utils import timezone as djangotime
@@ -11,7 +9,16 @@ from packaging import version as pyver
 from agents.models import Agent
 from logs.models import DebugLog
 from tacticalrmm.celery import app
-from tacticalrmm.constants import AGENT_STATUS_ONLINE, DebugLogType
+from tacticalrmm.constants import AGENT_STATUS_ONLINE, ONLINE_AGENTS, DebugLogType
+from tacticalrmm.exceptions import NatsDown
+from tacticalrmm.nats_utils import abulk_nats_command
+from winupdate.utils import (
+    PATCH_POLICY_AGENT_FIELDS,
+    agents_in_patch_window,
+    bulk_approve_updates,
+    bulk_delete_superseded_updates,
+    get_approved_update_guids,
+)
 
 
 @app.task
@@ -21,15 +28,18 @@ def auto_approve_updates_task() -> None:
     if getattr(settings, "TRMM_DISABLE_APPROVE_UPDATES_TASK", False):
         return
 
-    agents = Agent.objects.only(
-        "pk", "agent_id", "version", "last_seen", "overdue_time", "offline_time"
+    bulk_delete_superseded_updates()
+
+    agents = Agent.objects.select_related("site__client").only(
+        "pk",
+        "agent_id",
+        "version",
+        "last_seen",
+        "overdue_time",
+        "offline_time",
+        *PATCH_POLICY_AGENT_FIELDS,
     )
-    for agent in agents:
-        agent.delete_superseded_updates()
-        try:
-            agent.approve_updates()
-        except:
-            continue
+    bulk_approve_updates(agents)
 
     online = [
         i
@@ -51,77 +61,56 @@ def check_agent_update_schedule_task() -> None:
     if getattr(settings, "TRMM_DISABLE_WINUPDATES_INSTALL_TASK", False):
         return
     # scheduled task that installs updates on agents if enabled
-    for agent in Agent.online_agents(min_version="1.3.0"):
-        if agent.is_posix:
-            continue
-
-        agent.delete_superseded_updates()
-        install = False
-        patch_policy = agent.get_patch_policy()
-
-        # check if auto approval is enabled
-        if (
-            patch_policy.critical == "approve"
-            or patch_policy.important == "approve"
-            or patch_policy.moderate == "approve"
-            or patch_policy.low == "approve"
-            or patch_policy.other == "approve"
-        ):
-            # get current time in agent local time
-            timezone = ZoneInfo(agent.timezone)
-            agent_localtime_now = dt.datetime.now(timezone)
-            weekday = agent_localtime_now.weekday()
-            hour = agent_localtime_now.hour
-            day = agent_localtime_now.day
-
-            if agent.patches_last_installed:
-                # get agent last installed time in local time zone
-                last_installed = agent.patches_last_installed.astimezone(timezone)
-
-                # check if patches were already run for this cycle and exit if so
-                if last_installed.strftime("%d/%m/%Y") == agent_localtime_now.strftime(
-                    "%d/%m/%Y"
-                ):
-                    continue
-
-            # check if schedule is set to daily/weekly and if now is the time to run
-            if (
-                patch_policy.run_time_frequency == "daily"
-                and weekday in patch_policy.run_time_days
-                and patch_policy.run_time_hour == hour
-            ):
-                install = True
-
-            elif patch_policy.run_time_frequency == "monthly":
-                if patch_policy.run_time_day > 28:
-                    months_with_30_days = [3, 6, 9, 11]
-                    current_month = agent_localtime_now.month
-                    if current_month == 2:
-                        patch_policy.run_time_day = 28
-                    elif current_month in months_with_30_days:
-                        patch_policy.run_time_day = 30
-
-                # check if patches were scheduled to run today and now
-                if (
-                    day == patch_policy.run_time_day
-                    and patch_policy.run_time_hour == hour
-                ):
-                    install = True
-
-            if install:
-                # initiate update on agent asynchronously and don't worry about ret code
-                DebugLog.info(
-                    agent=agent,
-                    log_type=DebugLogType.WIN_UPDATES,
-                    message=f"Installing windows updates on {agent.hostname}",
-                )
-                nats_data = {
-                    "func": "installwinupdates",
-                    "guids": agent.get_approved_update_guids(),
-                }
-                asyncio.run(agent.nats_cmd(nats_data, wait=False))
-                agent.patches_last_installed = djangotime.now()
-                agent.save(update_fields=["patches_last_installed"])
+    agents = [
+        agent
+        for agent in Agent.objects.select_related("site__client").only(
+            *ONLINE_AGENTS,
+            "hostname",
+            "time_zone",
+            "patches_last_installed",
+            *PATCH_POLICY_AGENT_FIELDS,
+        )
+        if not agent.is_posix
+        and agent.status == AGENT_STATUS_ONLINE
+        and pyver.parse(agent.version) >= pyver.parse("1.3.0")
+    ]
+    bulk_delete_superseded_updates(agent_ids=[agent.pk for agent in agents])
+
+    install = agents_in_patch_window(agents)
+    if not install:
+        return
+
+    guids = get_approved_update_guids(agent.pk for agent in install)
+    for agent in install:
+        DebugLog.info(
+            agent=agent,
+            log_type=DebugLogType.WIN_UPDATES,
+            message=f"Installing windows updates on {agent.hostname}",
+        )
+
+    # initiate updates on the agents asynchronously and don't worry about ret codes
+    try:
+        asyncio.run(
+            abulk_nats_command(
+                items=[
+                    (
+                        agent.agent_id,
+                        {"func": "installwinupdates", "guids": guids[agent.pk]},
+                    )
+                    for agent in install
+                ]
+            )
+        )
+    except NatsDown:
+        DebugLog.error(
+            log_type=DebugLogType.WIN_UPDATES,
+            message="Unable to install windows updates, nats is down",
+        )
+        return
+
+    Agent.objects.filter(pk__in=[agent.pk for agent in install]).update(
+        patches_last_installed=djangotime.now()
+    )
 
 
 @app.task
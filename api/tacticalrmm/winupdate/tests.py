@@ -192,3 +192,279 @@ class WinupdateTasks(TacticalTestCase):
     #     winupdates = WinUpdate.objects.all()
     #     for update in winupdates:
     #         self.assertEqual(update.action, "approve")
+
+
+class TestSupersededUpdates(TacticalTestCase):
+    def setUp(self):
+        self.setup_coresettings()
+        self.agent = baker.make_recipe("agents.agent")
+
+    def make_defender_updates(self, agent, versions):
+        return [
+            baker.make(
+                "winupdate.WinUpdate",
+                agent=agent,
+                kb="KB2267602",
+                title=f"Security Intelligence Update for Microsoft Defender Antivirus - KB2267602 (Version {ver})",
+            )
+            for ver in versions
+        ]
+
+    def test_find_superseded_updates_version_order(self):
+        from .utils import find_superseded_updates
+
+        updates = [
+            (1, "KB1", "Defender (Version 1.10.0)"),
+            (2, "KB1", "Defender (Version 1.9.0)"),
+            (3, "KB1", "Defender (Versão 1.2.0)"),
+            (4, "KB2", "Cumulative Update"),
+        ]
+        # versions are compared numerically, not as strings
+        self.assertEqual(find_superseded_updates(updates), {2, 3})
+
+    def test_find_superseded_updates_shared_title_root(self):
+        from .utils import find_superseded_updates
+
+        updates = [
+            (1, "KB1", "Defender Update (Version 1.1)"),
+            (2, "KB1", "Defender Update (Version 1.2)"),
+            (3, "KB2", "Defender Update (Version 1.1)"),
+            (4, "KB2", "Defender Update (Version 1.3)"),
+            (5, "KB2", "Defender Update (Version 1.2)"),
+            # kbs without a parsable version are left alone
+            (6, "KB3", "Defender Update"),
+            (7, "KB3", "Defender Update (Version 2.0)"),
+            (8, "KB4", "Defender Update (Version 1.1)"),
+        ]
+        self.assertEqual(find_superseded_updates(updates), {1, 3, 5})
+
+    def test_delete_superseded_updates(self):
+        old, _, new = self.make_defender_updates(
+            self.agent, ["1.381.10.0", "1.381.9.0", "1.381.11.0"]
+        )
+        other_agent = baker.make_recipe("agents.agent")
+        other = self.make_defender_updates(other_agent, ["1.1.0", "1.2.0"])
+
+        with self.assertNumQueries(2):
+            self.agent.delete_superseded_updates()
+
+        self.assertEqual(
+            list(self.agent.winupdates.values_list("pk", flat=True)), [new.pk]
+        )
+        # other agents are not touched
+        self.assertEqual(other_agent.winupdates.count(), len(other))
+
+    def test_bulk_delete_superseded_updates(self):
+        from .utils import bulk_delete_superseded_updates
+
+        agents = baker.make_recipe("agents.agent", _quantity=3)
+        latest = {}
+        for agent in agents:
+            *_, latest[agent.pk] = self.make_defender_updates(
+                agent, ["1.0.0", "1.1.0", "1.2.0"]
+            )
+            baker.make("winupdate.WinUpdate", agent=agent, kb="KB5000001")
+
+        # scoped to a subset of agents
+        self.assertEqual(bulk_delete_superseded_updates(agent_ids=[agents[0].pk]), 2)
+        self.assertEqual(agents[0].winupdates.count(), 2)
+        self.assertEqual(agents[1].winupdates.count(), 4)
+
+        # whole fleet, in chunks
+        self.assertEqual(bulk_delete_superseded_updates(chunk_size=1), 4)
+        for agent in agents:
+            self.assertEqual(
+                set(agent.winupdates.values_list("kb", flat=True)),
+                {"KB2267602", "KB5000001"},
+            )
+            self.assertTrue(agent.winupdates.filter(pk=latest[agent.pk].pk).exists())
+
+        self.assertEqual(bulk_delete_superseded_updates(), 0)
+
+
+class TestBulkApproveUpdates(TacticalTestCase):
+    def setUp(self):
+        self.setup_coresettings()
+
+        self.policy = baker.make("automation.Policy", active=True)
+        baker.make(
+            "winupdate.WinUpdatePolicy",
+            policy=self.policy,
+            critical="approve",
+            important="manual",
+        )
+        client = baker.make("clients.Client", workstation_policy=self.policy)
+        site = baker.make("clients.Site", client=client)
+
+        self.inherits = baker.make_recipe(
+            "agents.agent", site=site, monitoring_type="workstation"
+        )
+        self.overrides = baker.make_recipe(
+            "agents.agent", site=site, monitoring_type="workstation"
+        )
+        baker.make(
+            "winupdate.WinUpdatePolicy", agent=self.overrides, important="approve"
+        )
+        self.excluded = baker.make_recipe(
+            "agents.agent", site=site, monitoring_type="workstation"
+        )
+        self.policy.excluded_agents.add(self.excluded)
+        self.blocked = baker.make_recipe(
+            "agents.agent",
+            site=site,
+            monitoring_type="workstation",
+            block_policy_inheritance=True,
+        )
+        self.server = baker.make_recipe(
+            "agents.agent", site=site, monitoring_type="server"
+        )
+        self.agents = [
+            self.inherits,
+            self.overrides,
+            self.excluded,
+            self.blocked,
+            self.server,
+        ]
+
+    def fleet(self):
+        from agents.models import Agent
+
+        return list(Agent.objects.select_related("site__client").order_by("pk"))
+
+    def test_get_patch_policies_matches_agent(self):
+        from .utils import approved_severities, get_patch_policies
+
+        policies = get_patch_policies(self.fleet())
+
+        for agent in self.agents:
+            patch_policy = agent.get_patch_policy()
+            self.assertEqual(
+                approved_severities(policies[agent.pk]),
+                approved_severities(patch_policy),
+            )
+            self.assertEqual(
+                policies[agent.pk].run_time_frequency, patch_policy.run_time_frequency
+            )
+
+        self.assertEqual(approved_severities(policies[self.inherits.pk]), ("Critical",))
+        self.assertEqual(
+            approved_severities(policies[self.overrides.pk]), ("Critical", "Important")
+        )
+        self.assertEqual(approved_severities(policies[self.excluded.pk]), ())
+        self.assertEqual(approved_severities(policies[self.blocked.pk]), ())
+
+        # every agent has its own patch policy now, and only one
+        for agent in self.agents:
+            self.assertEqual(agent.winupdatepolicy.count(), 1)
+
+    def test_bulk_approve_updates(self):
+        from .utils import bulk_approve_updates
+
+        for agent in self.agents:
+            baker.make_recipe("winupdate.winupdate", agent=agent, _quantity=5)
+            baker.make_recipe(
+                "winupdate.winupdate", agent=agent, severity="Critical", installed=True
+            )
+
+        self.assertEqual(bulk_approve_updates(self.fleet()), 3)
+
+        approved = WinUpdate.objects.filter(action="approve")
+        self.assertEqual(
+            set(approved.values_list("agent_id", "severity")),
+            {
+                (self.inherits.pk, "Critical"),
+                (self.overrides.pk, "Critical"),
+                (self.overrides.pk, "Important"),
+            },
+        )
+
+    def test_bulk_approve_updates_queries(self):
+        from .utils import bulk_approve_updates
+
+        fleet = self.fleet()
+        # core settings, policies, exclusions, patch policies, creating the missing
+        # agent patch policies and one update per severity group
+        with self.assertNumQueries(10):
+            bulk_approve_updates(fleet)
+
+        # doesn't grow with the fleet
+        site = self.inherits.site
+        baker.make_recipe(
+            "agents.agent", site=site, monitoring_type="workstation", _quantity=10
+        )
+        fleet = self.fleet()
+        with self.assertNumQueries(10):
+            bulk_approve_updates(fleet)
+
+
+class TestPatchSchedule(TacticalTestCase):
+    def setUp(self):
+        self.setup_coresettings()
+
+    def test_patch_window_open(self):
+        from datetime import datetime as dt
+
+        from .utils import patch_window_open
+
+        policy = baker.prepare(
+            "winupdate.WinUpdatePolicy",
+            critical="approve",
+            run_time_frequency="daily",
+            run_time_hour=3,
+            run_time_days=[0],
+        )
+        # monday
+        self.assertTrue(patch_window_open(policy, dt(2026, 10, 19, 3)))
+        self.assertFalse(patch_window_open(policy, dt(2026, 10, 19, 4)))
+        self.assertFalse(patch_window_open(policy, dt(2026, 10, 20, 3)))
+
+        # runs on the last day of short months
+        policy.run_time_frequency = "monthly"
+        policy.run_time_day = 31
+        self.assertTrue(patch_window_open(policy, dt(2026, 2, 28, 3)))
+        self.assertTrue(patch_window_open(policy, dt(2026, 6, 30, 3)))
+        self.assertFalse(patch_window_open(policy, dt(2026, 6, 29, 3)))
+
+        # nothing approved automatically
+        policy.critical = "manual"
+        self.assertFalse(patch_window_open(policy, dt(2026, 2, 28, 3)))
+
+    @patch("winupdate.tasks.abulk_nats_command")
+    def test_check_agent_update_schedule_task(self, abulk_nats_command):
+        from django.utils import timezone as djangotime
+
+        from agents.models import Agent
+
+        from .tasks import check_agent_update_schedule_task
+
+        def make_agent(**kwargs):
+            agent = baker.make_recipe(
+                "agents.agent",
+                time_zone="America/Los_Angeles",
+                **{"last_seen": djangotime.now(), **kwargs},
+            )
+            baker.make_recipe("winupdate.winupdate_approve", agent=agent)
+            return agent
+
+        due = make_agent()
+        approved = baker.make_recipe(
+            "winupdate.approved_winupdate", agent=due, _quantity=2
+        )
+        baker.make_recipe("winupdate.approved_winupdate", agent=due, installed=True)
+        installed_today = make_agent(patches_last_installed=djangotime.now())
+        offline = make_agent(last_seen=djangotime.now() - djangotime.timedelta(days=1))
+        baker.make_recipe("winupdate.approved_winupdate", agent=installed_today)
+        baker.make_recipe("winupdate.approved_winupdate", agent=offline)
+
+        check_agent_update_schedule_task()
+
+        abulk_nats_command.assert_called_once()
+        (items,) = abulk_nats_command.call_args.kwargs.values()
+        self.assertEqual(len(items), 1)
+        agent_id, data = items[0]
+        self.assertEqual(agent_id, due.agent_id)
+        self.assertEqual(data["func"], "installwinupdates")
+        self.assertEqual(sorted(data["guids"]), sorted(u.guid for u in approved))
+
+        self.assertIsNotNone(Agent.objects.get(pk=due.pk).patches_last_installed)
+        self.assertIsNone(Agent.objects.get(pk=offline.pk).patches_last_installed)
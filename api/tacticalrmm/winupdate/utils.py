@@ -0,0 +1,370 @@
+import copy
+import datetime as dt
+import re
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.db.models import Count
+from packaging.version import InvalidVersion, Version
+
+from core.utils import get_core_settings
+
+if TYPE_CHECKING:
+    from agents.models import Agent
+    from winupdate.models import WinUpdatePolicy
+
+# extracts the version from titles like "Microsoft Defender ... (Version 1.2.3)"
+RE_UPDATE_VERSION = re.compile(r"\((Version|Versão)(.*?)\)", flags=re.IGNORECASE)
+
+UpdateRow = Tuple[int, Optional[str], Optional[str]]
+
+# agent fields get_patch_policies needs, for Agent.objects.only()
+PATCH_POLICY_AGENT_FIELDS = (
+    "monitoring_type",
+    "policy",
+    "block_policy_inheritance",
+    "site__block_policy_inheritance",
+    "site__workstation_policy",
+    "site__server_policy",
+    "site__client__block_policy_inheritance",
+    "site__client__workstation_policy",
+    "site__client__server_policy",
+)
+
+# patch policy field and the update severity it approves
+APPROVAL_SEVERITIES = (
+    ("critical", "Critical"),
+    ("important", "Important"),
+    ("moderate", "Moderate"),
+    ("low", "Low"),
+    ("other", ""),
+)
+
+
+def find_superseded_updates(updates: Iterable[UpdateRow]) -> Set[int]:
+    """
+    Takes the (pk, kb, title) rows of one agent's updates and returns the pks of
+    the updates that have a newer version with the same kb.
+    """
+    by_kb: Dict[Optional[str], List[Tuple[int, str]]] = defaultdict(list)
+    for pk, kb, title in sorted(updates, key=lambda u: u[0]):
+        by_kb[kb].append((pk, title or ""))
+
+    pks = set()
+    for rows in by_kb.values():
+        if len(rows) < 2:
+            continue
+
+        # sort from oldest to newest, skip if no version info is available
+        try:
+            vers = [RE_UPDATE_VERSION.search(title).group(2).strip() for _, title in rows]  # type: ignore
+            sorted_vers = sorted(vers, key=Version)
+        except (AttributeError, InvalidVersion):
+            continue
+
+        # all but the latest version are superseded
+        for ver in sorted_vers[:-1]:
+            pks.add(next(pk for pk, title in rows if ver in title))
+
+    return pks
+
+
+def bulk_delete_superseded_updates(
+    agent_ids: Optional[Iterable[int]] = None, chunk_size: int = 500
+) -> int:
+    """
+    Deletes superseded updates of all agents, or only agent_ids, loading the
+    updates of chunk_size agents at a time. Returns the number of deleted updates.
+    """
+    from winupdate.models import WinUpdate
+
+    # only agents with more than one update per kb can have superseded updates
+    dupes = (
+        WinUpdate.objects.values("agent_id", "kb")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+    )
+    if agent_ids is not None:
+        dupes = dupes.filter(agent_id__in=list(agent_ids))
+
+    agents = sorted({d["agent_id"] for d in dupes})
+
+    deleted = 0
+    for i in range(0, len(agents), chunk_size):
+        updates: Dict[int, List[UpdateRow]] = defaultdict(list)
+        for agent_id, pk, kb, title in WinUpdate.objects.filter(
+            agent_id__in=agents[i : i + chunk_size]
+        ).values_list("agent_id", "pk", "kb", "title"):
+            updates[agent_id].append((pk, kb, title))
+
+        pks = set().union(*(find_superseded_updates(u) for u in updates.values()))
+        if pks:
+            deleted += WinUpdate.objects.filter(pk__in=pks).delete()[0]
+
+    return deleted
+
+
+def merge_patch_policy(
+    patch_policy: "WinUpdatePolicy", agent_policy: "WinUpdatePolicy"
+) -> "WinUpdatePolicy":
+    # agent settings that aren't set to inherit override the automation policy
+    if agent_policy.critical != "inherit":
+        patch_policy.critical = agent_policy.critical
+
+    if agent_policy.important != "inherit":
+        patch_policy.important = agent_policy.important
+
+    if agent_policy.moderate != "inherit":
+        patch_policy.moderate = agent_policy.moderate
+
+    if agent_policy.low != "inherit":
+        patch_policy.low = agent_policy.low
+
+    if agent_policy.other != "inherit":
+        patch_policy.other = agent_policy.other
+
+    if agent_policy.run_time_frequency != "inherit":
+        patch_policy.run_time_frequency = agent_policy.run_time_frequency
+        patch_policy.run_time_hour = agent_policy.run_time_hour
+        patch_policy.run_time_days = agent_policy.run_time_days
+
+    if agent_policy.reboot_after_install != "inherit":
+        patch_policy.reboot_after_install = agent_policy.reboot_after_install
+
+    if not agent_policy.reprocess_failed_inherit:
+        patch_policy.reprocess_failed = agent_policy.reprocess_failed
+        patch_policy.reprocess_failed_times = agent_policy.reprocess_failed_times
+        patch_policy.email_if_fail = agent_policy.email_if_fail
+
+    return patch_policy
+
+
+def approved_severities(patch_policy: "WinUpdatePolicy") -> Tuple[str, ...]:
+    return tuple(
+        severity
+        for field, severity in APPROVAL_SEVERITIES
+        if getattr(patch_policy, field) == "approve"
+    )
+
+
+def get_patch_policies(agents: "Sequence[Agent]") -> "Dict[int, WinUpdatePolicy]":
+    """
+    Returns the effective patch policy of each agent keyed by the agent's pk, the
+    same as Agent.get_patch_policy but with a fixed number of queries for the
+    whole fleet. The agents need their site and client selected. Agents without a
+    patch policy get one created.
+    """
+    from automation.models import Policy
+    from winupdate.models import WinUpdatePolicy
+
+    core = get_core_settings()
+
+    # the automation policies of each agent in order of priority, as in
+    # Agent.get_agent_policies
+    candidates: Dict[int, List[Optional[int]]] = {}
+    for agent in agents:
+        site, client = agent.site, agent.site.client
+        mon_type = agent.monitoring_type
+        candidates[agent.pk] = [
+            agent.policy_id,
+            (
+                None
+                if agent.block_policy_inheritance
+                else getattr(site, f"{mon_type}_policy_id", None)
+            ),
+            (
+                None
+                if agent.block_policy_inheritance or site.block_policy_inheritance
+                else getattr(client, f"{mon_type}_policy_id", None)
+            ),
+            (
+                None
+                if agent.block_policy_inheritance
+                or site.block_policy_inheritance
+                or client.block_policy_inheritance
+                else getattr(core, f"{mon_type}_policy_id", None)
+            ),
+        ]
+
+    policy_ids = {pk for pks in candidates.values() for pk in pks if pk}
+    active = set(
+        Policy.objects.filter(pk__in=policy_ids, active=True).values_list(
+            "pk", flat=True
+        )
+    )
+
+    excluded: Dict[str, Dict[int, Set[int]]] = {}
+    for relation in ("agent", "site", "client"):
+        through = getattr(Policy, f"excluded_{relation}s").through
+        excluded[relation] = defaultdict(set)
+        for policy_id, pk in through.objects.filter(policy_id__in=active).values_list(
+            "policy_id", f"{relation}_id"
+        ):
+            excluded[relation][policy_id].add(pk)
+
+    policy_patch_policies: "Dict[int, WinUpdatePolicy]" = {}
+    for patch_policy in WinUpdatePolicy.objects.filter(policy_id__in=active).order_by(
+        "-pk"
+    ):
+        policy_patch_policies[patch_policy.policy_id] = patch_policy
+
+    agent_patch_policies: "Dict[int, WinUpdatePolicy]" = {}
+    for patch_policy in WinUpdatePolicy.objects.filter(
+        agent_id__in=candidates.keys()
+    ).order_by("-pk"):
+        agent_patch_policies[patch_policy.agent_id] = patch_policy
+
+    missing = [pk for pk in candidates if pk not in agent_patch_policies]
+    for patch_policy in WinUpdatePolicy.objects.bulk_create(
+        [WinUpdatePolicy(agent_id=pk) for pk in missing]
+    ):
+        agent_patch_policies[patch_policy.agent_id] = patch_policy
+
+    ret: "Dict[int, WinUpdatePolicy]" = {}
+    for agent in agents:
+        agent_policy = agent_patch_policies[agent.pk]
+        policy_id = next(
+            (
+                pk
+                for pk in candidates[agent.pk]
+                if pk in policy_patch_policies
+                and agent.pk not in excluded["agent"][pk]
+                and agent.site_id not in excluded["site"][pk]
+                and agent.site.client_id not in excluded["client"][pk]
+            ),
+            None,
+        )
+
+        if policy_id is None:
+            ret[agent.pk] = agent_policy
+        else:
+            # policies are shared between agents, merge into a copy
+            ret[agent.pk] = merge_patch_policy(
+                copy.copy(policy_patch_policies[policy_id]), agent_policy
+            )
+
+    return ret
+
+
+def bulk_approve_updates(agents: "Sequence[Agent]", chunk_size: int = 1000) -> int:
+    """
+    Approves the updates of the severities each agent's patch policy approves
+    with one update per distinct set of severities. Returns the number of
+    approved updates.
+    """
+    from winupdate.models import WinUpdate
+
+    groups: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+    for agent_pk, patch_policy in get_patch_policies(agents).items():
+        if severities := approved_severities(patch_policy):
+            groups[severities].append(agent_pk)
+
+    approved = 0
+    for severities, agent_ids in groups.items():
+        for i in range(0, len(agent_ids), chunk_size):
+            approved += (
+                WinUpdate.objects.filter(
+                    agent_id__in=agent_ids[i : i + chunk_size],
+                    severity__in=severities,
+                    installed=False,
+                )
+                .exclude(action="approve")
+                .update(action="approve")
+            )
+
+    return approved
+
+
+def patch_window_open(patch_policy: "WinUpdatePolicy", now: dt.datetime) -> bool:
+    """
+    Returns whether updates should be installed at now, in the agent's timezone,
+    according to the schedule of the patch policy.
+    """
+    # nothing to install unless some updates are approved automatically
+    if not approved_severities(patch_policy):
+        return False
+
+    if patch_policy.run_time_frequency == "daily":
+        return (
+            now.weekday() in (patch_policy.run_time_days or [])
+            and patch_policy.run_time_hour == now.hour
+        )
+
+    if patch_policy.run_time_frequency == "monthly":
+        run_time_day = patch_policy.run_time_day
+        # run on the last day of months that are too short
+        if run_time_day > 28:
+            if now.month == 2:
+                run_time_day = 28
+            elif now.month in (3, 6, 9, 11):
+                run_time_day = 30
+
+        return now.day == run_time_day and patch_policy.run_time_hour == now.hour
+
+    return False
+
+
+def _window_key(patch_policy: "WinUpdatePolicy") -> Tuple:
+    # the patch policy fields patch_window_open depends on
+    return (
+        approved_severities(patch_policy),
+        patch_policy.run_time_frequency,
+        patch_policy.run_time_hour,
+        tuple(patch_policy.run_time_days or ()),
+        patch_policy.run_time_day,
+    )
+
+
+def agents_in_patch_window(
+    agents: "Sequence[Agent]", now: Optional[dt.datetime] = None
+) -> "List[Agent]":
+    """
+    Returns the agents whose patch window is open now and that haven't installed
+    patches yet today in their timezone. Windows are evaluated once per distinct
+    schedule and timezone instead of per agent.
+    """
+    from zoneinfo import ZoneInfo
+
+    now = now or dt.datetime.now(dt.timezone.utc)
+    policies = get_patch_policies(agents)
+    default_tz = get_core_settings().default_time_zone
+
+    local_now: Dict[str, dt.datetime] = {}
+    windows: Dict[Tuple, bool] = {}
+    ret = []
+    for agent in agents:
+        tz = agent.time_zone or default_tz
+        if tz not in local_now:
+            local_now[tz] = now.astimezone(ZoneInfo(tz))
+
+        key = (_window_key(policies[agent.pk]), tz)
+        if key not in windows:
+            windows[key] = patch_window_open(policies[agent.pk], local_now[tz])
+
+        if not windows[key]:
+            continue
+
+        # patches were already installed for this cycle
+        if (
+            agent.patches_last_installed
+            and agent.patches_last_installed.astimezone(local_now[tz].tzinfo).date()
+            == local_now[tz].date()
+        ):
+            continue
+
+        ret.append(agent)
+
+    return ret
+
+
+def get_approved_update_guids(agent_ids: Iterable[int]) -> Dict[int, List[str]]:
+    # Agent.get_approved_update_guids for many agents in one query
+    from winupdate.models import WinUpdate
+
+    guids: Dict[int, List[str]] = defaultdict(list)
+    for agent_id, guid in WinUpdate.objects.filter(
+        agent_id__in=list(agent_ids), action="approve", installed=False
+    ).values_list("agent_id", "guid"):
+        guids[agent_id].append(guid)
+
+    return guids
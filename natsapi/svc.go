@@ -125,7 +125,7 @@ func Svc(logger *logrus.Logger, cfg string) {
 						return
 					}
 					stmt := `
-					UPDATE agents_agent SET disks=$1 WHERE agents_agent.agent_id=$2;`
+					UPDATE agents_agent SET disks=$1 WHERE agents_agent.agent_id=$2 AND disks IS DISTINCT FROM $1;`
 
 					_, err = db.Exec(stmt, b, r.Agentid)
 					if err != nil {
@@ -146,7 +146,7 @@ func Svc(logger *logrus.Logger, cfg string) {
 					}
 
 					stmt := `
-					UPDATE agents_agent SET services=$1 WHERE agents_agent.agent_id=$2;`
+					UPDATE agents_agent SET services=$1 WHERE agents_agent.agent_id=$2 AND services IS DISTINCT FROM $1;`
 
 					_, err = db.Exec(stmt, b, r.Agentid)
 					if err != nil {
@@ -166,7 +166,7 @@ func Svc(logger *logrus.Logger, cfg string) {
 						return
 					}
 					stmt := `
-					UPDATE agents_agent SET wmi_detail=$1 WHERE agents_agent.agent_id=$2;`
+					UPDATE agents_agent SET wmi_detail=$1 WHERE agents_agent.agent_id=$2 AND wmi_detail IS DISTINCT FROM $1;`
 
 					_, err = db.Exec(stmt, b, r.Agentid)
 					if err != nil {